@@ -0,0 +1,239 @@
+"""
+animation.py
+Plantillas animadas (GIF / WebP / APNG): las capas estáticas se renderizan
+una sola vez y en cada cuadro solo se componen los elementos que se mueven.
+"""
+
+import math
+import time
+from PIL import Image, ImageDraw, ImageChops
+from src.config import DEFAULT_BG_COLOR, TITLE_COLOR, TITLE_STYLES
+from src.composer import (
+    slot_boxes, prepare_slot_image, prepare_emoji_image, emoji_font, emoji_glyph,
+    title_layout, prepare_logo
+)
+from src.utils import apply_cover_background, draw_text_with_style, paste_with_shadow
+
+
+ANIMATION_FORMATS = {".gif": "GIF", ".webp": "WEBP", ".png": "PNG", ".apng": "PNG"}
+
+# Momentos de la animación, como fracción de la duración total
+TITLE_SLIDE = (0.0, 0.20)       # El título baja desde arriba
+SLOT_START = 0.12               # Primer slot en aparecer
+SLOT_STAGGER = 0.12             # Retraso entre slots
+SLOT_POP = 0.18                 # Duración del "pop" de cada slot
+EMOJI_BOUNCE = 0.25             # Duración del rebote de cada emoji
+
+
+def _extract_sprite(size, draw_fn):
+    """
+    Convierte operaciones de dibujo en un sprite RGBA.
+
+    Dibuja sobre un lienzo negro y otro blanco: la diferencia entre ambos es la
+    transparencia y el lienzo negro es el color premultiplicado. Así el sprite,
+    pegado con su alfa, da el mismo resultado que dibujar directamente.
+    """
+    black = Image.new("RGB", size, (0, 0, 0))
+    white = Image.new("RGB", size, (255, 255, 255))
+    draw_fn(black)
+    draw_fn(white)
+    alpha = ImageChops.invert(ImageChops.subtract(white, black).convert("L"))
+    sprite = Image.merge("RGBa", (*black.split(), alpha)).convert("RGBA")
+    return sprite, alpha.getbbox()
+
+
+def _ease_out(p):
+    return 1 - (1 - p) ** 3
+
+
+def _ease_out_back(p, overshoot=1.7):
+    p -= 1
+    return 1 + (overshoot + 1) * p ** 3 + overshoot * p ** 2
+
+
+def _progress(t, start, duration):
+    return min(1.0, max(0.0, (t - start) / duration))
+
+
+def build_animation_layers(
+    final_size, fondo_img, slots_imgs, emojis_imgs_or_texts, title_text, logo_img,
+    font_family='arial_bold', title_style='simple', image_shape='rounded',
+    logo_size=0.2, logo_x=0.5, logo_y=0.5,
+    emoji_size=0.45, emoji_x_offset=0, emoji_y_offset=0, num_slots=3
+):
+    """
+    Prepara las capas de la animación (mismos argumentos que compose_template).
+
+    El fondo queda en una base estática; título, slots (con su sombra) y emojis
+    se convierten en sprites con su posición final.
+    """
+    W, H = final_size
+    base = Image.new("RGBA", (W, H), DEFAULT_BG_COLOR)
+    if fondo_img:
+        base = apply_cover_background(base, fondo_img)
+    layers = {"base": base, "title": None, "slots": [], "emojis": [], "logo": None}
+
+    # Título
+    if title_text.strip():
+        font_title, title_pos, title_text = title_layout(final_size, title_text, font_family)
+        style = TITLE_STYLES.get(title_style, TITLE_STYLES['simple'])
+
+        def draw_title(canvas):
+            draw_text_with_style(ImageDraw.Draw(canvas), title_text, title_pos,
+                                 font_title, TITLE_COLOR, style, W, H)
+
+        sprite, bbox = _extract_sprite((W, H), draw_title)
+        if bbox:
+            layers["title"] = (sprite.crop(bbox), bbox[:2])
+
+    # Slots con su sombra
+    boxes = slot_boxes(final_size, num_slots)
+    for i, (x, y, size_img) in enumerate(boxes):
+        img_data = slots_imgs[i] if i < len(slots_imgs) else None
+        img = prepare_slot_image(img_data, image_shape, size_img)
+        # La sombra de paste_with_shadow sobresale 5 px a la izquierda y 55 px abajo
+        origin = (x - 5, y)
+        sprite, _ = _extract_sprite(
+            (size_img + 40, size_img + 55),
+            lambda canvas, img=img: paste_with_shadow(canvas, img, (5, 0))
+        )
+        center = (x + size_img / 2, y + size_img / 2)
+        layers["slots"].append({"sprite": sprite, "origin": origin, "center": center})
+
+    # Emojis
+    font_emoji = emoji_font(final_size, emoji_size)
+    for i, (x_img, y_img, size_img) in enumerate(boxes):
+        emoji_data = emojis_imgs_or_texts[i] if i < len(emojis_imgs_or_texts) else None
+        if isinstance(emoji_data, Image.Image):
+            em = prepare_emoji_image(emoji_data, size_img, emoji_size)
+            pos = (x_img + int(emoji_x_offset), y_img + size_img - em.height + int(emoji_y_offset))
+            layers["emojis"].append((em, pos, size_img))
+        elif emoji_data is not None and str(emoji_data).strip():
+            txt = str(emoji_data)
+            glyph = emoji_glyph(txt, font_emoji.size)
+            if glyph is not None:
+                pos = (x_img + int(emoji_x_offset), y_img + size_img - font_emoji.size + int(emoji_y_offset))
+                layers["emojis"].append((glyph, pos, size_img))
+                continue
+            bbox = font_emoji.getbbox(txt)
+            pos = (x_img + int(emoji_x_offset), y_img + size_img - (bbox[3] - bbox[1]) + int(emoji_y_offset))
+
+            def draw_emoji(canvas, txt=txt):
+                draw = ImageDraw.Draw(canvas)
+                draw.text((2, 2), txt, fill=(0, 0, 0, 180), font=font_emoji)
+                draw.text((0, 0), txt, fill=(255, 255, 255), font=font_emoji)
+
+            sprite, _ = _extract_sprite((bbox[2] + 3, bbox[3] + 3), draw_emoji)
+            layers["emojis"].append((sprite, pos, size_img))
+        else:
+            layers["emojis"].append(None)
+
+    # Logo (estático, siempre encima)
+    logo, logo_pos = prepare_logo(logo_img, final_size, logo_size, logo_x, logo_y)
+    if logo:
+        layers["logo"] = (logo, logo_pos)
+
+    return layers
+
+
+def _scaled_slot(slot, scale, cache):
+    """Sprite del slot escalado alrededor de su centro (cacheado por escala)."""
+    key = (id(slot), round(scale, 2))
+    if key not in cache:
+        sprite = slot["sprite"]
+        w = max(1, int(sprite.width * key[1]))
+        h = max(1, int(sprite.height * key[1]))
+        cache[key] = sprite.resize((w, h), Image.BILINEAR)
+    scaled = cache[key]
+    cx, cy = slot["center"]
+    ox, oy = slot["origin"]
+    # El centro de la imagen dentro del sprite se mantiene fijo al escalar
+    x = int(cx - (cx - ox) * key[1])
+    y = int(cy - (cy - oy) * key[1])
+    return scaled, (x, y)
+
+
+def render_frame(layers, t, cache=None):
+    """Compone el cuadro en el instante t (0 a 1) a partir de las capas."""
+    cache = {} if cache is None else cache
+    frame = layers["base"].copy()
+
+    if layers["title"]:
+        sprite, (x, y) = layers["title"]
+        p = _ease_out(_progress(t, *TITLE_SLIDE))
+        dy = int((1 - p) * (y + sprite.height))
+        frame.paste(sprite, (x, y - dy), sprite)
+
+    slot_ends = []
+    for i, slot in enumerate(layers["slots"]):
+        start = SLOT_START + i * SLOT_STAGGER
+        p = _progress(t, start, SLOT_POP)
+        slot_ends.append(start + SLOT_POP)
+        if p <= 0:
+            continue
+        if p >= 1:
+            frame.paste(slot["sprite"], slot["origin"], slot["sprite"])
+        else:
+            sprite, pos = _scaled_slot(slot, _ease_out_back(p), cache)
+            frame.paste(sprite, pos, sprite)
+
+    for emoji, end in zip(layers["emojis"], slot_ends):
+        if emoji is None or t < end:
+            continue
+        sprite, (x, y), size_img = emoji
+        q = _progress(t, end, EMOJI_BOUNCE)
+        dy = int(size_img * 0.15 * abs(math.sin(q * 2 * math.pi)) * (1 - q))
+        frame.paste(sprite, (x, y - dy), sprite)
+
+    if layers["logo"]:
+        logo, pos = layers["logo"]
+        frame.paste(logo, pos, logo)
+
+    return frame.convert("RGB")
+
+
+def render_animation(*args, frames=40, budget_ms=None, **kwargs):
+    """
+    Renderiza todos los cuadros de una plantilla animada.
+
+    Recibe los mismos argumentos que compose_template, más el número de
+    cuadros y un presupuesto opcional de milisegundos por cuadro.
+    Devuelve (lista de cuadros, estadísticas de tiempo).
+    """
+    start = time.perf_counter()
+    layers = build_animation_layers(*args, **kwargs)
+    setup_ms = (time.perf_counter() - start) * 1000
+
+    cache = {}
+    images = []
+    frame_times = []
+    for i in range(frames):
+        t0 = time.perf_counter()
+        images.append(render_frame(layers, i / max(1, frames - 1), cache))
+        frame_times.append((time.perf_counter() - t0) * 1000)
+
+    stats = {
+        "setup_ms": setup_ms,
+        "frame_ms_avg": sum(frame_times) / len(frame_times) if frame_times else 0.0,
+        "frame_ms_max": max(frame_times, default=0.0),
+        "over_budget": sum(1 for ms in frame_times if budget_ms and ms > budget_ms),
+    }
+    return images, stats
+
+
+def save_animation(images, path, frame_ms=40, hold_ms=1500, loop=0):
+    """Guarda los cuadros como GIF, WebP o APNG según la extensión del archivo."""
+    ext = path[path.rfind("."):].lower() if "." in path else ""
+    fmt = ANIMATION_FORMATS.get(ext)
+    if fmt is None:
+        raise ValueError("Formato no soportado: usa .gif, .webp o .png (APNG).")
+
+    # El último cuadro se mantiene más tiempo en pantalla
+    durations = [frame_ms] * (len(images) - 1) + [hold_ms]
+    options = {"save_all": True, "append_images": images[1:], "duration": durations, "loop": loop}
+    if fmt == "WEBP":
+        options.update(quality=90, method=4)
+    elif fmt == "GIF":
+        options.update(optimize=False, disposal=1)
+    images[0].save(path, fmt, **options)
+    return path
@@ -0,0 +1,77 @@
+"""
+archive.py
+Salida de lotes directamente a un archivo ZIP o TAR, sin archivos temporales
+"""
+
+import io
+import json
+import time
+import tarfile
+import zipfile
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+def is_archive_path(path):
+    return str(path).lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+class ArchiveWriter:
+    """
+    Escribe las plantillas de un lote una a una dentro de un ZIP o TAR.
+
+    En ZIP cada imagen se codifica directamente dentro del archivo (los PNG ya
+    están comprimidos, así que se guardan sin recomprimir). En TAR se necesita
+    el tamaño antes de los datos, por lo que cada imagen pasa por un búfer en
+    memoria del tamaño de una sola imagen. En ambos casos la memoria usada no
+    depende de la cantidad de grupos.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        lower = path.lower()
+        if lower.endswith(".zip"):
+            self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+            self._tar = None
+        elif lower.endswith(ARCHIVE_EXTENSIONS):
+            mode = "w|gz" if lower.endswith((".tar.gz", ".tgz")) else "w|"
+            self._tar = tarfile.open(path, mode)
+            self._zip = None
+        else:
+            raise ValueError(f"Formato de archivo no soportado: usa {', '.join(ARCHIVE_EXTENSIONS)}")
+
+    def add_image(self, name, image, format="PNG", **save_options):
+        """Codifica una imagen y la añade al archivo con el nombre dado. Devuelve los bytes escritos."""
+        if self._zip is not None:
+            with self._zip.open(name, "w", force_zip64=True) as stream:
+                image.save(stream, format=format, **save_options)
+            return self._zip.getinfo(name).compress_size
+        buffer = io.BytesIO()
+        image.save(buffer, format=format, **save_options)
+        self.add_bytes(name, buffer.getvalue())
+        return buffer.tell()
+
+    def add_bytes(self, name, data):
+        """Añade un archivo con el contenido dado."""
+        if self._zip is not None:
+            self._zip.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._tar.addfile(info, io.BytesIO(data))
+
+    def add_json(self, name, data):
+        self.add_bytes(name, json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"))
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        if self._tar is not None:
+            self._tar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,233 @@
+"""
+batch.py
+Motor de procesamiento por lotes, independiente de la interfaz gráfica
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+from src.config import (
+    FINAL_SIZE, SETTINGS_FILE, GROUP_SETTING_KEYS, DEFAULT_SETTINGS, METRICS_JSON_NAME, METRICS_PROM_NAME
+)
+from src.renderer import Renderer, GroupSpec
+from src.batch_plan import plan_batch
+from src.manifest import BatchManifest, ARCHIVE_MANIFEST_NAME, shared_fingerprint
+from src.archive import ArchiveWriter
+from src.scheduler import completed
+from src.metrics import METRICS, run_report, write_text_atomic
+from src.utils import open_image, open_asset, load_emoji_pack
+
+
+def load_settings(path=SETTINGS_FILE):
+    """Lee el archivo de configuración de la GUI y completa los valores faltantes."""
+    settings = dict(DEFAULT_SETTINGS)
+    if path and os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                settings.update(json.load(f))
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error cargando configuración, se usará la default: {e}")
+    return settings
+
+
+def make_group(paths, settings):
+    """Crea un grupo de lote con las rutas dadas y la configuración indicada."""
+    group = {"count": len(paths), "paths": list(paths)}
+    for key in GROUP_SETTING_KEYS:
+        group[key] = settings.get(key, DEFAULT_SETTINGS[key])
+    return group
+
+
+def _open_optional(path):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return open_asset(path)
+    except Exception as e:
+        print(f"Error al cargar {path}: {e}")
+        return None
+
+
+def load_batch_assets(settings):
+    """Carga fondo, logo y paquete de emojis compartidos por todos los grupos."""
+    return {
+        "bg_img": _open_optional(settings.get("bg_img_path")),
+        "logo_img": _open_optional(settings.get("logo_img_path")),
+        "emojis": load_emoji_pack(settings.get("emoji_pack", "default")),
+    }
+
+
+def load_group_images(group, lazy=False):
+    """Carga las imágenes de un grupo. Las que fallan quedan como None."""
+    images = [None] * group["count"]
+    for slot_idx in range(group["count"]):
+        try:
+            images[slot_idx] = open_image(group["paths"][slot_idx], lazy=lazy)
+        except Exception as e:
+            print(f"Error al cargar imagen del lote {group['paths'][slot_idx]}: {e}")
+    return images
+
+
+def render_group(group, assets, defaults=None, final_size=FINAL_SIZE, keep=(), parallel=True):
+    """
+    Renderiza un grupo del lote.
+
+    Args:
+        group: Diccionario del grupo (count, paths y configuración)
+        assets: Renderer compartido, o diccionario con bg_img, logo_img y emojis
+        defaults: Configuración a usar para las claves que falten en el grupo
+        final_size: Tamaño de la imagen generada
+        keep: Rutas que se vuelven a usar en grupos siguientes (se conservan decodificadas)
+        parallel: Preparar las capas en el pool de hilos compartido
+    """
+    renderer = assets if isinstance(assets, Renderer) else Renderer.from_assets(assets)
+    # Mejor fallar que renderizar un grupo incompleto (ValueError si falta alguna imagen)
+    return renderer.render_group(GroupSpec.from_group(group, defaults, final_size),
+                                 parallel=parallel, keep=keep)
+
+
+def save_atomic(image, path):
+    """
+    Guarda un PNG en un archivo temporal y lo renombra: nunca quedan archivos a medias.
+    Devuelve los bytes escritos.
+    """
+    # Nombre temporal único: dos workers (o máquinas) pueden guardar el mismo grupo a la vez
+    tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        image.save(tmp_path, format="PNG")
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return os.path.getsize(path)
+
+
+def save_run_metrics(output_dir, report, metrics):
+    """Escribe el informe JSON y el archivo Prometheus de un lote en output_dir."""
+    try:
+        write_text_atomic(os.path.join(output_dir, METRICS_JSON_NAME),
+                          json.dumps(report, indent=2, ensure_ascii=False))
+        write_text_atomic(os.path.join(output_dir, METRICS_PROM_NAME), metrics.to_prometheus())
+    except OSError as e:
+        print(f"No se pudieron guardar las métricas del lote: {e}")
+
+
+def run_batch(groups, assets, output_dir=None, defaults=None, skip=(), on_progress=None,
+              resume=False, archive_path=None, reorder=True, on_plan=None, final_size=FINAL_SIZE,
+              scheduler=None):
+    """
+    Renderiza todos los grupos del lote en output_dir o en un archivo ZIP/TAR.
+
+    El progreso se registra en un manifiesto dentro de output_dir. Con
+    resume=True se reanuda el lote anterior: los grupos ya generados (sin
+    cambios en su configuración, sus imágenes ni el fondo, el logo o los
+    emojis del lote) se saltan y los nombres de archivo se mantienen. Con
+    archive_path las imágenes se escriben directamente en el archivo y el
+    manifiesto se guarda dentro de él al terminar.
+
+    Al terminar se escribe el informe de métricas del lote (duración,
+    grupos por segundo, etapas, cachés, bytes; ver metrics.py) en JSON y en
+    formato Prometheus, junto al manifiesto.
+
+    Los grupos se renderizan en el orden que más reutiliza las cachés (ver
+    batch_plan.py); los nombres de salida y las listas devueltas siguen el
+    orden del lote.
+
+    Args:
+        groups: Lista de grupos
+        assets: Renderer, o diccionario con bg_img, logo_img y emojis
+        output_dir: Carpeta de destino
+        defaults: Configuración para las claves que falten en los grupos
+        skip: Índices de grupos que no se deben renderizar (p. ej. los que
+            fallaron la verificación previa)
+        on_progress: Callback opcional on_progress(hechos, total)
+        resume: Reanudar el lote registrado en output_dir
+        archive_path: Ruta .zip, .tar o .tar.gz de salida (en lugar de output_dir)
+        reorder: False renderiza en el orden de la lista
+        on_plan: Callback opcional on_plan(plan) con el orden y el ahorro estimado
+        final_size: Tamaño de las imágenes generadas
+        scheduler: RenderScheduler opcional: los grupos se renderizan en sus
+            hilos con prioridad de lote (ceden los núcleos a la vista previa)
+
+    Returns:
+        (rutas o nombres generados, lista de (índice, error) de los grupos fallidos)
+    """
+    if archive_path:
+        manifest = BatchManifest.create(len(groups))
+        archive = ArchiveWriter(archive_path)
+    else:
+        manifest = BatchManifest.open(output_dir, len(groups), resume=resume)
+        archive = None
+    manifest.shared = shared_fingerprint(defaults, final_size)
+    generated, failed = {}, {}
+    started, metrics_before = time.time(), METRICS.snapshot()
+    # Un solo Renderer para todo el lote: fondo, logo y emojis se escalan una vez
+    renderer = assets if isinstance(assets, Renderer) else Renderer.from_assets(assets)
+
+    try:
+        for i in sorted(skip):
+            failed[i] = "Omitido por la verificación previa"
+            manifest.record(i, "skipped", groups[i], error=failed[i])
+            METRICS.inc("batch_groups_total", status="skipped")
+        if archive is None:
+            for i, group in enumerate(groups):
+                if i not in skip and manifest.is_done(i, group, output_dir):
+                    generated[i] = os.path.join(output_dir, manifest.output_name(i))
+
+        plan = plan_batch(groups, defaults, exclude=set(failed) | set(generated), reorder=reorder)
+        if on_plan:
+            on_plan(plan)
+
+        def render(i):
+            return render_group(groups[i], renderer, defaults, final_size, keep=plan["keep"].get(i, ()),
+                                parallel=scheduler is None)
+
+        pending = [i for i in plan["order"] if i not in failed and i not in generated]
+        skipped = len(plan["order"]) - len(pending)
+        if on_progress:
+            for done in range(1, skipped + 1):
+                on_progress(done, len(groups))
+        # Con planificador, los grupos siguientes se renderizan mientras se guarda el actual
+        renders = (scheduler.map("batch", render, pending) if scheduler is not None
+                   else ((i, completed(render, i)) for i in pending))
+
+        for done, (i, future) in enumerate(renders, skipped + 1):
+            group = groups[i]
+            name = manifest.output_name(i)
+            try:
+                image = future.result()
+                with METRICS.timer("stage_seconds", stage="encode"):
+                    if archive is not None:
+                        written = archive.add_image(name, image)
+                        generated[i] = name
+                    else:
+                        written = save_atomic(image, os.path.join(output_dir, name))
+                        generated[i] = os.path.join(output_dir, name)
+                METRICS.inc("output_bytes_written_total", written)
+                METRICS.inc("batch_groups_total", status="done")
+                manifest.record(i, "done", group, output=name)
+            except Exception as e:
+                print(f"Error en el grupo {i+1} del lote: {e}")
+                failed[i] = str(e)
+                manifest.record(i, "failed", group, error=str(e))
+                METRICS.inc("batch_groups_total", status="failed")
+            if on_progress:
+                on_progress(done, len(groups))
+    finally:
+        manifest.close()
+        metrics = METRICS.delta(metrics_before)
+        report = run_report(metrics, started, time.time() - started, manifest.summary(), manifest.run_id)
+        if archive is not None:
+            archive.add_json(ARCHIVE_MANIFEST_NAME, manifest.to_dict())
+            archive.add_json(METRICS_JSON_NAME, report)
+            archive.add_bytes(METRICS_PROM_NAME, metrics.to_prometheus().encode("utf-8"))
+            archive.close()
+        else:
+            save_run_metrics(output_dir, report, metrics)
+
+    return [generated[i] for i in sorted(generated)], sorted(failed.items())
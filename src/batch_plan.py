@@ -0,0 +1,183 @@
+"""
+batch_plan.py
+Orden de render de un lote pensado para reutilizar cachés: los grupos que
+comparten imágenes o título se renderizan seguidos, así cada imagen se
+decodifica una vez mientras siga haciendo falta y la sombra difuminada de
+cada título se calcula una sola vez.
+
+El orden solo cambia cuándo se renderiza cada grupo: los nombres de los
+archivos de salida siguen dependiendo del índice del grupo en el lote.
+"""
+
+from collections import OrderedDict, defaultdict, deque
+from src.config import (
+    DEFAULT_SETTINGS, TITLE_STYLES, RENDER_SOURCE_CACHE, RENDER_TITLE_CACHE, BATCH_PLAN_WINDOW
+)
+from src.utils import has_blurred_shadow
+
+
+def _group_paths(group):
+    return tuple(group["paths"][:group["count"]])
+
+
+def _title_key(group, defaults):
+    def value(key):
+        return group.get(key, defaults.get(key, DEFAULT_SETTINGS[key]))
+    return (value("title_text"), value("font_family"), value("title_style"))
+
+
+def reuse_order(paths, titles, candidates, window=BATCH_PLAN_WINDOW):
+    """
+    Orden voraz: después de cada grupo va el pendiente que comparte más
+    imágenes con él (y, a igualdad, el mismo título); si ninguno comparte
+    imágenes, el siguiente con el mismo título; si no, el primero pendiente.
+    Los empates se resuelven por índice, así el orden es determinista.
+
+    Solo se puntúan los 'window' primeros grupos pendientes de cada imagen
+    del grupo actual y de su título: con miles de grupos que comparten una
+    imagen o un título, cada paso sigue costando lo mismo.
+    """
+    by_path = defaultdict(deque)
+    by_title = defaultdict(deque)
+    for i in candidates:
+        for p in set(paths[i]):
+            by_path[p].append(i)
+        by_title[titles[i]].append(i)
+
+    pending = set(candidates)
+    placed = defaultdict(int)       # Grupos ya colocados que siguen en cada cola de by_path/by_title
+    remaining = iter(sorted(candidates))
+    order = []
+    current = None
+    while pending:
+        nxt = None
+        if current is not None:
+            shared = set(paths[current])
+            same_title = _window(by_title[titles[current]], pending, window)
+            scores = {}
+            for p in shared:
+                for j in _window(by_path[p], pending, window):
+                    scores[j] = 2 * len(shared.intersection(paths[j])) + (titles[j] == titles[current])
+            for j in same_title:
+                if j not in scores:
+                    scores[j] = 2 * len(shared.intersection(paths[j])) + 1
+            if any(score > 1 for score in scores.values()):
+                nxt = min(scores, key=lambda j: (-scores[j], j))
+            else:
+                nxt = same_title[0] if same_title else None
+        if nxt is None:
+            nxt = next(j for j in remaining if j in pending)
+        pending.discard(nxt)
+        order.append(nxt)
+        current = nxt
+        # Cada cola se compacta cuando la mitad ya está colocada: coste amortizado constante
+        for queues, key in [(by_path, p) for p in set(paths[nxt])] + [(by_title, titles[nxt])]:
+            placed[id(queues), key] += 1
+            if placed[id(queues), key] * 2 > len(queues[key]):
+                queues[key] = deque(j for j in queues[key] if j in pending)
+                placed[id(queues), key] = 0
+    return order
+
+
+def _window(queue, pending, window):
+    """Los primeros 'window' pendientes de la cola (se miran como mucho 4 * window entradas)."""
+    while queue and queue[0] not in pending:
+        queue.popleft()
+    found = []
+    for seen, j in enumerate(queue):
+        if len(found) >= window or seen >= 4 * window:
+            break
+        if j in pending:
+            found.append(j)
+    return found
+
+
+def simulate_reuse(order, paths, titles, blurred,
+                   source_slots=RENDER_SOURCE_CACHE, title_slots=RENDER_TITLE_CACHE):
+    """
+    Cuenta decodificaciones de imágenes y sombras de título que costaría
+    renderizar en 'order' con las cachés del Renderer (ver Renderer.render_group).
+
+    Devuelve (decodificaciones, sombras de título, keep), donde keep[k] son
+    las rutas del k-ésimo grupo que vuelven a usarse más adelante.
+    """
+    last_use = {}
+    for pos, i in enumerate(order):
+        for p in paths[i]:
+            last_use[p] = pos
+
+    sources, title_cache = OrderedDict(), OrderedDict()
+    decodes = rasters = 0
+    keep = []
+    for pos, i in enumerate(order):
+        keep.append({p for p in paths[i] if last_use[p] > pos})
+        for p in paths[i]:
+            if p in sources:
+                sources.move_to_end(p)
+                continue
+            decodes += 1
+            if p in keep[-1]:
+                sources[p] = True
+                if len(sources) > source_slots:
+                    sources.popitem(last=False)
+        if blurred[i]:
+            if titles[i] in title_cache:
+                title_cache.move_to_end(titles[i])
+            else:
+                rasters += 1
+                title_cache[titles[i]] = True
+                if len(title_cache) > title_slots:
+                    title_cache.popitem(last=False)
+    return decodes, rasters, keep
+
+
+def plan_batch(groups, defaults=None, exclude=(), reorder=True):
+    """
+    Planifica el orden de render de un lote.
+
+    Args:
+        groups: Lista de grupos
+        defaults: Configuración para las claves que falten en los grupos
+        exclude: Índices que no se van a renderizar (van al principio, sin contar)
+        reorder: False mantiene el orden de la lista (solo calcula el informe)
+
+    Returns:
+        Diccionario con order (índices en orden de render), keep (índice ->
+        rutas a conservar decodificadas) y las cuentas del orden de la lista
+        y del orden planificado.
+    """
+    defaults = defaults or DEFAULT_SETTINGS
+    paths = [_group_paths(g) for g in groups]
+    titles = [_title_key(g, defaults) for g in groups]
+    blurred = [bool(t[0].strip()) and has_blurred_shadow(TITLE_STYLES.get(t[2], TITLE_STYLES['simple']))
+               for t in titles]
+
+    exclude = set(exclude)
+    excluded = sorted(exclude)
+    candidates = [i for i in range(len(groups)) if i not in exclude]
+    planned = reuse_order(paths, titles, candidates) if reorder else candidates
+
+    list_decodes, list_rasters, _ = simulate_reuse(candidates, paths, titles, blurred)
+    decodes, rasters, keep = simulate_reuse(planned, paths, titles, blurred)
+    return {
+        "order": excluded + planned,
+        "keep": dict(zip(planned, keep)),
+        "reordered": planned != candidates,
+        "loads": sum(len(paths[i]) for i in candidates),
+        "list_decodes": list_decodes,
+        "decodes": decodes,
+        "list_title_rasters": list_rasters,
+        "title_rasters": rasters,
+    }
+
+
+def format_plan(plan):
+    """Informe legible del ahorro del orden planificado."""
+    lines = [f"Orden de render: {'optimizado para reutilizar cachés' if plan['reordered'] else 'el de la lista'}"]
+    lines.append(f"  Imágenes decodificadas: {plan['decodes']} de {plan['loads']} usos "
+                 f"(en el orden de la lista: {plan['list_decodes']}, "
+                 f"ahorro: {plan['list_decodes'] - plan['decodes']})")
+    lines.append(f"  Sombras de título: {plan['title_rasters']} "
+                 f"(en el orden de la lista: {plan['list_title_rasters']}, "
+                 f"ahorro: {plan['list_title_rasters'] - plan['title_rasters']})")
+    return "\n".join(lines)
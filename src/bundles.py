@@ -0,0 +1,179 @@
+"""
+bundles.py
+Paquetes de recursos precompilados: los PNG de un paquete de emojis, el fondo
+o el logo se guardan ya decodificados (RGBA sin comprimir) en un único
+archivo con un índice. Al cargarlo se mapea en memoria y cada imagen se crea
+directamente sobre el archivo, sin descomprimir nada: arrancar es inmediato
+y todos los procesos que lo usan comparten las mismas páginas de memoria.
+
+Formato del archivo (.pfb):
+    b"PFB1" + longitud del índice (8 bytes) + índice JSON
+    datos RGBA de cada imagen, alineados a BUNDLE_ALIGN bytes
+
+El índice guarda la huella (fecha y tamaño) de cada PNG de origen: si alguno
+cambia, el paquete deja de usarse hasta volver a compilarlo.
+"""
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+from PIL import Image
+from src.config import BUNDLES_DIR, EMOJIS_DIR
+from src.disk_cache import file_stamp, tag_source
+
+BUNDLE_MAGIC = b"PFB1"
+BUNDLE_ALIGN = 4096             # Cada imagen empieza en una página nueva
+BUNDLE_SUFFIX = ".pfb"
+
+
+def emoji_pack_sources(pack_name):
+    """PNG de un paquete de emojis, en el orden en que se usan."""
+    pack_dir = os.path.join(EMOJIS_DIR, pack_name)
+    if not os.path.isdir(pack_dir):
+        return []
+    return [os.path.join(pack_dir, f) for f in sorted(os.listdir(pack_dir)) if f.endswith(".png")]
+
+
+def emoji_bundle_path(pack_name):
+    return os.path.join(BUNDLES_DIR, f"emojis-{pack_name}{BUNDLE_SUFFIX}")
+
+
+def asset_bundle_path(path):
+    """Paquete de un recurso suelto (fondo o logo), identificado por su ruta."""
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:10]
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(BUNDLES_DIR, f"{name}-{digest}{BUNDLE_SUFFIX}")
+
+
+def _align(offset):
+    return (offset + BUNDLE_ALIGN - 1) // BUNDLE_ALIGN * BUNDLE_ALIGN
+
+
+def compile_bundle(paths, bundle_path):
+    """
+    Decodifica las imágenes dadas y las guarda en un paquete.
+    Devuelve el tamaño del paquete en bytes.
+    """
+    entries, images = [], []
+    for path in paths:
+        with Image.open(path) as im:
+            image = im.convert("RGBA")
+        entries.append({"name": os.path.basename(path), "stamp": file_stamp(path),
+                        "size": list(image.size)})
+        images.append(image)
+
+    # Los desplazamientos dependen de la longitud del índice: se recalculan
+    # hasta que el índice deja de cambiar
+    index = {"version": 1, "images": entries}
+    header = b""
+    while True:
+        offset = _align(len(BUNDLE_MAGIC) + 8 + len(header))
+        for entry, image in zip(entries, images):
+            entry["offset"] = offset
+            offset = _align(offset + image.width * image.height * 4)
+        new_header = json.dumps(index, ensure_ascii=False).encode("utf-8")
+        if new_header == header:
+            break
+        header = new_header
+
+    os.makedirs(os.path.dirname(bundle_path) or ".", exist_ok=True)
+    tmp_path = f"{bundle_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for entry, image in zip(entries, images):
+            f.seek(entry["offset"])
+            f.write(image.tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, bundle_path)
+    return offset
+
+
+def load_bundle(bundle_path, paths):
+    """
+    Carga un paquete mapeado en memoria si corresponde exactamente a 'paths'.
+
+    Devuelve la lista de imágenes (de solo lectura, marcadas con la huella de
+    su archivo para la caché en disco) o None si el paquete no existe o está
+    desactualizado.
+    """
+    try:
+        with open(bundle_path, "rb") as f:
+            if f.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+                return None
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            index = json.loads(f.read(header_len).decode("utf-8"))
+            entries = index["images"]
+            if len(entries) != len(paths):
+                return None
+            for entry, path in zip(entries, paths):
+                if entry["stamp"] != file_stamp(path):
+                    return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    view = memoryview(data)
+    images = []
+    for entry, path in zip(entries, paths):
+        w, h = entry["size"]
+        start = entry["offset"]
+        image = Image.frombuffer("RGBA", (w, h), view[start:start + w * h * 4], "raw", "RGBA", 0, 1)
+        images.append(tag_source(image, path))
+    return images
+
+
+def compile_emoji_pack(pack_name):
+    """Compila un paquete de emojis. Devuelve (ruta del paquete, imágenes, bytes)."""
+    sources = emoji_pack_sources(pack_name)
+    if not sources:
+        raise ValueError(f"No se encontró el paquete de emojis '{pack_name}'")
+    bundle_path = emoji_bundle_path(pack_name)
+    return bundle_path, len(sources), compile_bundle(sources, bundle_path)
+
+
+def compile_asset(path):
+    """Compila un recurso suelto (fondo o logo). Devuelve (ruta del paquete, 1, bytes)."""
+    bundle_path = asset_bundle_path(path)
+    return bundle_path, 1, compile_bundle([path], bundle_path)
+
+
+def compile_assets(settings, only_stale=False):
+    """
+    Compila el paquete de emojis, el fondo y el logo de una configuración.
+    Con only_stale=True se saltan los paquetes que ya están al día.
+    """
+    jobs = [(emoji_bundle_path(settings.get("emoji_pack", "default")),
+             emoji_pack_sources(settings.get("emoji_pack", "default")),
+             lambda: compile_emoji_pack(settings.get("emoji_pack", "default")))]
+    for key in ("bg_img_path", "logo_img_path"):
+        path = settings.get(key)
+        if path and os.path.exists(path):
+            jobs.append((asset_bundle_path(path), [path], lambda path=path: compile_asset(path)))
+
+    results = []
+    for bundle_path, sources, compile_fn in jobs:
+        if not sources or (only_stale and load_bundle(bundle_path, sources) is not None):
+            continue
+        try:
+            results.append(compile_fn())
+        except (OSError, ValueError) as e:
+            print(f"No se pudo compilar {bundle_path}: {e}")
+    return results
+
+
+def load_emoji_bundle(pack_name):
+    """Emojis de un paquete desde su versión compilada, o None si no está al día."""
+    sources = emoji_pack_sources(pack_name)
+    if not sources:
+        return None
+    return load_bundle(emoji_bundle_path(pack_name), sources)
+
+
+def load_asset_bundle(path):
+    """Fondo o logo desde su versión compilada, o None si no está al día."""
+    images = load_bundle(asset_bundle_path(path), [path])
+    return images[0] if images else None
@@ -0,0 +1,699 @@
+#!/usr/bin/env python3
+"""
+cli.py
+Modo sin interfaz gráfica (headless) del generador de plantillas
+"""
+import sys
+import os
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import argparse
+from src.config import (
+    FINAL_SIZE, SETTINGS_FILE, WATCH_RULES, WATCH_DEFAULT_PATTERN, WATCH_INTERVAL,
+    QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS, TILE_ROWS, VARIANT_WORKERS,
+    TITLE_STYLES, FONT_FILENAMES, IMAGE_SHAPES, SOAK_PREVIEW_RENDERS, SOAK_BATCH_GROUPS,
+    METRICS_JSON_NAME, METRICS_PROM_NAME, PROFILE_MODES, GOLDEN_DIR
+)
+from src.batch import load_settings, load_batch_assets
+
+
+def cmd_watch(args):
+    """Vigila una carpeta y renderiza cada grupo en cuanto está completo."""
+    from src.watcher import HotFolderWatcher, make_watch_handler
+
+    if os.path.abspath(args.folder) == os.path.abspath(args.output):
+        print("La carpeta de salida debe ser distinta de la carpeta vigilada.")
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+
+    settings = load_settings(args.config)
+    assets = load_batch_assets(settings)
+
+    def on_done(output_path, group):
+        print(f"✓ {os.path.basename(output_path)} ({group['count']} imágenes)")
+
+    watcher = HotFolderWatcher(
+        args.folder,
+        make_watch_handler(settings, assets, args.output, on_done),
+        rule=args.rule,
+        group_size=args.size,
+        pattern=args.pattern,
+        interval=args.interval,
+    )
+    print(f"Vigilando '{args.folder}' (regla: {WATCH_RULES[args.rule]}). Ctrl+C para salir.")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+        print(f"\nVigilancia detenida. Imágenes sin grupo completo: {watcher.pending_count()}")
+    return 0
+
+
+def cmd_serve(args):
+    """Arranca el servicio HTTP local de renderizado."""
+    from src.server import RenderServer
+
+    server = RenderServer(args.host, args.port, workers=args.workers, config_path=args.config, quiet=args.quiet)
+    host, port = server.server_address[:2]
+    print(f"Servicio de render en http://{host}:{port} ({server.workers} procesos). Ctrl+C para salir.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nServicio detenido.")
+    finally:
+        server.server_close()
+    return 0
+
+
+def cmd_animate(args):
+    """Renderiza una plantilla animada a partir de 2, 3 o 4 imágenes."""
+    from src.animation import render_animation, save_animation
+    from src.batch import make_group, GROUP_SETTING_KEYS, load_group_images
+
+    settings = load_settings(args.config)
+    assets = load_batch_assets(settings)
+    group = make_group(args.images, settings)
+    if group["count"] not in (2, 3, 4):
+        print("Se necesitan 2, 3 o 4 imágenes.")
+        return 2
+
+    frames, stats = render_animation(
+        tuple(args.size_px), assets["bg_img"], load_group_images(group),
+        assets["emojis"][:group["count"]], group["title_text"], assets["logo_img"],
+        frames=args.frames, budget_ms=args.budget_ms, num_slots=group["count"],
+        **{k: group[k] for k in GROUP_SETTING_KEYS if k != "title_text"}
+    )
+    save_animation(frames, args.output, frame_ms=args.frame_ms)
+    print(f"✓ {args.output}: {len(frames)} cuadros, preparación {stats['setup_ms']:.0f} ms, "
+          f"{stats['frame_ms_avg']:.1f} ms/cuadro (máx. {stats['frame_ms_max']:.1f} ms)")
+    if stats["over_budget"]:
+        print(f"Advertencia: {stats['over_budget']} cuadros superaron {args.budget_ms} ms")
+    return 0
+
+
+def cmd_poster(args):
+    """Renderiza una plantilla de gran formato por franjas, con memoria acotada."""
+    import time
+    from src.tiled import render_tiled
+    from src.batch import make_group, GROUP_SETTING_KEYS, load_group_images
+
+    if not args.output.lower().endswith(".png"):
+        print("El póster se guarda en PNG: usa una ruta .png")
+        return 2
+    settings = load_settings(args.config)
+    assets = load_batch_assets(settings)
+    group = make_group(args.images, settings)
+    if group["count"] not in (2, 3, 4):
+        print("Se necesitan 2, 3 o 4 imágenes.")
+        return 2
+
+    start = time.perf_counter()
+    bands = render_tiled(
+        args.output, tuple(args.size_px), assets["bg_img"], load_group_images(group, lazy=True),
+        assets["emojis"][:group["count"]], group["title_text"], assets["logo_img"],
+        band_rows=args.band_rows, num_slots=group["count"],
+        **{k: group[k] for k in GROUP_SETTING_KEYS if k != "title_text"}
+    )
+    print(f"✓ {args.output}: {args.size_px[0]}x{args.size_px[1]} en {bands} franjas "
+          f"({time.perf_counter() - start:.1f} s)")
+    return 0
+
+
+def cmd_variants(args):
+    """Renderiza un grupo con todas las combinaciones de estilo, forma y fuente."""
+    import time
+    from src.batch import make_group, load_group_images
+    from src.renderer import Renderer, TemplateSpec
+    from src.variants import VARIANT_AXES, run_variants
+
+    settings = load_settings(args.config)
+    group = make_group(args.images, settings)
+    if group["count"] not in (2, 3, 4):
+        print("Se necesitan 2, 3 o 4 imágenes.")
+        return 2
+    axes = {"title_style": args.styles or VARIANT_AXES["title_style"],
+            "image_shape": args.shapes or VARIANT_AXES["image_shape"],
+            "font_family": args.fonts or VARIANT_AXES["font_family"]}
+
+    # Las imágenes se decodifican una sola vez para todas las variantes
+    slots = load_group_images(group)
+    if any(s is None for s in slots):
+        print("No se pudieron cargar todas las imágenes.")
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+
+    def on_progress(done, total):
+        print(f"\r{done}/{total} variantes", end="", flush=True)
+
+    start = time.perf_counter()
+    paths, sheet_path = run_variants(
+        Renderer.from_settings(settings), TemplateSpec.from_settings(group, tuple(args.size_px)),
+        slots, args.output, axes, workers=args.workers, sheet=not args.no_sheet,
+        columns=args.columns, on_progress=on_progress)
+    print(f"\n✓ {len(paths)} variantes en '{args.output}' ({time.perf_counter() - start:.1f} s)")
+    if sheet_path:
+        print(f"✓ Hoja de contactos: {sheet_path}")
+    return 0
+
+
+def cmd_check_alloc(args):
+    """Comprueba que un render repetido no cree imágenes ni memoria de más."""
+    from src.batch import make_group, load_group_images
+    from src.diagnostics import check_allocations
+    from src.renderer import Renderer, TemplateSpec
+
+    settings = load_settings(args.config)
+    group = make_group(args.images, settings)
+    if group["count"] not in (2, 3, 4):
+        print("Se necesitan 2, 3 o 4 imágenes.")
+        return 2
+    renderer = Renderer.from_settings(settings)
+    spec = TemplateSpec.from_settings(group, tuple(args.size_px))
+
+    results = check_allocations(renderer, spec, load_group_images(group), renders=args.renders)
+    for name, result in results.items():
+        rss = "n/d" if result["rss_growth_mb"] is None else f"{result['rss_growth_mb']:.1f} MB"
+        print(f"{'✗' if result['problems'] else '✓'} {name:<13} {result['images_per_render']:.1f} imágenes/render, "
+              f"crecimiento del pico de memoria: {rss}")
+        for problem in result["problems"]:
+            print(f"    {problem}")
+    return 1 if any(result["problems"] for result in results.values()) else 0
+
+
+def cmd_check_golden(args):
+    """Compara los renders de una matriz fija de plantillas con sus imágenes de referencia."""
+    from src.golden import FAILURES_DIR, run_golden, format_golden
+
+    failures_dir = args.failures or os.path.join(args.dir, FAILURES_DIR)
+    done = 0
+
+    def on_result(name, result):
+        nonlocal done
+        done += 1
+        print(f"\r{done} pruebas", end="", flush=True)
+
+    report = run_golden(args.dir, update=args.update, only=args.only, failures_dir=failures_dir,
+                        on_result=on_result)
+    print()
+    print(format_golden(report, failures_dir))
+    return 1 if report["failed"] or report["missing"] else 0
+
+
+def cmd_check_latency(args):
+    """Comprueba que la vista previa responda a tiempo con un lote en marcha."""
+    import time
+    import tempfile
+    import threading
+    from src.config import CANVAS_SIZE, PREVIEW_LATENCY_BUDGET_MS
+    from src.batch import make_group, load_group_images, run_batch
+    from src.renderer import Renderer, TemplateSpec
+    from src.scheduler import RenderScheduler, percentile
+    from src.soak import synthetic_groups
+
+    settings = load_settings(args.config)
+    group = make_group(args.images[:4], settings)
+    if group["count"] < 2:
+        print("Se necesitan 2, 3 o 4 imágenes.")
+        return 2
+    slots = load_group_images(group)
+    assets = load_batch_assets(settings)
+    preview = Renderer.from_assets(assets)
+    spec = TemplateSpec.from_settings(group, CANVAS_SIZE)
+    scheduler = RenderScheduler()
+
+    def drag(previews):
+        """Simula arrastrar un control: cada cambio pide una vista previa y espera a verla."""
+        latencies = []
+        for k in range(previews):
+            start = time.perf_counter()
+            scheduler.submit("preview", preview.render, spec.replace(logo_size=0.10 + (k % 20) * 0.01),
+                             slots, output_mode="RGBA").result()
+            latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(args.interval_ms / 1000)
+        return sorted(latencies)
+
+    def report(name, latencies):
+        print(f"  {name:<18} p50 {percentile(latencies, 0.5):6.0f} ms   p95 {percentile(latencies, 0.95):6.0f} ms")
+
+    print("Latencia de la vista previa:")
+    report("sin lote", drag(args.previews))
+
+    groups = synthetic_groups(args.images, settings, args.groups)
+    progress = [0]
+
+    def on_progress(done, total):
+        progress[0] = done
+
+    with tempfile.TemporaryDirectory(prefix="latencia_") as output_dir:
+        batch = threading.Thread(target=run_batch, args=(groups, assets, output_dir, settings),
+                                 kwargs={"scheduler": scheduler, "on_progress": on_progress}, daemon=True)
+        start = time.perf_counter()
+        batch.start()
+        while progress[0] == 0 and batch.is_alive():
+            time.sleep(0.05)
+        with_batch = drag(args.previews)
+        batch.join()
+        elapsed = time.perf_counter() - start
+    scheduler.stop()
+    report("con lote en marcha", with_batch)
+    print(f"  Lote: {len(groups)} grupos en {elapsed:.1f} s")
+
+    p95 = percentile(with_batch, 0.95)
+    if p95 > PREVIEW_LATENCY_BUDGET_MS:
+        print(f"✗ La vista previa supera el presupuesto de {PREVIEW_LATENCY_BUDGET_MS} ms con un lote en marcha")
+        return 1
+    print(f"✓ La vista previa está dentro del presupuesto de {PREVIEW_LATENCY_BUDGET_MS} ms")
+    return 0
+
+
+def cmd_soak(args):
+    """Prueba de resistencia: la memoria debe estabilizarse en sesiones largas y lotes enormes."""
+    from src.batch import make_group, load_group_images
+    from src.renderer import Renderer, TemplateSpec
+    from src.soak import soak_preview, soak_batch, synthetic_groups, format_soak
+
+    settings = load_settings(args.config)
+    renderer = Renderer.from_settings(settings)
+
+    def print_sample(sample):
+        rss = "n/d" if sample["rss_mb"] is None else f"{sample['rss_mb']:.1f} MB"
+        print(f"  paso {sample['step']}: proceso {rss}, Python {sample['traced_mb']:.1f} MB", flush=True)
+
+    if args.mode == "preview":
+        group = make_group(args.images[:4], settings)
+        if group["count"] < 2:
+            print("Se necesitan 2, 3 o 4 imágenes.")
+            return 2
+        print(f"Vista previa: {args.renders} renders...")
+        result = soak_preview(renderer, load_group_images(group), TemplateSpec.from_settings(group),
+                              renders=args.renders, on_sample=print_sample)
+    else:
+        groups = synthetic_groups(args.images, settings, args.groups)
+        print(f"Lote: {len(groups)} grupos a {args.size_px[0]}x{args.size_px[1]}...")
+        result = soak_batch(renderer, groups, settings, tuple(args.size_px), on_sample=print_sample)
+    print(format_soak(result))
+    return 0 if result["ok"] else 1
+
+
+def cmd_preflight(args):
+    """Verifica los archivos del lote guardado sin renderizar nada."""
+    from src.preflight import preflight_batch, format_report
+
+    settings = load_settings(args.config)
+    report = preflight_batch(settings["batch_groups"], settings)
+    print(format_report(report))
+    return 1 if report["bad_groups"] or report["shared_problems"] else 0
+
+
+def _save_profile(data, output_dir):
+    """Guarda un perfil de renders y muestra su resumen."""
+    from src.profiling import write_profile
+
+    if data is None or not data.renders:
+        print("\nPerfil vacío: no se renderizó ningún grupo.")
+        return
+    paths = write_profile(data, output_dir)
+    print("\n" + data.summary(limit=10))
+    print(f"Perfil guardado en: {', '.join(paths)}")
+
+
+def cmd_batch(args):
+    """Renderiza el lote guardado en la configuración."""
+    from src.batch import run_batch
+    from src.batch_plan import format_plan
+    from src.manifest import BatchManifest
+    from src.preflight import preflight_batch, format_report
+    from src.profiling import PROFILER
+
+    settings = load_settings(args.config)
+    groups = settings["batch_groups"]
+    if not groups:
+        print("No hay grupos de imágenes para procesar.")
+        return 2
+
+    report = preflight_batch(groups, settings)
+    print(format_report(report))
+    if (report["bad_groups"] or report["shared_problems"]) and args.strict:
+        print("Lote cancelado por la verificación previa (--strict).")
+        return 1
+
+    if args.archive and args.resume:
+        print("Los lotes en ZIP/TAR no se pueden reanudar; usa una carpeta de salida.")
+        return 2
+    if not args.archive and not args.output:
+        print("Indica una carpeta de salida (-o) o un archivo (--archive).")
+        return 2
+
+    if args.resume:
+        previous = BatchManifest.load(args.output)
+        if previous is None:
+            print(f"'{args.output}' no contiene un lote para reanudar.")
+            return 2
+        print(f"Reanudando el lote {previous.run_id}: {previous.summary()['done']} grupos ya generados")
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    def on_progress(done, total):
+        print(f"\r{done}/{total} grupos", end="", flush=True)
+
+    def on_plan(plan):
+        print(format_plan(plan))
+
+    if args.profile:
+        PROFILER.start(args.profile)
+    try:
+        generated, failed = run_batch(groups, load_batch_assets(settings), args.output,
+                                      defaults=settings, skip=set(report["bad_groups"]),
+                                      on_progress=on_progress, resume=args.resume,
+                                      archive_path=args.archive, reorder=not args.keep_order,
+                                      on_plan=on_plan)
+    finally:
+        if args.profile:
+            # Con --archive el perfil se guarda junto al archivo
+            _save_profile(PROFILER.stop(), args.output or os.path.dirname(os.path.abspath(args.archive)))
+    print(f"\n✓ {len(generated)} imágenes generadas en '{args.archive or args.output}' "
+          f"(métricas en {METRICS_JSON_NAME} y {METRICS_PROM_NAME})")
+    for i, error in failed:
+        print(f"  Grupo {i + 1}: {error}")
+    return 1 if failed else 0
+
+
+def cmd_queue_publish(args):
+    """Publica el lote guardado en una cola compartida."""
+    from src.job_queue import publish
+
+    settings = load_settings(args.config)
+    if not settings["batch_groups"]:
+        print("No hay grupos de imágenes para procesar.")
+        return 2
+    run_id = publish(args.queue, settings["batch_groups"], settings, args.output,
+                     lease_seconds=args.lease, max_attempts=args.attempts)
+    print(f"Lote {run_id}: {len(settings['batch_groups'])} trabajos publicados en '{args.queue}'")
+    return 0
+
+
+def _queue_worker(queue_dir, wait, profile=None, profile_dir=None, shared_layers=None):
+    from src.job_queue import run_worker
+    from src.profiling import PROFILER, save_part
+
+    def on_done(index, output_path):
+        print(f"[{os.getpid()}] ✓ grupo {index + 1} -> {os.path.basename(output_path)}", flush=True)
+
+    if profile:
+        PROFILER.start(profile)
+    try:
+        return run_worker(queue_dir, wait=wait, on_done=on_done, shared_layers=shared_layers)
+    finally:
+        if profile:
+            # Cada proceso deja su parte; el proceso principal las suma
+            save_part(PROFILER.stop(), profile_dir)
+
+
+def cmd_queue_work(args):
+    """Procesa trabajos de la cola con uno o varios procesos locales."""
+    import multiprocessing
+    import shutil
+    import tempfile
+    from src.job_queue import JobQueue
+    from src.profiling import merge_parts
+
+    profile_dir = tempfile.mkdtemp(prefix="perfil_") if args.profile else None
+    try:
+        if args.processes <= 1:
+            try:
+                rendered = _queue_worker(args.queue, args.wait, args.profile, profile_dir)
+            except KeyboardInterrupt:
+                return 130
+            print(f"Worker terminado: {rendered} grupos renderizados")
+            return 0
+
+        # Recursos precompilados una vez: los workers los comparten mapeados en memoria
+        from src.bundles import compile_assets
+        from src.renderer import Renderer, GroupSpec
+        from src.shared_layers import publish_layers
+        queue = JobQueue(args.queue)
+        settings = queue.config["settings"]
+        compile_assets(settings, only_stale=True)
+
+        # Fondo, logo y emojis escalados se preparan aquí una vez y los
+        # workers los usan desde memoria compartida
+        specs = [GroupSpec.from_group(group, settings) for group in queue.pending_groups()]
+        shared = publish_layers(Renderer.from_assets(load_batch_assets(settings)),
+                                [(spec.template, spec.count) for spec in specs])
+        with shared:
+            print(f"Capas fijas en memoria compartida: {_format_mb(shared.size)}")
+            workers = [multiprocessing.Process(target=_queue_worker,
+                                               args=(args.queue, args.wait, args.profile, profile_dir,
+                                                     shared.manifest))
+                       for _ in range(args.processes)]
+            for worker in workers:
+                worker.start()
+            try:
+                for worker in workers:
+                    worker.join()
+            except KeyboardInterrupt:
+                for worker in workers:
+                    worker.terminate()
+                return 130
+        return cmd_queue_status(args)
+    finally:
+        if profile_dir:
+            # Perfil de todos los procesos, junto a las imágenes del lote
+            _save_profile(merge_parts(profile_dir), JobQueue(args.queue).config["output_dir"])
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+def cmd_queue_status(args):
+    """Muestra cuántos trabajos hay en cada estado."""
+    from src.job_queue import JobQueue
+
+    status = JobQueue(args.queue).status()
+    print(" · ".join(f"{state}: {count}" for state, count in status.items()))
+    return 1 if status["failed"] else 0
+
+
+def _format_mb(num_bytes):
+    return f"{num_bytes / (1024 * 1024):.1f} MB"
+
+
+def cmd_cache_info(args):
+    """Muestra el tamaño y contenido de la caché en disco."""
+    from src.disk_cache import DiskCache
+    from src.thumbnails import THUMBS_DIR
+
+    info = DiskCache().info()
+    print(f"Caché: {info['dir']}")
+    print(f"  {info['entries']} entradas, {_format_mb(info['bytes'])} de {_format_mb(info['max_bytes'])}")
+    for op, (count, op_bytes) in sorted(info["by_op"].items()):
+        print(f"  {op:<8} {count:>6} entradas  {_format_mb(op_bytes):>10}")
+    if os.path.isdir(THUMBS_DIR):
+        thumbs = [os.path.join(THUMBS_DIR, n) for n in os.listdir(THUMBS_DIR) if n.endswith(".png")]
+        print(f"Miniaturas: {len(thumbs)} archivos, {_format_mb(sum(os.path.getsize(p) for p in thumbs))}")
+    return 0
+
+
+def cmd_cache_prune(args):
+    """Borra las entradas menos usadas hasta quedar bajo el límite."""
+    import shutil
+    from src.disk_cache import DiskCache
+    from src.thumbnails import THUMBS_DIR
+
+    cache = DiskCache()
+    max_bytes = 0 if args.all else (
+        int(args.max_mb * 1024 * 1024) if args.max_mb is not None else cache.max_bytes)
+    removed = cache.prune(max_bytes)
+    print(f"✓ {removed} entradas borradas, quedan {_format_mb(cache.info()['bytes'])}")
+    if args.all and os.path.isdir(THUMBS_DIR):
+        shutil.rmtree(THUMBS_DIR, ignore_errors=True)
+        print("✓ Miniaturas borradas")
+    return 0
+
+
+def cmd_bundle_compile(args):
+    """Precompila los emojis, el fondo y el logo de la configuración."""
+    from src.bundles import compile_assets, compile_emoji_pack
+
+    settings = load_settings(args.config)
+    results = compile_assets(settings)
+    for pack in args.pack or ():
+        try:
+            results.append(compile_emoji_pack(pack))
+        except ValueError as e:
+            print(e)
+    for bundle_path, count, size in results:
+        print(f"✓ {bundle_path}: {count} imágenes, {_format_mb(size)}")
+    return 0 if results else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m src.cli",
+        description="Generador de plantillas de reacciones (modo sin GUI)"
+    )
+    parser.add_argument("--config", default=SETTINGS_FILE,
+                        help="Archivo de configuración de la GUI (por defecto: settings.json)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="No usar la caché en disco de fondos, recortes y emojis")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    watch = sub.add_parser("watch", help="Vigilar una carpeta y renderizar grupos al llegar")
+    watch.add_argument("folder", help="Carpeta donde llegan las imágenes")
+    watch.add_argument("-o", "--output", required=True, help="Carpeta de salida")
+    watch.add_argument("--rule", choices=sorted(WATCH_RULES), default="llegada",
+                       help="Regla de agrupación")
+    watch.add_argument("--size", type=int, choices=(2, 3, 4), default=3,
+                       help="Imágenes por grupo (reglas 'llegada' y 'patron')")
+    watch.add_argument("--pattern", default=WATCH_DEFAULT_PATTERN,
+                       help="Expresión regular de la regla 'patron' (grupo con nombre 'grupo')")
+    watch.add_argument("--interval", type=float, default=WATCH_INTERVAL,
+                       help="Segundos entre revisiones de la carpeta")
+    watch.set_defaults(func=cmd_watch)
+
+    serve = sub.add_parser("serve", help="Servicio HTTP local de renderizado")
+    serve.add_argument("--host", default="127.0.0.1", help="Dirección de escucha (por defecto solo localhost)")
+    serve.add_argument("--port", type=int, default=8765, help="Puerto (0 = uno libre)")
+    serve.add_argument("--workers", type=int, default=None, help="Procesos de render (por defecto: núcleos)")
+    serve.add_argument("--quiet", action="store_true", help="No registrar cada petición")
+    serve.set_defaults(func=cmd_serve)
+
+    preflight = sub.add_parser("preflight", help="Verificar los archivos del lote guardado")
+    preflight.set_defaults(func=cmd_preflight)
+
+    batch = sub.add_parser("batch", help="Renderizar el lote guardado en la configuración")
+    batch.add_argument("-o", "--output", help="Carpeta de salida")
+    batch.add_argument("--archive", help="Escribir todo en un .zip, .tar o .tar.gz en lugar de una carpeta")
+    batch.add_argument("--strict", action="store_true",
+                       help="No renderizar nada si la verificación previa encuentra problemas")
+    batch.add_argument("--resume", action="store_true",
+                       help="Reanudar el lote interrumpido en la carpeta de salida")
+    batch.add_argument("--keep-order", action="store_true",
+                       help="Renderizar en el orden de la lista (sin reordenar para reutilizar cachés)")
+    batch.add_argument("--profile", nargs="?", const=PROFILE_MODES[0], choices=PROFILE_MODES,
+                       help="Perfilar los renders y guardar el perfil en la carpeta de salida "
+                            "(por defecto por muestreo; 'cprofile' añade el volcado de pstats)")
+    batch.set_defaults(func=cmd_batch)
+
+    queue = sub.add_parser("queue", help="Render distribuido mediante una cola en carpeta compartida")
+    queue_sub = queue.add_subparsers(dest="queue_command", required=True)
+
+    q_publish = queue_sub.add_parser("publish", help="Publicar el lote guardado como trabajos")
+    q_publish.add_argument("queue", help="Carpeta de la cola (accesible por todas las máquinas)")
+    q_publish.add_argument("-o", "--output", required=True, help="Carpeta de salida compartida")
+    q_publish.add_argument("--lease", type=int, default=QUEUE_LEASE_SECONDS,
+                           help="Segundos sin señales de vida antes de reasignar un trabajo")
+    q_publish.add_argument("--attempts", type=int, default=QUEUE_MAX_ATTEMPTS, help="Intentos por grupo")
+    q_publish.set_defaults(func=cmd_queue_publish)
+
+    q_work = queue_sub.add_parser("work", help="Procesar trabajos de la cola")
+    q_work.add_argument("queue", help="Carpeta de la cola")
+    q_work.add_argument("--processes", type=int, default=1, help="Workers locales a lanzar")
+    q_work.add_argument("--wait", action="store_true", help="Seguir esperando trabajos nuevos")
+    q_work.add_argument("--profile", nargs="?", const=PROFILE_MODES[0], choices=PROFILE_MODES,
+                        help="Perfilar los renders de todos los workers y guardar el perfil sumado "
+                             "en la carpeta de salida del lote")
+    q_work.set_defaults(func=cmd_queue_work)
+
+    q_status = queue_sub.add_parser("status", help="Estado de la cola")
+    q_status.add_argument("queue", help="Carpeta de la cola")
+    q_status.set_defaults(func=cmd_queue_status)
+
+    animate = sub.add_parser("animate", help="Plantilla animada (GIF, WebP o APNG)")
+    animate.add_argument("images", nargs="+", help="2, 3 o 4 imágenes")
+    animate.add_argument("-o", "--output", required=True, help="Archivo .gif, .webp o .png (APNG)")
+    animate.add_argument("--frames", type=int, default=40, help="Número de cuadros")
+    animate.add_argument("--frame-ms", type=int, default=40, help="Duración de cada cuadro en ms")
+    animate.add_argument("--budget-ms", type=float, default=None, help="Avisar si un cuadro tarda más")
+    animate.add_argument("--size-px", type=int, nargs=2, default=FINAL_SIZE, metavar=("ANCHO", "ALTO"),
+                         help="Tamaño de salida")
+    animate.set_defaults(func=cmd_animate)
+
+    poster = sub.add_parser("poster", help="Plantilla de gran formato renderizada por franjas")
+    poster.add_argument("images", nargs="+", help="2, 3 o 4 imágenes")
+    poster.add_argument("-o", "--output", required=True, help="Archivo .png de salida")
+    poster.add_argument("--size-px", type=int, nargs=2, default=(7680, 7680), metavar=("ANCHO", "ALTO"),
+                        help="Tamaño de salida (por defecto 7680x7680)")
+    poster.add_argument("--band-rows", type=int, default=TILE_ROWS,
+                        help="Filas por franja: menos filas, menos memoria")
+    poster.set_defaults(func=cmd_poster)
+
+    variants = sub.add_parser("variants", help="Todas las combinaciones de estilo, forma y fuente de un grupo")
+    variants.add_argument("images", nargs="+", help="2, 3 o 4 imágenes")
+    variants.add_argument("-o", "--output", required=True, help="Carpeta de salida")
+    variants.add_argument("--styles", nargs="+", choices=sorted(TITLE_STYLES), help="Estilos de título (por defecto todos)")
+    variants.add_argument("--shapes", nargs="+", choices=IMAGE_SHAPES, help="Formas (por defecto todas)")
+    variants.add_argument("--fonts", nargs="+", choices=sorted(FONT_FILENAMES), help="Fuentes (por defecto todas)")
+    variants.add_argument("--workers", type=int, default=VARIANT_WORKERS, help="Variantes a la vez")
+    variants.add_argument("--columns", type=int, default=None, help="Columnas de la hoja de contactos")
+    variants.add_argument("--no-sheet", action="store_true", help="No generar la hoja de contactos")
+    variants.add_argument("--size-px", type=int, nargs=2, default=FINAL_SIZE, metavar=("ANCHO", "ALTO"),
+                          help="Tamaño de salida")
+    variants.set_defaults(func=cmd_variants)
+
+    check = sub.add_parser("check", help="Comprobaciones de rendimiento")
+    check_sub = check.add_subparsers(dest="check_command", required=True)
+    ch_alloc = check_sub.add_parser("alloc", help="Imágenes y memoria que crea un render repetido")
+    ch_alloc.add_argument("images", nargs="+", help="2, 3 o 4 imágenes")
+    ch_alloc.add_argument("--renders", type=int, default=20, help="Renders a medir")
+    ch_alloc.add_argument("--size-px", type=int, nargs=2, default=FINAL_SIZE, metavar=("ANCHO", "ALTO"),
+                          help="Tamaño de salida")
+    ch_alloc.set_defaults(func=cmd_check_alloc)
+    ch_golden = check_sub.add_parser("golden", help="Regresión visual contra imágenes de referencia")
+    ch_golden.add_argument("--dir", default=GOLDEN_DIR, help="Carpeta de las imágenes de referencia")
+    ch_golden.add_argument("--update", action="store_true",
+                           help="Guardar los renders actuales como nuevas referencias")
+    ch_golden.add_argument("--only", help="Solo las pruebas cuyo nombre contiene este texto (p. ej. circle)")
+    ch_golden.add_argument("--failures", help="Carpeta para los renders y mapas de calor de los fallos")
+    ch_golden.set_defaults(func=cmd_check_golden)
+
+    ch_latency = check_sub.add_parser("latency", help="Latencia de la vista previa con un lote en marcha")
+    ch_latency.add_argument("images", nargs="+", help="Imágenes (las 4 primeras forman la vista previa)")
+    ch_latency.add_argument("--previews", type=int, default=40, help="Vistas previas a medir en cada fase")
+    ch_latency.add_argument("--groups", type=int, default=40, help="Grupos del lote de fondo")
+    ch_latency.add_argument("--interval-ms", type=int, default=30, help="Pausa entre cambios del control")
+    ch_latency.set_defaults(func=cmd_check_latency)
+
+    soak = sub.add_parser("soak", help="Prueba de resistencia de memoria")
+    soak.add_argument("mode", choices=("preview", "batch"),
+                      help="preview: renders de vista previa; batch: lote sintético enorme")
+    soak.add_argument("images", nargs="+", help="Imágenes a usar (2 a 4 para preview)")
+    soak.add_argument("--renders", type=int, default=SOAK_PREVIEW_RENDERS, help="Renders de vista previa")
+    soak.add_argument("--groups", type=int, default=SOAK_BATCH_GROUPS, help="Grupos del lote sintético")
+    soak.add_argument("--size-px", type=int, nargs=2, default=(270, 337), metavar=("ANCHO", "ALTO"),
+                      help="Tamaño de las imágenes del lote")
+    soak.set_defaults(func=cmd_soak)
+
+    cache = sub.add_parser("cache", help="Caché en disco de imágenes derivadas")
+    cache_sub = cache.add_subparsers(dest="cache_command", required=True)
+
+    c_info = cache_sub.add_parser("info", help="Tamaño y contenido de la caché")
+    c_info.set_defaults(func=cmd_cache_info)
+
+    c_prune = cache_sub.add_parser("prune", help="Borrar las entradas usadas hace más tiempo")
+    c_prune.add_argument("--max-mb", type=float, default=None,
+                         help="Tamaño a conservar (por defecto: el límite configurado)")
+    c_prune.add_argument("--all", action="store_true", help="Vaciar la caché y las miniaturas")
+    c_prune.set_defaults(func=cmd_cache_prune)
+
+    bundle = sub.add_parser("bundle", help="Recursos precompilados (emojis, fondo y logo)")
+    bundle_sub = bundle.add_subparsers(dest="bundle_command", required=True)
+    b_compile = bundle_sub.add_parser("compile", help="Precompilar los recursos de la configuración")
+    b_compile.add_argument("--pack", action="append", help="Compilar también este paquete de emojis (repetible)")
+    b_compile.set_defaults(func=cmd_bundle_compile)
+
+    return parser
+
+
+def main(argv=None):
+    """Función principal"""
+    args = build_parser().parse_args(argv)
+    if args.no_cache:
+        from src.disk_cache import set_disk_cache_enabled
+        set_disk_cache_enabled(False)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
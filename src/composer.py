@@ -3,15 +3,215 @@ composer.py
 Lógica principal para componer las plantillas
 """
 
+import os
+import weakref
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from PIL import Image, ImageDraw, ImageFilter
 from src.config import (
     DEFAULT_BG_COLOR, IMAGE_LAYOUTS, TITLE_POSITION, 
-    TITLE_COLOR, TITLE_STYLES, FONT_SCALING_FACTORS
+    TITLE_COLOR, TITLE_STYLES, FONT_SCALING_FACTORS, COMPOSE_WORKERS, EMOJI_GLYPH_CACHE
 )
 from src.utils import (
-    apply_cover_background, draw_text_with_style,
-    apply_shape_to_image, paste_with_shadow, load_font
+    LRUCache, cover_resize, draw_text_with_style, make_title_shadow, has_blurred_shadow,
+    apply_shape_to_image, paste_with_shadow, load_font, load_emoji_font, is_emoji_text
 )
+from src.disk_cache import cached_image
+from src.text_fit import fit_title
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_scratch = threading.local()
+SCRATCH_CANVASES = 4            # Tamaños de lienzo de trabajo que guarda cada hilo
+PLACEHOLDERS = LRUCache(16, "placeholders")    # Recuadros '?' por tamaño (ver make_placeholder)
+EMOJI_GLYPHS = LRUCache(EMOJI_GLYPH_CACHE, "emoji_glyphs")    # Emojis de texto en color (ver emoji_glyph)
+NO_GLYPH = False            # En EMOJI_GLYPHS: ese texto no tiene emoji en color (None sería un fallo de caché)
+_scratch_pools = weakref.WeakSet()
+
+
+class _ScratchPool(OrderedDict):
+    """Lienzos de trabajo de un hilo (se registran para medir su memoria)."""
+
+    __hash__ = object.__hash__      # WeakSet necesita objetos con hash
+
+
+def prepare_pool():
+    """
+    Pool de hilos compartido para preparar las capas de un render.
+    Devuelve None si hay un solo núcleo (no se ganaría nada).
+    """
+    global _pool
+    workers = min(COMPOSE_WORKERS, os.cpu_count() or 1)
+    if workers < 2:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="compose")
+    return _pool
+
+
+def scratch_canvas(size):
+    """
+    Lienzo RGBA de trabajo del hilo actual, relleno con el color de fondo.
+
+    Se reutiliza entre renders del mismo tamaño en lugar de crear uno nuevo:
+    solo sirve cuando el resultado se copia (p. ej. con convert) antes del
+    siguiente render en el mismo hilo.
+    """
+    canvases = getattr(_scratch, "canvases", None)
+    if canvases is None:
+        canvases = _scratch.canvases = _ScratchPool()
+        _scratch_pools.add(canvases)
+    canvas = canvases.pop(size, None)
+    if canvas is None:
+        canvas = Image.new("RGBA", size, DEFAULT_BG_COLOR)
+    else:
+        canvas.paste(DEFAULT_BG_COLOR, (0, 0) + tuple(size))
+    canvases[size] = canvas
+    while len(canvases) > SCRATCH_CANVASES:
+        canvases.popitem(last=False)
+    return canvas
+
+
+def scratch_canvases():
+    """Lienzos de trabajo de todos los hilos vivos."""
+    return [canvas for pool in list(_scratch_pools) for canvas in list(pool.values())]
+
+
+def slot_boxes(final_size, num_slots):
+    """Devuelve (x, y, tamaño) de cada slot del layout: esquina superior izquierda y lado."""
+    W, H = final_size
+    layout = IMAGE_LAYOUTS.get(num_slots, IMAGE_LAYOUTS[4])
+    boxes = []
+    for pos_config in layout['positions'][:num_slots]:
+        size_img = int(W * pos_config['size'])
+        x = int(W * pos_config['x']) - size_img // 2
+        y = int(H * pos_config['y']) - size_img // 2
+        boxes.append((x, y, size_img))
+    return boxes
+
+
+def make_placeholder(size_img):
+    """
+    Recuadro gris con '?' que ocupa un slot sin imagen. Se crea una vez por
+    tamaño y se comparte, así que no debe modificarse.
+    """
+    return PLACEHOLDERS.get_or_compute(size_img, lambda: _placeholder_tile(size_img))
+
+
+def _placeholder_tile(size_img):
+    placeholder = Image.new("RGBA", (size_img, size_img), (80, 80, 90, 255))
+    draw_ph = ImageDraw.Draw(placeholder)
+    fnt_ph = load_font('arial_bold', int(size_img * 0.4), scale_factor=FONT_SCALING_FACTORS.get('arial_bold', 1.0)) # Scaled to image size
+    bbox_ph = draw_ph.textbbox((0, 0), "?", font=fnt_ph)
+    tw_ph = bbox_ph[2] - bbox_ph[0]
+    th_ph = bbox_ph[3] - bbox_ph[1]
+    draw_ph.text(((size_img - tw_ph)//2, (size_img - th_ph)//2), "?", 
+                 fill=(200, 200, 200), font=fnt_ph)
+    return placeholder
+
+
+def prepare_slot_image(img_data, image_shape, size_img):
+    """Imagen del slot ya recortada a su forma, o un placeholder si no hay imagen."""
+    if img_data:
+        return apply_shape_to_image(img_data, image_shape, size_img, radius=30)
+    return make_placeholder(size_img)
+
+
+def emoji_font(final_size, emoji_size):
+    """Fuente usada para los emojis de texto."""
+    H = final_size[1]
+    return load_font('arial_bold', size=int(H * 0.08 * emoji_size / 0.45), scale_factor=FONT_SCALING_FACTORS.get('arial_bold', 1.0))
+
+
+def emoji_glyph(text, px):
+    """
+    Emoji de texto en color rasterizado a 'px' píxeles de alto, con su
+    sombra; None si el texto no es un emoji o no hay fuente de emojis.
+
+    Se guarda por (texto, tamaño): un emoji repetido en otros slots o grupos
+    solo se pega. Se comparte, así que no debe modificarse.
+    """
+    text = text.strip()
+    if px <= 0:
+        return None
+    # También se guarda la falta de emoji, para no volver a comprobarla en cada render
+    return EMOJI_GLYPHS.get_or_compute((text, px), lambda: _emoji_sprite(text, px) or NO_GLYPH) or None
+
+
+def _emoji_sprite(text, px):
+    font = load_emoji_font()
+    if font is None or not is_emoji_text(text):
+        return None
+    # Se dibuja al tamaño fijo de la fuente y se escala al pedido
+    left, top, right, bottom = font.getbbox(text)
+    if right <= left or bottom <= top:
+        return None
+    strike = Image.new("RGBA", (right, bottom), (0, 0, 0, 0))
+    ImageDraw.Draw(strike).text((0, 0), text, font=font, embedded_color=True)
+    strike = strike.crop((left, top, right, bottom))
+    glyph = strike.resize((max(1, round(strike.width * px / strike.height)), px), Image.LANCZOS)
+
+    # Misma sombra que los emojis de texto sin color: negra, desplazada 2 px
+    shadow = Image.new("RGBA", glyph.size, (0, 0, 0, 0))
+    shadow.putalpha(glyph.getchannel("A").point(lambda a: a * 180 // 255))
+    sprite = Image.new("RGBA", (glyph.width + 2, glyph.height + 2), (0, 0, 0, 0))
+    sprite.paste(shadow, (2, 2))
+    sprite.alpha_composite(glyph)
+    return sprite
+
+
+def prepare_emoji_image(emoji_data, size_img, emoji_size):
+    """Escala un emoji de imagen al tamaño relativo al slot."""
+    em_w = int(size_img * emoji_size)
+    return cached_image(emoji_data, "emoji", em_w,
+                        lambda: emoji_data.convert("RGBA").resize((em_w, em_w), Image.LANCZOS))
+
+
+def title_layout(final_size, title_text, font_family):
+    """
+    Devuelve (fuente, posición, texto) del título centrado horizontalmente.
+    Si no cabe en su caja, la letra se reduce y el texto vuelve partido en
+    líneas (ver text_fit.py).
+    """
+    W, H = final_size
+    font_title, title_text = fit_title(final_size, title_text, font_family)
+    if "\n" in title_text:
+        text_width = max(font_title.getlength(line) for line in title_text.split("\n"))
+    else:
+        bbox = font_title.getbbox(title_text)
+        text_width = bbox[2] - bbox[0]
+    
+    x_title = int(W - text_width) // 2
+    y_title = int(H * TITLE_POSITION['y'])
+    return font_title, (x_title, y_title), title_text
+
+
+def logo_box(logo_size_px, final_size, logo_size, logo_x, logo_y):
+    """Devuelve (ancho, alto, x, y) del logo escalado dentro de la plantilla."""
+    W, H = final_size
+    lw, lh = logo_size_px
+    max_w = int(W * logo_size)
+    scale = min(1.0, max_w / lw)
+    
+    new_lw = int(lw * scale)
+    new_lh = int(lh * scale)
+    
+    x = int(W * logo_x) - new_lw // 2
+    y = int(H * logo_y) - new_lh // 2
+    return new_lw, new_lh, x, y
+
+
+def prepare_logo(logo_img, final_size, logo_size, logo_x, logo_y):
+    """Devuelve (logo escalado, posición) o (None, None) si no hay logo."""
+    if not logo_img:
+        return None, None
+    new_lw, new_lh, x, y = logo_box(logo_img.size, final_size, logo_size, logo_x, logo_y)
+    logo = cached_image(logo_img, "logo", (new_lw, new_lh),
+                        lambda: logo_img.resize((new_lw, new_lh), Image.LANCZOS).convert("RGBA"))
+    return logo, (x, y)
 
 
 def compose_template(
@@ -30,7 +230,9 @@ def compose_template(
     emoji_size=0.45,
     emoji_x_offset=0,
     emoji_y_offset=0,
-    num_slots=3
+    num_slots=3,
+    parallel=True,
+    output_mode="RGB"
 ):
     """
     Genera la plantilla completa con layout adaptativo
@@ -51,91 +253,123 @@ def compose_template(
         emoji_size: Tamaño de los emojis como porcentaje del tamaño de la imagen
         emoji_x_offset: Desplazamiento X del emoji
         emoji_y_offset: Desplazamiento Y del emoji
+        parallel: Preparar slots, emojis, logo y fondo en el pool de hilos compartido
+        output_mode: "RGB", o "RGBA" para recibir el lienzo sin copiarlo (vista previa)
+    """
+    n = num_slots
+    boxes = slot_boxes(final_size, n) if n else []
+
+    # Escalados y recortes independientes entre sí. Pillow libera el GIL al
+    # escalar, así que con varios núcleos se preparan a la vez mientras se
+    # dibuja el título; después se pega todo en el orden de siempre.
+    jobs = {}
+    if fondo_img:
+        jobs["fondo"] = (cover_resize, fondo_img, final_size)
+    for i, (x_img, y_img, size_img) in enumerate(boxes):
+        if i < len(slots_imgs) and slots_imgs[i] is not None:
+            jobs[("slot", i)] = (apply_shape_to_image, slots_imgs[i], image_shape, size_img, 30)
+        if i < len(emojis_imgs_or_texts) and isinstance(emojis_imgs_or_texts[i], Image.Image):
+            jobs[("emoji", i)] = (prepare_emoji_image, emojis_imgs_or_texts[i], size_img, emoji_size)
+    if logo_img:
+        jobs["logo"] = (prepare_logo, logo_img, final_size, logo_size, logo_x, logo_y)
+
+    title = None
+    if title_text.strip():
+        font_title, title_pos, title_text = title_layout(final_size, title_text, font_family)
+        style = TITLE_STYLES.get(title_style, TITLE_STYLES['simple'])
+        title = (title_text, font_title, title_pos, style)
+        if has_blurred_shadow(style):
+            # La sombra difuminada es lo más lento del título: también va al pool
+            jobs["title_shadow"] = (make_title_shadow, title_text, title_pos, font_title, style, *final_size)
+    layers = run_prepare_jobs(jobs, parallel)
+
+    return compose_layers(final_size, layers, boxes, emojis_imgs_or_texts, title,
+                          emoji_size, emoji_x_offset, emoji_y_offset, output_mode)
+
+
+def run_prepare_jobs(jobs, parallel=True):
+    """
+    Ejecuta los trabajos de preparación {clave: (función, *args)}.
+    Devuelve {clave: resultado}; en paralelo, los resultados son Futures.
+    """
+    pool = prepare_pool() if parallel else None
+    if pool is not None and len(jobs) > 1:
+        return {key: pool.submit(*job) for key, job in jobs.items()}
+    return {key: job[0](*job[1:]) for key, job in jobs.items()}
+
+
+def _resolve(value):
+    return value.result() if isinstance(value, Future) else value
+
+
+def compose_layers(final_size, layers, boxes, emojis_imgs_or_texts, title=None,
+                   emoji_size=0.45, emoji_x_offset=0, emoji_y_offset=0, output_mode="RGB"):
+    """
+    Pega las capas ya preparadas en el orden de la plantilla.
+
+    Args:
+        final_size: Tupla (ancho, alto) del tamaño final
+        layers: Capas preparadas: "fondo" (fondo ya escalado), ("slot", i)
+            (imagen recortada), ("emoji", i) (emoji escalado) y "logo"
+            ((logo, posición)), más "title_shadow" (sombra difuminada del
+            título, opcional). Los valores pueden ser Futures. Los slots sin
+            capa llevan un placeholder.
+        boxes: Slots del layout (ver slot_boxes)
+        emojis_imgs_or_texts: Emojis originales (los de texto se dibujan aquí)
+        title: (texto, fuente, posición, estilo) o None
+        output_mode: "RGB", o "RGBA" para devolver el lienzo tal cual (ya es
+            opaco: se evita la copia de la conversión)
     """
     W, H = final_size
-    base = Image.new("RGBA", (W, H), DEFAULT_BG_COLOR)
+    # Si el resultado se convierte, el lienzo es solo de trabajo y se reutiliza
+    base = Image.new("RGBA", (W, H), DEFAULT_BG_COLOR) if output_mode == "RGBA" else scratch_canvas((W, H))
     draw = ImageDraw.Draw(base)
 
     # 1. FONDO
-    if fondo_img:
-        base = apply_cover_background(base, fondo_img)
+    if "fondo" in layers:
+        sub = _resolve(layers["fondo"])
+        base.paste(sub, (0, 0), sub)
 
     # 2. TÍTULO
-    if title_text.strip():
-        font_title = load_font(font_family, size=int(H * 0.08), scale_factor=FONT_SCALING_FACTORS.get(font_family, 1.0))
-        style = TITLE_STYLES.get(title_style, TITLE_STYLES['simple'])
-        
-        bbox = draw.textbbox((0, 0), title_text, font=font_title)
-        text_width = bbox[2] - bbox[0]
-        
-        x_title = (W - text_width) // 2
-        y_title = int(H * TITLE_POSITION['y'])
-        
-        draw_text_with_style(draw, title_text, (x_title, y_title), 
-                           font_title, TITLE_COLOR, style, W, H)
+    if title:
+        title_text, font_title, title_pos, style = title
+        shadow_layer = _resolve(layers["title_shadow"]) if "title_shadow" in layers else None
+        draw_text_with_style(draw, title_text, title_pos, 
+                           font_title, TITLE_COLOR, style, W, H, shadow_layer=shadow_layer)
 
     # 3. IMÁGENES Y EMOJIS
-    n = num_slots
-    if n == 0:
-        return base.convert("RGB")
-    
-    layout = IMAGE_LAYOUTS.get(n, IMAGE_LAYOUTS[4])
-    positions = layout['positions']
+    if not boxes:
+        return _finish(base, output_mode)
     
-    font_emoji = load_font('arial_bold', size=int(H * 0.08 * emoji_size / 0.45), scale_factor=FONT_SCALING_FACTORS.get('arial_bold', 1.0))
+    font_emoji = emoji_font(final_size, emoji_size)
     
-    # Preparar todas las imágenes (reales o placeholders) y emojis
+    # Imágenes (reales o placeholders) y emojis
     prepared_images = []
     prepared_emojis = []
 
-    for i in range(n):
-        pos_config = positions[i]
-        size_img = int(W * pos_config['size'])
-        
-        # Get actual image or create placeholder
-        img_data = slots_imgs[i] if i < len(slots_imgs) and slots_imgs[i] is not None else None
-        
-        if img_data:
-            processed_img = apply_shape_to_image(img_data, image_shape, size_img, radius=30)
-            prepared_images.append((processed_img, pos_config))
+    for i, (x_img, y_img, size_img) in enumerate(boxes):
+        if ("slot", i) in layers:
+            prepared_images.append(_resolve(layers[("slot", i)]))
         else:
-            # Crear placeholder si no hay imagen
-            placeholder = Image.new("RGBA", (size_img, size_img), (80, 80, 90, 255))
-            draw_ph = ImageDraw.Draw(placeholder)
-            fnt_ph = load_font('arial_bold', int(size_img * 0.4), scale_factor=FONT_SCALING_FACTORS.get('arial_bold', 1.0)) # Scaled to image size
-            bbox_ph = draw_ph.textbbox((0, 0), "?", font=fnt_ph)
-            tw_ph = bbox_ph[2] - bbox_ph[0]
-            th_ph = bbox[3] - bbox_ph[1]
-            draw_ph.text(((size_img - tw_ph)//2, (size_img - th_ph)//2), "?", 
-                         fill=(200, 200, 200), font=fnt_ph)
-            prepared_images.append((placeholder, pos_config))
+            prepared_images.append(make_placeholder(size_img))
 
         # Get actual emoji or use default
         emoji_data = emojis_imgs_or_texts[i] if i < len(emojis_imgs_or_texts) and emojis_imgs_or_texts[i] is not None else None
         
-        prepared_emojis.append(emoji_data)
+        prepared_emojis.append(_resolve(layers[("emoji", i)]) if ("emoji", i) in layers else emoji_data)
 
 
     # Primero, pegar todas las imágenes
-    for i, (img, pos_config) in enumerate(prepared_images):
-        x = int(W * pos_config['x']) - img.width // 2
-        y = int(H * pos_config['y']) - img.height // 2
+    for img, (x, y, _) in zip(prepared_images, boxes):
         paste_with_shadow(base, img, (x, y))
 
     # Segundo, pegar todos los emojis encima
-    for i, emoji_data in enumerate(prepared_emojis):
+    for emoji_data, (x_img, y_img, size_img) in zip(prepared_emojis, boxes):
         if not emoji_data:
             continue
-            
-        pos_config = positions[i]
-        size_img = int(W * pos_config['size'])
-        x_img = int(W * pos_config['x']) - size_img // 2
-        y_img = int(H * pos_config['y']) - size_img // 2
 
         if isinstance(emoji_data, Image.Image):
-            em = emoji_data.convert("RGBA")
-            em_w = int(size_img * emoji_size)
-            em = em.resize((em_w, em_w), Image.LANCZOS)
+            em = emoji_data
             
             emoji_x_final = x_img + int(emoji_x_offset)
             emoji_y_final = y_img + size_img - em.height + int(emoji_y_offset)
@@ -144,6 +378,11 @@ def compose_template(
         
         elif str(emoji_data).strip():
             txt = str(emoji_data)
+            glyph = emoji_glyph(txt, font_emoji.size)
+            if glyph is not None:
+                base.paste(glyph, (x_img + int(emoji_x_offset),
+                                   y_img + size_img - font_emoji.size + int(emoji_y_offset)), glyph)
+                continue
             bbox = draw.textbbox((0, 0), txt, font=font_emoji)
             th = bbox[3] - bbox[1]
 
@@ -156,18 +395,13 @@ def compose_template(
                      fill=(255, 255, 255), font=font_emoji)
 
     # 4. LOGO (dinámico)
-    if logo_img:
-        lw, lh = logo_img.size
-        max_w = int(W * logo_size)
-        scale = min(1.0, max_w / lw)
-        
-        new_lw = int(lw * scale)
-        new_lh = int(lh * scale)
-        logo = logo_img.resize((new_lw, new_lh), Image.LANCZOS).convert("RGBA")
-        
-        x = int(W * logo_x) - new_lw // 2
-        y = int(H * logo_y) - new_lh // 2
-        
-        base.paste(logo, (x, y), logo)
+    if "logo" in layers:
+        logo, logo_pos = _resolve(layers["logo"])
+        if logo:
+            base.paste(logo, logo_pos, logo)
     
-    return base.convert("RGB")
\ No newline at end of file
+    return _finish(base, output_mode)
+
+
+def _finish(base, output_mode):
+    return base if output_mode == "RGBA" else base.convert(output_mode)
@@ -3,10 +3,45 @@ config.py
 Configuración central del generador de plantillas
 """
 
+import os
+
 # Tamaños
 CANVAS_SIZE = (540, 540)        # Preview en GUI
 FINAL_SIZE = (1080, 1080)       # Salida final
 SLOT_MAX = 4
+THUMB_SIZE = (96, 96)           # Miniaturas de la pestaña de lotes
+
+# Claves de configuración que cada grupo del lote guarda junto a sus rutas
+GROUP_SETTING_KEYS = (
+    "title_text", "font_family", "title_style", "image_shape",
+    "logo_size", "logo_x", "logo_y",
+    "emoji_size", "emoji_x_offset", "emoji_y_offset",
+)
+
+# Valores por defecto (los mismos con los que arranca la GUI)
+DEFAULT_SETTINGS = {
+    "title_text": "¡VOTA POR TU CRACK!",
+    "font_family": "arial_bold",
+    "title_style": "impacto",
+    "image_shape": "square",
+    "logo_size": 0.20,
+    "logo_x": 0.50,
+    "logo_y": 0.50,
+    "emoji_pack": "default",
+    "emoji_size": 1.0,
+    "emoji_x_offset": 0,
+    "emoji_y_offset": 0,
+    "bg_img_path": None,
+    "logo_img_path": None,
+    "batch_groups": [],
+}
+
+# Archivos y rutas
+SETTINGS_FILE = "settings.json"
+EMOJIS_DIR = "assets/emojis"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+BATCH_GROUP_SIZES = (2, 3, 4)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "plantilla_fb")
 
 # Colores
 DEFAULT_BG_COLOR = (18, 18, 24)
@@ -88,6 +123,107 @@ IMAGE_LAYOUTS = {
 
 TITLE_POSITION = {'y': 0.08}
 
+# Ajuste del título: si no cabe en su caja a TITLE_FONT_SIZE, se reduce la
+# letra y se parte en líneas; por debajo de TITLE_MIN_FONT_SIZE se recorta con "..."
+TITLE_FONT_SIZE = 0.08                          # Tamaño de letra máximo (fracción del alto)
+TITLE_MIN_FONT_SIZE = 0.04                      # Tamaño de letra mínimo (fracción del alto)
+TITLE_BOX = {'width': 0.92, 'height': 0.13}     # Caja del título (fracción del lienzo), desde TITLE_POSITION
+TITLE_MAX_LINES = 2
+TITLE_LINE_SPACING = 0.15                       # Espacio entre líneas (fracción del tamaño de letra)
+
+# Emojis de texto en color: fuente de emojis con mapas de bits (CBDT, sbix) o capas (COLR)
+EMOJI_FONT_FILENAMES = ['NotoColorEmoji.ttf', 'seguiemj.ttf', 'Apple Color Emoji.ttc']
+EMOJI_STRIKE_SIZES = (109, 160, 96, 64)     # Tamaños fijos de los mapas de bits (Noto: 109; Apple: 160, 96, 64)
+EMOJI_GLYPH_CACHE = 256                     # Emojis ya rasterizados por (texto, tamaño en píxeles)
+
+# Carpeta vigilada (modo streaming)
+WATCH_RULES = {
+    'llegada': 'Orden de llegada',
+    'patron': 'Patrón de nombre',
+    'manifiesto': 'Manifiesto JSON',
+}
+WATCH_DEFAULT_PATTERN = r'^(?P<grupo>.+?)_\d+\.\w+$'
+WATCH_INTERVAL = 0.25           # Segundos entre revisiones de la carpeta
+WATCH_MTIME_GRANULARITY = 2.0   # Resolución de la fecha del directorio en el peor caso (FAT: 2 s; SMB/NFS similar)
+WATCH_FULL_SCAN_EVERY = 40      # Revisiones tras las que se relee el directorio aunque su fecha no cambie
+
+# Verificación previa de lotes
+PREFLIGHT_MAX_PIXELS = 40_000_000   # Imágenes más grandes se reportan como excesivas
+PREFLIGHT_WORKERS = 16              # Hilos para leer cabeceras en paralelo
+
+# Cola de trabajos compartida (render en varias máquinas)
+QUEUE_LEASE_SECONDS = 120       # Tiempo sin señales de vida antes de reasignar un trabajo
+QUEUE_MAX_ATTEMPTS = 3          # Intentos por grupo antes de marcarlo como fallido
+QUEUE_POLL_INTERVAL = 1.0       # Segundos de espera cuando no hay trabajos
+
+# Renderer reutilizable (cachés en memoria)
+RENDER_IMAGE_CACHE = 64         # Fondos, logos, emojis y slots ya preparados
+RENDER_LAYOUT_CACHE = 512       # Layouts y títulos ya calculados
+RENDER_SOURCE_CACHE = 16        # Imágenes de lote decodificadas que se reutilizan en grupos siguientes
+RENDER_TITLE_CACHE = 8          # Sombras difuminadas de títulos
+BATCH_PLAN_WINDOW = 32          # Grupos pendientes por imagen que se puntúan al elegir el siguiente
+
+# Matriz de variantes (comparar estilos, formas y fuentes)
+IMAGE_SHAPES = ('square', 'rounded', 'circle')
+VARIANT_WORKERS = 4             # Variantes que se renderizan a la vez
+VARIANT_SHEET_CELL = 270        # Lado de cada miniatura en la hoja de contactos
+
+# Preparación en paralelo de slots, emojis, logo y fondo dentro de un render
+COMPOSE_WORKERS = 4             # Hilos compartidos (se limita a los núcleos disponibles)
+
+# Planificador de renders de la GUI: vista previa > miniaturas > lote
+SCHEDULER_WORKERS = 2           # Hilos de vista previa y miniaturas
+SCHEDULER_BATCH_WORKERS = 2     # Hilos del lote (con menor prioridad del sistema)
+SCHEDULER_BATCH_NICE = 10       # Cuánto se baja la prioridad de los hilos del lote (Linux)
+SCHEDULER_QUEUE_LIMITS = {"preview": 1, "thumbnail": 64, "batch": 4}
+SCHEDULER_BATCH_PAUSE = 0.4     # Segundos sin pedidos de vista previa antes de que el lote siga
+SCHEDULER_LATENCY_SAMPLES = 200 # Latencias recientes que se guardan por clase
+PREVIEW_LATENCY_BUDGET_MS = 250 # Latencia p95 máxima de la vista previa con un lote en marcha
+
+# Métricas de rendimiento (informe de cada lote y endpoint /metrics del servicio)
+METRICS_PREFIX = "plantilla_"   # Prefijo de los nombres en formato Prometheus
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)   # Segundos
+METRICS_JSON_NAME = "metricas.json"
+METRICS_PROM_NAME = "metricas.prom"
+
+# Perfilado de renders (botón de la GUI y opción --profile del lote y de la cola)
+PROFILE_MODES = ("sample", "cprofile")   # Muestreo de pilas, o cProfile además del muestreo
+PROFILE_SAMPLE_INTERVAL = 0.005     # Segundos entre muestras de las pilas
+PROFILE_TOP_FUNCTIONS = 25          # Funciones que se listan en el resumen
+PROFILE_TEXT_NAME = "perfil.txt"            # Resumen legible
+PROFILE_COLLAPSED_NAME = "perfil.collapsed" # Pilas colapsadas (flamegraph.pl, speedscope, inferno)
+PROFILE_PSTATS_NAME = "perfil.pstats"       # Volcado de pstats (solo modo cprofile)
+
+# Imágenes de referencia ('python -m src.cli check golden')
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "golden")  # En la raíz del proyecto
+GOLDEN_SIZE = (360, 450)            # Tamaño de los renders de prueba
+GOLDEN_CHANNEL_TOLERANCE = 2        # Diferencia por canal que se ignora (redondeos)
+GOLDEN_PERCEPTUAL_THRESHOLD = 24    # Diferencia de luminancia (suavizada 1 px) que se considera visible
+GOLDEN_MAX_DIFF_FRACTION = 0.0005   # Proporción de píxeles con diferencia visible permitida
+
+# Verificación de asignaciones ('python -m src.cli check alloc')
+CHECK_MAX_IMAGES_PER_RENDER = 2     # Imágenes nuevas por render con las cachés ya llenas
+CHECK_MAX_RSS_GROWTH_MB = 16        # Crecimiento del pico de memoria tras calentar
+
+# Pruebas de resistencia ('python -m src.cli soak'): la memoria debe estabilizarse
+SOAK_PREVIEW_RENDERS = 5000         # Renders de vista previa por defecto
+SOAK_BATCH_GROUPS = 10000           # Grupos del lote sintético por defecto
+SOAK_SAMPLES = 40                   # Mediciones de memoria a lo largo de la prueba
+SOAK_WARMUP_FRACTION = 0.25         # Parte inicial que no cuenta (cachés llenándose)
+SOAK_MAX_RSS_GROWTH_MB = 32         # Crecimiento permitido de la memoria del proceso tras calentar
+SOAK_MAX_TRACED_GROWTH_MB = 16      # Crecimiento permitido de objetos de Python (tracemalloc)
+
+# Render por franjas (pósters muy grandes con memoria acotada)
+TILE_ROWS = 512                 # Filas por franja (se redondea a múltiplo de COVER_BAND_ROWS)
+COVER_BAND_ROWS = 256           # El fondo 'cover' siempre se escala en franjas de este alto
+
+# Caché en disco de imágenes derivadas (fondos escalados, slots recortados, emojis)
+DISK_CACHE_DIR = os.path.join(CACHE_DIR, "assets")
+DISK_CACHE_MAX_MB = 512         # Al superarlo se borran las entradas menos usadas
+
+# Recursos precompilados (emojis, fondo y logo ya decodificados, mapeados en memoria)
+BUNDLES_DIR = os.path.join(CACHE_DIR, "bundles")
+
 
 
 # --- Importación de Drag & Drop ---
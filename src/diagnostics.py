@@ -0,0 +1,216 @@
+"""
+diagnostics.py
+Herramientas para medir el render: cuántas imágenes crea cada render,
+cuánto crece la memoria del proceso y cuántos bytes retiene cada caché.
+Las usan 'python -m src.cli check alloc', tests/test_alloc.py,
+'python -m src.cli soak' y el botón de memoria de la GUI.
+"""
+
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from PIL import Image
+
+try:
+    import resource
+except ImportError:                 # Windows
+    resource = None
+
+
+class ImageCounter:
+    """Cuenta las imágenes de Pillow creadas mientras está activo."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.count += 1
+
+
+@contextmanager
+def count_images():
+    """
+    Cuenta cada Image de Pillow creada dentro del bloque (new, convert,
+    copy, crop, resize, filter...), en cualquier hilo.
+    """
+    counter = ImageCounter()
+    original_init = Image.Image.__init__
+
+    def counting_init(self, *args, **kwargs):
+        counter.add()
+        original_init(self, *args, **kwargs)
+
+    Image.Image.__init__ = counting_init
+    try:
+        yield counter
+    finally:
+        Image.Image.__init__ = original_init
+
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure_renders(render, renders=20, warmup=3):
+    """
+    Mide un render repetido: primero lo calienta (cachés llenas) y después
+    cuenta imágenes creadas y crecimiento del pico de memoria.
+
+    Args:
+        render: Función sin argumentos que hace un render
+        renders: Renders medidos
+        warmup: Renders previos que no se miden
+
+    Returns:
+        Diccionario con renders, images_per_render y rss_growth_mb
+    """
+    for _ in range(warmup):
+        render()
+    rss_before = peak_rss_mb()
+    with count_images() as counter:
+        for _ in range(renders):
+            render()
+    rss_after = peak_rss_mb()
+    return {
+        "renders": renders,
+        "images_per_render": counter.count / max(1, renders),
+        "rss_growth_mb": None if rss_before is None else rss_after - rss_before,
+    }
+
+
+def check_allocations(renderer, spec, slots, renders=20):
+    """
+    Mide un render repetido con las imágenes dadas y con placeholders, y lo
+    compara con CHECK_MAX_IMAGES_PER_RENDER y CHECK_MAX_RSS_GROWTH_MB.
+
+    Returns:
+        {escenario: resultado de measure_renders más "problems" (lista de textos)}
+    """
+    from src.config import CHECK_MAX_IMAGES_PER_RENDER, CHECK_MAX_RSS_GROWTH_MB
+
+    scenarios = {
+        "render": lambda: renderer.render(spec, slots, parallel=False),
+        "placeholders": lambda: renderer.render(spec, [None] * len(slots), parallel=False),
+    }
+    results = {}
+    for name, render in scenarios.items():
+        result = measure_renders(render, renders=renders)
+        problems = []
+        if result["images_per_render"] > CHECK_MAX_IMAGES_PER_RENDER:
+            problems.append(f"más de {CHECK_MAX_IMAGES_PER_RENDER} imágenes por render")
+        if result["rss_growth_mb"] is not None and result["rss_growth_mb"] > CHECK_MAX_RSS_GROWTH_MB:
+            problems.append(f"la memoria creció más de {CHECK_MAX_RSS_GROWTH_MB} MB")
+        results[name] = {**result, "problems": problems}
+    return results
+
+
+def current_rss_mb():
+    """
+    Memoria residente actual del proceso en MB. Donde no se puede leer
+    (fuera de Linux) se usa el pico, que también sirve para ver si crece.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+def image_nbytes(image):
+    """Bytes de píxeles de una imagen de Pillow o de una PhotoImage de Tk."""
+    if isinstance(image, Image.Image):
+        return image.width * image.height * len(image.getbands())
+    if hasattr(image, "width") and callable(image.width):
+        return image.width() * image.height() * 4
+    return 0
+
+
+def _iter_images(value):
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _iter_images(item)
+    elif value is not None and not isinstance(value, (str, int, float)):
+        yield value
+
+
+def memory_report(app=None, renderers=()):
+    """
+    Bytes de píxeles que retiene cada caché o recurso.
+
+    Cada imagen se cuenta una sola vez, en la primera categoría donde
+    aparece (p. ej. el fondo de la GUI es el mismo objeto que usa su
+    Renderer). Las imágenes mapeadas desde un paquete precompilado se
+    cuentan aparte: sus páginas se comparten entre procesos.
+
+    Returns:
+        {categoría: {"count", "bytes", "mapped"}}
+    """
+    from src.composer import PLACEHOLDERS, EMOJI_GLYPHS, scratch_canvases
+    from src.utils import SHADOW_TILES
+
+    report, seen = {}, set()
+
+    def add(category, values):
+        entry = report.setdefault(category, {"count": 0, "bytes": 0, "mapped": 0})
+        for image in _iter_images(values):
+            if id(image) in seen:
+                continue
+            seen.add(id(image))
+            entry["count"] += 1
+            if getattr(image, "readonly", 0):
+                entry["mapped"] += image_nbytes(image)
+            else:
+                entry["bytes"] += image_nbytes(image)
+
+    if app is not None:
+        add("GUI: slots", list(app.slots))
+        add("GUI: fondo", app.bg_img)
+        add("GUI: logo", app.logo_img)
+        add("GUI: emojis", list(app.current_emojis))
+        add("GUI: vista previa", app.preview_tk)
+        add("GUI: miniaturas del lote", [photo for _, photo in getattr(app, "batch_thumbs", {}).values()])
+        worker = getattr(app, "thumb_worker", None)
+        if worker is not None:
+            add("miniaturas: fuentes reducidas", worker.renderer.proxy_images())
+            renderers = [app._renderer, worker.renderer.renderer, *renderers]
+        else:
+            renderers = [app._renderer, *renderers]
+
+    for renderer in renderers:
+        if renderer is None:
+            continue
+        for category, values in renderer.cached_images().items():
+            add(f"renderer: {category}", values)
+    add("compartido: sombras de slots", SHADOW_TILES.values())
+    add("compartido: recuadros '?'", PLACEHOLDERS.values())
+    add("compartido: emojis de texto", EMOJI_GLYPHS.values())
+    add("compartido: lienzos de trabajo", scratch_canvases())
+    return {category: entry for category, entry in report.items() if entry["count"]}
+
+
+def format_memory(report):
+    """Tabla legible de memory_report, más la memoria del proceso."""
+    def mb(num_bytes):
+        return f"{num_bytes / (1024 * 1024):.1f} MB"
+
+    lines = []
+    for category, entry in sorted(report.items(), key=lambda item: -item[1]["bytes"]):
+        mapped = f" (+{mb(entry['mapped'])} mapeados)" if entry["mapped"] else ""
+        lines.append(f"{category:<34} {entry['count']:>5}  {mb(entry['bytes']):>10}{mapped}")
+    total = sum(entry["bytes"] for entry in report.values())
+    mapped = sum(entry["mapped"] for entry in report.values())
+    lines.append(f"{'Total en imágenes':<34} {'':>5}  {mb(total):>10}"
+                 + (f" (+{mb(mapped)} mapeados)" if mapped else ""))
+    rss = current_rss_mb()
+    if rss is not None:
+        lines.append(f"{'Memoria del proceso':<34} {'':>5}  {rss:>7.1f} MB")
+    return "\n".join(lines)
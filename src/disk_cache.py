@@ -0,0 +1,201 @@
+"""
+disk_cache.py
+Caché en disco de imágenes derivadas, compartida entre sesiones y procesos.
+
+Cada entrada se identifica por la huella del archivo de origen (ruta, fecha
+y tamaño) más la operación y sus parámetros, así que nunca hace falta
+invalidarla: si el archivo cambia, la clave cambia. Las imágenes se guardan
+sin comprimir para que leerlas sea mucho más rápido que volver a calcularlas.
+Cuando la carpeta supera el tamaño máximo se borran las entradas usadas hace
+más tiempo.
+"""
+
+import os
+import hashlib
+import threading
+from PIL import Image
+from src.config import DISK_CACHE_DIR, DISK_CACHE_MAX_MB
+from src.metrics import METRICS
+
+SOURCE_KEY = "source_key"       # Clave en img.info con la huella del archivo de origen
+ENTRY_SUFFIX = ".raw"
+_MAGIC = b"PFC1"
+
+
+def file_stamp(path):
+    """Huella de un archivo: ruta absoluta, fecha de modificación y tamaño."""
+    st = os.stat(path)
+    return f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}"
+
+
+def tag_source(image, path):
+    """Marca una imagen cargada de disco con la huella de su archivo."""
+    try:
+        image.info[SOURCE_KEY] = file_stamp(path)
+    except OSError:
+        pass
+    return image
+
+
+class DiskCache:
+    """Caché LRU de imágenes en una carpeta, con tamaño máximo."""
+
+    def __init__(self, cache_dir=DISK_CACHE_DIR, max_bytes=DISK_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = None          # Tamaño ocupado (se calcula al primer guardado)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, op, key):
+        return os.path.join(self.cache_dir, f"{op}-{key}{ENTRY_SUFFIX}")
+
+    def get(self, op, key):
+        """Devuelve la imagen guardada o None. Marca la entrada como usada."""
+        path = self._path(op, key)
+        try:
+            with open(path, "rb") as f:
+                header = f.readline().split()
+                if len(header) != 4 or header[0] != _MAGIC:
+                    return None
+                mode, w, h = header[1].decode("ascii"), int(header[2]), int(header[3])
+                image = Image.frombytes(mode, (w, h), f.read())
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return image
+
+    def put(self, op, key, image):
+        """Guarda una imagen de forma atómica (seguro con varios procesos)."""
+        path = self._path(op, key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data = image.tobytes()
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(b"%s %s %d %d\n" % (_MAGIC, image.mode.encode("ascii"), image.width, image.height))
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"No se pudo guardar en la caché: {e}")
+            return
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = self.info()["bytes"]
+            else:
+                self._bytes += len(data)
+            over = self._bytes > self.max_bytes
+        if over:
+            self.prune(int(self.max_bytes * 0.9))
+
+    def entries(self):
+        """Lista de (ruta, bytes, última vez usada) de todas las entradas."""
+        result = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return result
+        for name in names:
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.append((path, st.st_size, st.st_mtime))
+        return result
+
+    def info(self):
+        """Resumen de la caché: entradas y bytes, en total y por operación."""
+        by_op = {}
+        total = 0
+        entries = self.entries()
+        for path, size, _ in entries:
+            op = os.path.basename(path).split("-", 1)[0]
+            count, op_bytes = by_op.get(op, (0, 0))
+            by_op[op] = (count + 1, op_bytes + size)
+            total += size
+        return {"dir": self.cache_dir, "entries": len(entries), "bytes": total,
+                "max_bytes": self.max_bytes, "by_op": by_op}
+
+    def prune(self, max_bytes=None):
+        """Borra las entradas usadas hace más tiempo hasta quedar bajo max_bytes."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue            # Otro proceso ya la borró
+            total -= size
+            removed += 1
+        with self._lock:
+            self._bytes = total
+        return removed
+
+
+_default_cache = None
+_enabled = True
+
+
+def get_disk_cache():
+    """Caché compartida del proceso, o None si está desactivada."""
+    global _default_cache
+    if not _enabled:
+        return None
+    if _default_cache is None:
+        try:
+            _default_cache = DiskCache()
+        except OSError as e:
+            print(f"Caché en disco desactivada: {e}")
+            set_disk_cache_enabled(False)
+            return None
+    return _default_cache
+
+
+def set_disk_cache_enabled(enabled):
+    global _enabled
+    _enabled = enabled
+
+
+def cached_image(image, op, params, compute):
+    """
+    Devuelve compute() usando la caché en disco cuando la imagen de entrada
+    viene de un archivo (ver tag_source). Si no, simplemente la calcula.
+
+    La clave incluye el tamaño y modo de la imagen de entrada, así que una
+    imagen derivada que conserve la huella de su origen no puede confundirse
+    con él.
+    """
+    source = image.info.get(SOURCE_KEY) if image is not None else None
+    if not source:
+        return compute()
+    return _lookup(f"{source}|{image.mode}|{image.size}", op, params, compute)
+
+
+def cached_file(path, op, params, compute):
+    """Como cached_image, pero a partir de la ruta: en un acierto el archivo ni se abre."""
+    try:
+        source = file_stamp(path)
+    except OSError:
+        return compute()
+    return _lookup(source, op, params, compute)
+
+
+def _lookup(source, op, params, compute):
+    cache = get_disk_cache()
+    if cache is None:
+        return compute()
+    raw = f"{source}|{op}|{params!r}"
+    key = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    result = cache.get(op, key)
+    METRICS.inc("cache_requests_total", cache="disk", result="miss" if result is None else "hit")
+    if result is None:
+        result = compute()
+        cache.put(op, key, result)
+    result.info.pop(SOURCE_KEY, None)
+    return result
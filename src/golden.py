@@ -0,0 +1,275 @@
+"""
+golden.py
+Pruebas de regresión visual: renderiza una matriz fija de plantillas (todos
+los layouts, formas, estilos de título y fuentes, con y sin fondo, logo y
+emojis de imagen) y compara cada una con su imagen de referencia guardada.
+
+Las imágenes de prueba se generan en el código y los títulos se dibujan
+solo con la fuente incluida en Pillow (se ignoran las del sistema y la de
+emojis), así que el resultado solo depende del motor de render y de Pillow.
+Las referencias están en el repositorio (golden/, con el entorno con el que
+se generaron) y se regeneran con --update solo cuando un cambio del render
+es intencionado.
+
+La comparación usa solo operaciones de Pillow sobre la imagen entera: una
+diferencia por canal menor que GOLDEN_CHANNEL_TOLERANCE se ignora, y solo
+falla si hay más de GOLDEN_MAX_DIFF_FRACTION píxeles con una diferencia de
+luminancia visible (suavizada para no contar desplazamientos de 1 px del
+antialiasing). Para cada fallo se guarda la imagen obtenida y un mapa de
+calor de las diferencias.
+"""
+
+import os
+import json
+import time
+from contextlib import contextmanager
+import PIL
+from PIL import features, Image, ImageChops, ImageDraw, ImageFilter, ImageOps
+from src.config import (
+    BATCH_GROUP_SIZES, IMAGE_SHAPES, TITLE_STYLES, FONT_FILENAMES, GOLDEN_DIR, GOLDEN_SIZE,
+    GOLDEN_CHANNEL_TOLERANCE, GOLDEN_PERCEPTUAL_THRESHOLD, GOLDEN_MAX_DIFF_FRACTION
+)
+from src.composer import EMOJI_GLYPHS
+from src.renderer import Renderer, TemplateSpec
+from src.text_fit import glyph_metrics
+from src.utils import set_system_fonts
+
+ENVIRONMENT_NAME = "entorno.json"
+FAILURES_DIR = "fallos"
+SHORT_TITLE = "¡Vota por tu crack!"
+LONG_TITLE = "¿Quién fue el mejor jugador de la historia del fútbol mundial según tu opinión?"
+TEXT_EMOJIS = ["❤️", "X", "🔥", "7"]        # Emojis de texto y texto normal
+
+
+def fixture_images():
+    """Imágenes sintéticas de las pruebas: slots, fondo, logo y emojis."""
+    slots = []
+    for i in range(max(BATCH_GROUP_SIZES)):
+        # Proporciones distintas para probar el recorte de cada forma
+        size = (300 + i * 53, 420 - i * 47)
+        img = Image.merge("RGB", (Image.linear_gradient("L").resize(size),
+                                  Image.new("L", size, 60 * i),
+                                  Image.linear_gradient("L").rotate(90).resize(size)))
+        draw = ImageDraw.Draw(img)
+        draw.ellipse((size[0] // 5, size[1] // 5, size[0] // 2, size[1] // 2), fill=(255, 220, 0))
+        draw.rectangle((size[0] // 2, size[1] // 2, size[0] - 20, size[1] - 20), outline=(0, 0, 0), width=6)
+        slots.append(img.convert("RGBA"))
+
+    background = Image.effect_mandelbrot((640, 360), (-2.0, -1.2, 1.0, 1.2), 60).convert("RGB")
+    background = ImageOps.colorize(background.convert("L"), (10, 20, 80), (250, 120, 40))
+
+    logo = Image.new("RGBA", (300, 120), (0, 0, 0, 0))
+    ImageDraw.Draw(logo).ellipse((0, 0, 299, 119), fill=(255, 255, 255, 190), outline=(200, 0, 0, 255), width=8)
+
+    emojis = []
+    for color in ((230, 40, 60), (40, 200, 90), (40, 120, 240), (250, 200, 0)):
+        emoji = Image.new("RGBA", (128, 128), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(emoji)
+        draw.ellipse((4, 4, 123, 123), fill=color + (255,), outline=(0, 0, 0, 255), width=6)
+        draw.ellipse((36, 40, 52, 60), fill=(0, 0, 0, 255))
+        draw.ellipse((76, 40, 92, 60), fill=(0, 0, 0, 255))
+        emojis.append(emoji)
+    return {"slots": slots, "bg_img": background, "logo_img": logo, "emojis": emojis}
+
+
+def golden_fixtures():
+    """
+    Matriz de pruebas: cada layout con cada forma y cada estilo de título,
+    con y sin recursos. Las familias de fuente rotan de modo que cada una
+    aparece con cada estilo (dentro de bundled_fonts todas se dibujan con la
+    fuente de Pillow).
+    """
+    fonts = list(FONT_FILENAMES)
+    fixtures = []
+    for count_index, count in enumerate(BATCH_GROUP_SIZES):
+        for shape_index, shape in enumerate(IMAGE_SHAPES):
+            for style_index, style in enumerate(TITLE_STYLES):
+                for assets in (False, True):
+                    font = fonts[(count_index + shape_index + style_index) % len(fonts)]
+                    name = f"{count}_{shape}_{style}_{font}_{'recursos' if assets else 'sin_recursos'}"
+                    fixtures.append({"name": name, "count": count, "shape": shape, "style": style,
+                                     "font": font, "assets": assets})
+    return fixtures
+
+
+def render_fixture(fixture, renderers, images):
+    """Renderiza una prueba (ver golden_fixtures) con los Renderer de run_golden."""
+    spec = TemplateSpec(
+        size=GOLDEN_SIZE, title_text=LONG_TITLE if fixture["assets"] else SHORT_TITLE,
+        font_family=fixture["font"], title_style=fixture["style"], image_shape=fixture["shape"],
+        logo_size=0.3, logo_y=0.92, emoji_size=0.5, emoji_x_offset=-6, emoji_y_offset=4,
+    )
+    slots = images["slots"][:fixture["count"]]
+    if fixture["assets"]:
+        return renderers[True].render(spec, slots, parallel=False)
+    return renderers[False].render(spec, slots, TEXT_EMOJIS[:fixture["count"]], parallel=False)
+
+
+@contextmanager
+def bundled_fonts():
+    """
+    Dentro del bloque solo se usa la fuente incluida en Pillow, para que los
+    renders no dependan de las fuentes instaladas.
+    """
+    def switch(enabled):
+        set_system_fonts(enabled)
+        glyph_metrics.cache_clear()
+        EMOJI_GLYPHS.clear()
+
+    switch(False)
+    try:
+        yield
+    finally:
+        switch(True)
+
+
+def environment():
+    """Lo que, además del código, cambia los píxeles: versión de Pillow y de FreeType."""
+    return {
+        "pillow": PIL.__version__,
+        "freetype": features.version("freetype2"),
+        "size": list(GOLDEN_SIZE),
+    }
+
+
+def compare_images(actual, golden, tolerance=GOLDEN_CHANNEL_TOLERANCE,
+                   threshold=GOLDEN_PERCEPTUAL_THRESHOLD, max_fraction=GOLDEN_MAX_DIFF_FRACTION):
+    """
+    Compara dos imágenes.
+
+    Returns:
+        Diccionario con ok, max_channel (mayor diferencia de un canal),
+        changed (píxeles con algún canal fuera de la tolerancia), visible
+        (píxeles con diferencia visible), fraction (visible / total) y luma
+        (diferencia de luminancia para el mapa de calor, None si no hay)
+    """
+    if actual.size != golden.size:
+        return {"ok": False, "reason": f"tamaño {actual.size} en lugar de {golden.size}",
+                "max_channel": None, "changed": None, "visible": None, "fraction": 1.0, "luma": None}
+    diff = ImageChops.difference(actual.convert("RGB"), golden.convert("RGB"))
+    max_channel = max(high for _, high in diff.getextrema())
+    result = {"ok": True, "reason": None, "max_channel": max_channel, "changed": 0, "visible": 0,
+              "fraction": 0.0, "luma": None}
+    if max_channel <= tolerance:
+        return result
+
+    # Fuera de la tolerancia en algún canal
+    over = [band.point(lambda v: 255 if v > tolerance else 0) for band in diff.split()]
+    result["changed"] = ImageChops.lighter(ImageChops.lighter(over[0], over[1]), over[2]).histogram()[255]
+
+    # Diferencia visible: luminancia de la diferencia, suavizada 1 px
+    luma = diff.point(lambda v: 0 if v <= tolerance else v).convert("L")
+    visible = sum(luma.filter(ImageFilter.BoxBlur(1)).histogram()[threshold + 1:])
+    result.update(visible=visible, fraction=visible / (actual.width * actual.height), luma=luma)
+    result["ok"] = result["fraction"] <= max_fraction
+    if not result["ok"]:
+        result["reason"] = f"{visible} píxeles con diferencias visibles ({result['fraction']:.3%})"
+    return result
+
+
+def diff_heatmap(golden, luma):
+    """Referencia atenuada en gris con las diferencias encima (rojo a amarillo)."""
+    base = golden.convert("L").point(lambda v: 40 + v // 4).convert("RGB")
+    strength = luma.point(lambda v: min(255, v * 4))
+    heat = ImageOps.colorize(strength, black=(80, 0, 0), white=(255, 255, 0), mid=(255, 0, 0))
+    return Image.composite(heat, base, strength.point(lambda v: 255 if v else 0))
+
+
+def run_golden(golden_dir=GOLDEN_DIR, update=False, only=None, failures_dir=None, on_result=None):
+    """
+    Renderiza la matriz de pruebas y la compara con las referencias.
+
+    Args:
+        golden_dir: Carpeta de las imágenes de referencia
+        update: Guardar los renders como nuevas referencias en lugar de comparar
+        only: Texto que debe aparecer en el nombre de las pruebas a ejecutar
+        failures_dir: Carpeta de los renders y mapas de calor de los fallos
+            (por defecto, 'fallos' dentro de golden_dir; se vacía en cada ejecución)
+        on_result: Callback opcional on_result(nombre, resultado)
+
+    Returns:
+        Diccionario con golden_dir, results, failed, missing, updated,
+        environment_changes y seconds
+    """
+    start = time.perf_counter()
+    failures_dir = failures_dir or os.path.join(golden_dir, FAILURES_DIR)
+    if update:
+        os.makedirs(golden_dir, exist_ok=True)
+    if os.path.isdir(failures_dir):
+        for entry in os.scandir(failures_dir):
+            if entry.name.endswith(".png"):
+                os.remove(entry.path)
+
+    images = fixture_images()
+    renderers = {False: Renderer(),
+                 True: Renderer(images["bg_img"], images["logo_img"], images["emojis"])}
+    env_path = os.path.join(golden_dir, ENVIRONMENT_NAME)
+    current_env = environment()
+    report = {"golden_dir": golden_dir, "results": {}, "failed": [], "missing": [], "updated": 0,
+              "environment_changes": []}
+
+    with bundled_fonts():
+        for fixture in golden_fixtures():
+            name = fixture["name"]
+            if only and only not in name:
+                continue
+            image = render_fixture(fixture, renderers, images)
+            path = os.path.join(golden_dir, name + ".png")
+            if update:
+                image.save(path)
+                report["updated"] += 1
+                result = {"ok": True, "reason": "actualizada"}
+            elif not os.path.exists(path):
+                report["missing"].append(name)
+                result = {"ok": False, "reason": "sin imagen de referencia"}
+            else:
+                with Image.open(path) as golden:
+                    golden.load()
+                result = compare_images(image, golden)
+                if not result["ok"]:
+                    report["failed"].append(name)
+                    os.makedirs(failures_dir, exist_ok=True)
+                    image.save(os.path.join(failures_dir, name + "_obtenida.png"))
+                    if result["luma"] is not None:
+                        diff_heatmap(golden, result["luma"]).save(os.path.join(failures_dir, name + "_diff.png"))
+                result.pop("luma")
+            report["results"][name] = result
+            if on_result:
+                on_result(name, result)
+
+    if update:
+        with open(env_path, "w", encoding="utf-8") as f:
+            json.dump(current_env, f, indent=2, ensure_ascii=False)
+    elif os.path.exists(env_path):
+        with open(env_path, encoding="utf-8") as f:
+            saved_env = json.load(f)
+        report["environment_changes"] = [key for key in current_env if saved_env.get(key) != current_env[key]]
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def format_golden(report, failures_dir=None):
+    """Resumen legible de run_golden."""
+    total = len(report["results"])
+    lines = []
+    if report["updated"]:
+        lines.append(f"✓ {report['updated']} imágenes de referencia actualizadas ({report['seconds']:.1f} s)")
+        return "\n".join(lines)
+    if report["missing"] and len(report["missing"]) == total:
+        # Sin ninguna referencia no hay nada que comparar: un solo error claro
+        lines.append(f"✗ No hay imágenes de referencia en '{report['golden_dir']}'; "
+                     f"deberían estar en el repositorio (carpeta golden)")
+        missing = []
+    else:
+        missing = report["missing"]
+    for name in report["failed"] + missing:
+        lines.append(f"✗ {name}: {report['results'][name]['reason']}")
+    if report["failed"] and failures_dir:
+        lines.append(f"  Renders y mapas de calor de las diferencias en '{failures_dir}'")
+    if report["environment_changes"]:
+        lines.append(f"Advertencia: las referencias se generaron con otro entorno "
+                     f"({', '.join(report['environment_changes'])}); si el cambio es esperado, usa --update")
+    bad = len(report["failed"]) + len(report["missing"])
+    lines.append(f"{'✗' if bad else '✓'} {total - bad}/{total} imágenes iguales a la referencia "
+                 f"({report['seconds']:.1f} s)")
+    return "\n".join(lines)
@@ -0,0 +1,305 @@
+"""
+job_queue.py
+Cola de trabajos en una carpeta compartida (p. ej. una unidad de red) para
+repartir un lote entre varias máquinas.
+
+Estructura de la carpeta de la cola:
+    queue.json      configuración del lote (recursos, salida, límites)
+    pending/        trabajos esperando un worker
+    leased/         trabajos tomados por un worker (su mtime es la señal de vida)
+    done/           resultados de los trabajos terminados
+    failed/         trabajos que agotaron sus intentos
+
+Tomar un trabajo es un os.rename de pending/ a leased/: si dos workers lo
+intentan a la vez, solo uno lo consigue.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from src.config import QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS, QUEUE_POLL_INTERVAL
+from src.batch import load_batch_assets, render_group, save_atomic
+from src.renderer import Renderer
+from src.shared_layers import attach_layers
+
+QUEUE_STATES = ("pending", "leased", "done", "failed")
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def publish(queue_dir, groups, settings, output_dir,
+            lease_seconds=QUEUE_LEASE_SECONDS, max_attempts=QUEUE_MAX_ATTEMPTS):
+    """
+    Publica los grupos de un lote como trabajos en la cola.
+
+    Los recursos compartidos (fondo, logo, emojis) se indican por ruta, por lo
+    que deben ser accesibles desde todas las máquinas.
+    """
+    for state in QUEUE_STATES:
+        os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    _write_json(os.path.join(queue_dir, "queue.json"), {
+        "run_id": run_id,
+        "output_dir": os.path.abspath(output_dir),
+        "settings": {k: v for k, v in settings.items() if k != "batch_groups"},
+        "lease_seconds": lease_seconds,
+        "max_attempts": max_attempts,
+        "total": len(groups),
+    })
+    for i, group in enumerate(groups):
+        _write_json(os.path.join(queue_dir, "pending", f"{i:06d}.json"),
+                    {"index": i, "group": group, "attempts": 0})
+    return run_id
+
+
+class JobQueue:
+    """
+    Operaciones de un worker sobre una cola publicada con publish().
+
+    Un trabajo tomado se llama leased/<trabajo>@<dueño>.json, donde el dueño
+    es un identificador único de este JobQueue. Terminar, devolver o
+    reasignar un trabajo empieza siempre renombrando ese archivo a un nombre
+    propio (<archivo>.<acción>-<dueño>-<hora>): solo uno lo consigue, y el
+    worker que perdió su lease no pisa el resultado de otro. El archivo
+    renombrado se borra al final; si quien lo renombró muere antes, otro
+    worker lo recupera cuando pasa lease_seconds desde la hora de su nombre.
+    """
+
+    def __init__(self, queue_dir):
+        self.queue_dir = queue_dir
+        self.config = _read_json(os.path.join(queue_dir, "queue.json"))
+        self.owner = uuid.uuid4().hex[:12]
+
+    def _path(self, state, name):
+        return os.path.join(self.queue_dir, state, name)
+
+    def _take(self, name, action):
+        """
+        Renombra un archivo de leased/ a un nombre propio para la acción dada.
+        Devuelve el nuevo nombre, o None si otro lo tomó antes.
+        """
+        base = name.split(".json.", 1)[0] + ".json"
+        taken = f"{base}.{action}-{self.owner}-{time.time_ns()}"
+        try:
+            os.rename(self._path("leased", name), self._path("leased", taken))
+        except OSError:
+            return None
+        return taken
+
+    @staticmethod
+    def job_name(name):
+        """Nombre del trabajo (en pending/ y done/) de un archivo de leased/."""
+        return name.split("@", 1)[0] + ".json"
+
+    def claim(self):
+        """Toma el siguiente trabajo pendiente. Devuelve (nombre del lease, trabajo) o None."""
+        for name in sorted(os.listdir(os.path.join(self.queue_dir, "pending"))):
+            if not name.endswith(".json"):
+                continue
+            leased = f"{name[:-len('.json')]}@{self.owner}.json"
+            try:
+                os.rename(self._path("pending", name), self._path("leased", leased))
+            except OSError:
+                continue            # Otro worker lo tomó primero
+            os.utime(self._path("leased", leased))
+            try:
+                return leased, _read_json(self._path("leased", leased))
+            except ValueError as e:
+                self._discard(leased, e)
+            except OSError:
+                continue            # Si no se puede leer, se reintenta cuando expire el lease
+        return None
+
+    def heartbeat(self, name):
+        """Renueva el lease de un trabajo en curso. False si ya no es de este worker."""
+        try:
+            os.utime(self._path("leased", name))
+            return True
+        except OSError:
+            return False
+
+    def complete(self, name, result):
+        """
+        Marca un trabajo como terminado. Devuelve False (sin registrar nada)
+        si el lease expiró y el trabajo se reasignó a otro worker.
+        """
+        taken = self._take(name, "done")
+        if taken is None:
+            return False
+        _write_json(self._path("done", self.job_name(name)), result)
+        os.remove(self._path("leased", taken))
+        return True
+
+    def fail(self, name, job, error):
+        """
+        Devuelve el trabajo a la cola o lo marca como fallido si agotó sus
+        intentos. Devuelve False si el lease ya no era de este worker.
+        """
+        taken = self._take(name, "failed")
+        if taken is None:
+            return False
+        self._retry(taken, job, error)
+        return True
+
+    def _retry(self, taken, job, error):
+        """Escribe el trabajo en pending/ o failed/ y borra después su archivo de leased/."""
+        job["attempts"] = job.get("attempts", 0) + 1
+        job["last_error"] = error
+        state = "failed" if job["attempts"] >= self.config["max_attempts"] else "pending"
+        _write_json(self._path(state, self.job_name(taken)), job)
+        os.remove(self._path("leased", taken))
+
+    def _discard(self, name, error):
+        """Pasa a failed/ un trabajo de leased/ que no se puede leer (JSON dañado)."""
+        stem = self.job_name(name)[:-len(".json")]
+        record = {"index": int(stem) if stem.isdigit() else None, "attempts": 0,
+                  "last_error": f"Trabajo ilegible: {error}"}
+        _write_json(self._path("failed", self.job_name(name)), record)
+        try:
+            os.remove(self._path("leased", name))
+        except OSError:
+            pass
+
+    def requeue_expired(self):
+        """
+        Devuelve a pending/ los trabajos cuyo worker dejó de dar señales de
+        vida, y los que quedaron a medio terminar o reasignar porque su
+        proceso murió entre medias.
+        """
+        now = time.time()
+        lease_ns = self.config["lease_seconds"] * 1e9
+        requeued = 0
+        for name in os.listdir(os.path.join(self.queue_dir, "leased")):
+            try:
+                if name.endswith(".json"):
+                    expired = now - os.stat(self._path("leased", name)).st_mtime >= self.config["lease_seconds"]
+                    error = "Lease expirado"
+                else:
+                    # Renombrado por un proceso que murió antes de terminar
+                    expired = time.time_ns() - int(name.rsplit("-", 1)[1]) >= lease_ns
+                    error = "Worker interrumpido"
+            except (OSError, ValueError, IndexError):
+                continue
+            if not expired:
+                continue
+            taken = self._take(name, "expired")         # Solo un worker gana la reasignación
+            if taken is None:
+                continue
+            try:
+                job = _read_json(self._path("leased", taken))
+            except ValueError as e:
+                self._discard(taken, e)
+                continue
+            except OSError:
+                continue
+            self._retry(taken, job, error)
+            requeued += 1
+        return requeued
+
+    def pending_groups(self):
+        """Grupos de los trabajos pendientes (los que aún no ha tomado ningún worker)."""
+        groups = []
+        for name in sorted(os.listdir(os.path.join(self.queue_dir, "pending"))):
+            if not name.endswith(".json"):
+                continue
+            try:
+                groups.append(_read_json(self._path("pending", name))["group"])
+            except (OSError, json.JSONDecodeError, KeyError):
+                continue            # Tomado por un worker mientras se leía
+        return groups
+
+    def status(self):
+        """Cantidad de trabajos en cada estado (en leased/, también los que se están cerrando)."""
+        return {state: sum(1 for n in os.listdir(os.path.join(self.queue_dir, state))
+                           if n.endswith(".json") or (state == "leased" and not n.endswith(".tmp")))
+                for state in QUEUE_STATES}
+
+    def output_path(self, index):
+        return os.path.join(self.config["output_dir"], f"plantilla_lote_{self.config['run_id']}_{index + 1}.png")
+
+
+@contextmanager
+def keep_lease(queue, name):
+    """Renueva el lease 'name' desde un hilo mientras dura el bloque (renders más largos que el lease)."""
+    stop = threading.Event()
+    interval = queue.config["lease_seconds"] / 4
+
+    def beat():
+        while not stop.wait(interval) and queue.heartbeat(name):
+            pass
+
+    thread = threading.Thread(target=beat, name="lease", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_worker(queue_dir, wait=False, poll_interval=QUEUE_POLL_INTERVAL, on_done=None, shared_layers=None):
+    """
+    Procesa trabajos de la cola hasta que no quede ninguno.
+
+    Con wait=True el worker sigue esperando trabajos nuevos indefinidamente.
+    shared_layers es el manifiesto de las capas fijas que el proceso
+    principal dejó en memoria compartida (ver shared_layers.py).
+    Devuelve la cantidad de grupos renderizados por este worker.
+    """
+    queue = JobQueue(queue_dir)
+    settings = queue.config["settings"]
+    renderer = Renderer.from_assets(load_batch_assets(settings))   # Uno por worker
+    if shared_layers:
+        attach_layers(renderer, shared_layers)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    os.makedirs(queue.config["output_dir"], exist_ok=True)
+    rendered = 0
+
+    while True:
+        claimed = queue.claim()
+        if claimed is None:
+            queue.requeue_expired()
+            status = queue.status()
+            if not wait and status["pending"] == 0 and status["leased"] == 0:
+                return rendered
+            time.sleep(poll_interval)
+            continue
+
+        name, job = claimed
+        start = time.perf_counter()
+        try:
+            with keep_lease(queue, name):
+                image = render_group(job["group"], renderer, settings)
+                output_path = queue.output_path(job["index"])
+                save_atomic(image, output_path)
+        except Exception as e:
+            print(f"Error en el grupo {job['index'] + 1}: {e}")
+            queue.fail(name, job, str(e))
+            continue
+
+        if not queue.complete(name, {
+            "index": job["index"], "output": output_path, "worker": worker_id,
+            "attempts": job.get("attempts", 0) + 1,
+            "seconds": round(time.perf_counter() - start, 3),
+        }):
+            print(f"Grupo {job['index'] + 1}: el lease expiró y lo tomó otro worker")
+            continue
+        rendered += 1
+        if on_done:
+            on_done(job["index"], output_path)
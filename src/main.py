@@ -13,19 +13,20 @@ sys.path.insert(0, project_root)
 import json
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
-from PIL import Image, ImageTk, ImageOps
-from src.config import CANVAS_SIZE, FINAL_SIZE, SLOT_MAX, HAS_TKDND, DND_FILES, TkinterDnD
-from src.composer import compose_template
+from PIL import Image, ImageTk, ImageOps, ImageDraw
+from src.config import CANVAS_SIZE, FINAL_SIZE, SLOT_MAX, HAS_TKDND, DND_FILES, TkinterDnD, SETTINGS_FILE, EMOJIS_DIR
+from src.renderer import Renderer, TemplateSpec
+from src.animation import render_animation, save_animation
+from src.diagnostics import memory_report, format_memory
+from src.profiling import PROFILER, write_profile
+from src.scheduler import RenderScheduler
+from src.utils import load_emoji_pack, open_image, open_asset, load_font
 from src.ui.batch_panel import create_batch_panel, add_batch_group, update_batch_treeview
 from src.ui.left_panel import create_left_panel
 from src.ui.center_panel import create_center_panel
 from src.ui.right_panel import create_right_panel
 
 
-# --- Constantes ---
-SETTINGS_FILE = "settings.json"
-
-
 class TemplateGeneratorApp:
     def __init__(self, root):
         self.root = root
@@ -63,6 +64,13 @@ class TemplateGeneratorApp:
         self.apply_to_all_style = tk.IntVar(value=0)
 
         self.preview_tk = None
+        self.preview_item = None
+        self._preview_placeholder = None
+        self._renderer = None
+        # Vista previa, miniaturas y lote comparten hilos; la vista previa va primero
+        self.scheduler = RenderScheduler()
+        self._preview_seq = 0
+        self._preview_shown = 0
         
         # Lista para almacenar grupos de imágenes para procesamiento por lotes
         self.batch_groups = []
@@ -84,12 +92,18 @@ class TemplateGeneratorApp:
 
     def on_closing(self):
         """Guardar configuración al cerrar y salir."""
+        if getattr(self, 'watcher', None):
+            self.watcher.stop()
+        if getattr(self, 'thumb_worker', None):
+            self.thumb_worker.stop()
+        self.scheduler.stop()
+        PROFILER.stop()
         self.save_settings()
         self.root.destroy()
     
-    def save_settings(self):
-        """Guarda la configuración actual en un archivo JSON."""
-        settings = {
+    def get_current_settings(self):
+        """Devuelve la configuración actual de la UI como diccionario."""
+        return {
             "title_text": self.title_text.get(),
             "font_family": self.font_family.get(),
             "title_style": self.title_style.get(),
@@ -104,8 +118,27 @@ class TemplateGeneratorApp:
             "n_slots": self.n_slots,
             "bg_img_path": self.bg_img_path,
             "logo_img_path": self.logo_img_path,
-            "batch_groups": self.batch_groups,
         }
+
+    def get_renderer(self):
+        """
+        Renderer de los recursos actuales (fondo, logo y emojis). Se crea de
+        nuevo cuando alguno cambia, así sus cachés nunca quedan desactualizadas.
+        """
+        resources = (self.bg_img, self.logo_img, self.current_emojis)
+        if self._renderer is None or any(a is not b for a, b in zip(self._renderer_resources, resources)):
+            self._renderer = Renderer(self.bg_img, self.logo_img, self.current_emojis)
+            self._renderer_resources = resources
+        return self._renderer
+
+    def get_template_spec(self, size):
+        """TemplateSpec con la configuración actual de la UI."""
+        return TemplateSpec.from_settings(self.get_current_settings(), size)
+
+    def save_settings(self):
+        """Guarda la configuración actual en un archivo JSON."""
+        settings = self.get_current_settings()
+        settings["batch_groups"] = self.batch_groups
         try:
             with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
                 json.dump(settings, f, indent=4, ensure_ascii=False)
@@ -135,11 +168,11 @@ class TemplateGeneratorApp:
 
             self.bg_img_path = settings.get("bg_img_path")
             if self.bg_img_path and os.path.exists(self.bg_img_path):
-                self.bg_img = Image.open(self.bg_img_path).convert("RGBA")
+                self.bg_img = open_asset(self.bg_img_path)
             
             self.logo_img_path = settings.get("logo_img_path")
             if self.logo_img_path and os.path.exists(self.logo_img_path):
-                self.logo_img = Image.open(self.logo_img_path).convert("RGBA")
+                self.logo_img = open_asset(self.logo_img_path)
             
             self.batch_groups = settings.get("batch_groups", [])
 
@@ -159,7 +192,7 @@ class TemplateGeneratorApp:
 
     def update_emoji_packs(self):
         """Escanea el directorio de emojis y actualiza el selector de paquetes."""
-        packs_path = "assets/emojis"
+        packs_path = EMOJIS_DIR
         if not os.path.exists(packs_path):
             self.emoji_pack_selector['values'] = ["default"]
             return
@@ -179,23 +212,7 @@ class TemplateGeneratorApp:
 
     def load_current_emojis(self):
         """Carga los emojis del paquete actualmente seleccionado."""
-        pack_name = self.emoji_pack.get()
-        emojis_path = os.path.join("assets/emojis", pack_name)
-        self.current_emojis = []
-
-        if not os.path.exists(emojis_path):
-            print(f"Advertencia: No se encontró el paquete de emojis '{pack_name}'")
-            return
-            
-        emoji_files = sorted([f for f in os.listdir(emojis_path) if f.endswith(".png")])
-        
-        for filename in emoji_files:
-            try:
-                path = os.path.join(emojis_path, filename)
-                emoji_img = Image.open(path).convert("RGBA")
-                self.current_emojis.append(emoji_img)
-            except Exception as e:
-                print(f"Error al cargar emoji {filename} del paquete {pack_name}: {e}")
+        self.current_emojis = load_emoji_pack(self.emoji_pack.get())
 
     def on_emoji_pack_change(self, event=None):
         """Se llama cuando el paquete de emojis cambia."""
@@ -310,7 +327,7 @@ class TemplateGeneratorApp:
             if slot >= SLOT_MAX:
                 break
             try:
-                self.slots[slot] = Image.open(p).convert("RGBA")
+                self.slots[slot] = open_image(p)
                 self.slot_labels[slot].config(text="✓ Cargada", style='Success.TLabel')
                 self.slot_buttons[slot].config(text=f"📁 Cambiar {slot+1}")
             except Exception as e:
@@ -336,7 +353,7 @@ class TemplateGeneratorApp:
         p = filedialog.askopenfilename(title="Selecciona fondo", filetypes=[("Imágenes", "*.png *.jpg *.jpeg *.webp *.bmp")])
         if p:
             try:
-                self.bg_img = Image.open(p).convert("RGBA")
+                self.bg_img = open_asset(p)
                 self.bg_img_path = p
                 self.bg_label.config(text="✓ Fondo cargado", style='Success.TLabel')
             except Exception as e:
@@ -347,7 +364,7 @@ class TemplateGeneratorApp:
         p = filedialog.askopenfilename(title="Selecciona logo", filetypes=[("Imágenes", "*.png *.jpg *.jpeg *.webp *.bmp")])
         if p:
             try:
-                self.logo_img = Image.open(p).convert("RGBA")
+                self.logo_img = open_asset(p)
                 self.logo_img_path = p
                 self.logo_label.config(text="✓ Logo cargado", style='Success.TLabel')
             except Exception as e:
@@ -372,6 +389,34 @@ class TemplateGeneratorApp:
             
             self.render_preview()
 
+    def show_memory_report(self):
+        """Muestra cuánta memoria retienen las imágenes y cachés de la sesión."""
+        report = memory_report(app=self)
+        print(format_memory(report))
+        messagebox.showinfo("Memoria", format_memory(report))
+
+    def toggle_profiler(self):
+        """Empieza o termina el perfil de los renders (vista previa, miniaturas y lote)."""
+        if not PROFILER.enabled:
+            PROFILER.start()
+            self.profile_button.config(text="⏹️ Terminar Perfil")
+            return
+        data = PROFILER.stop()
+        self.profile_button.config(text="⏱️ Perfilar")
+        if not data.renders:
+            messagebox.showinfo("Perfil", "No se renderizó nada mientras el perfil estaba activo.")
+            return
+        summary = data.summary(limit=10)
+        print(summary)
+        folder = filedialog.askdirectory(title="Carpeta donde guardar el perfil")
+        if folder:
+            try:
+                paths = write_profile(data, folder)
+                summary += "\n\nGuardado en:\n" + "\n".join(paths)
+            except OSError as e:
+                messagebox.showerror("Error", f"No se pudo guardar el perfil: {e}")
+        messagebox.showinfo("Perfil", summary)
+
     def on_drop(self, event):
         paths = self.root.splitlist(event.data)
         
@@ -412,7 +457,7 @@ class TemplateGeneratorApp:
                 for i in range(SLOT_MAX):
                     if self.slots[i] is None:
                         try:
-                            self.slots[i] = Image.open(p).convert("RGBA")
+                            self.slots[i] = open_image(p)
                             self.slot_labels[i].config(text="✓ Cargada", style='Success.TLabel')
                             break
                         except Exception as e:
@@ -420,46 +465,60 @@ class TemplateGeneratorApp:
             self.render_preview()
 
     def render_preview(self):
-        """Renderizar vista previa"""
-        try:
-            slots_count = self.n_slots
-            imgs = [s for s in self.slots[:slots_count] if s is not None]
-            
-            while len(imgs) < slots_count:
-                placeholder = Image.new("RGBA", (300, 300), (80, 80, 90, 255))
-                from PIL import ImageDraw
-                from src.utils import load_font
-                draw = ImageDraw.Draw(placeholder)
-                fnt = load_font('arial_bold', 120)
-                bbox = draw.textbbox((0, 0), "?", font=fnt)
-                tw = bbox[2] - bbox[0]
-                th = bbox[3] - bbox[1]
-                draw.text((150 - tw//2, 150 - th//2), "?", fill=(200, 200, 200), font=fnt)
-                imgs.append(placeholder)
-            
-            emojis = self.current_emojis[:slots_count]
-            
-            preview = compose_template(
-                CANVAS_SIZE, self.bg_img, imgs, emojis, self.title_text.get(), self.logo_img,
-                font_family=self.font_family.get(),
-                title_style=self.title_style.get(),
-                image_shape=self.image_shape.get(),
-                logo_size=self.logo_size.get(),
-                logo_x=self.logo_x.get(),
-                logo_y=self.logo_y.get(),
-                num_slots=slots_count,
-                emoji_size=self.emoji_size.get(),
-                emoji_x_offset=self.emoji_x_offset.get(),
-                emoji_y_offset=self.emoji_y_offset.get()
-            )
-            
-            self.preview_tk = ImageTk.PhotoImage(preview)
-            self.preview_canvas.delete("all")
-            self.preview_canvas.create_image(CANVAS_SIZE[0]//2, CANVAS_SIZE[1]//2, image=self.preview_tk)
-        except Exception as e:
-            messagebox.showerror("Error en preview", str(e))
+        """
+        Pide la vista previa al planificador (prioridad máxima). Si llegan
+        pedidos más rápido de lo que se renderizan, solo se atiende el último.
+        """
+        slots_count = self.n_slots
+        imgs = [s for s in self.slots[:slots_count] if s is not None]
+
+        while len(imgs) < slots_count:
+            imgs.append(self.get_preview_placeholder())
+
+        self._preview_seq += 1
+        seq = self._preview_seq
+        # El lienzo RGBA ya es opaco: se copia directo a la PhotoImage sin convertirlo
+        future = self.scheduler.submit("preview", self.get_renderer().render,
+                                       self.get_template_spec(CANVAS_SIZE), imgs, output_mode="RGBA")
+        future.add_done_callback(
+            lambda f: None if f.cancelled() else self.root.after(0, self._on_preview_done, seq, f))
+
+    def _on_preview_done(self, seq, future):
+        """Muestra una vista previa terminada (en el hilo de la UI) salvo que ya haya una más nueva."""
+        if seq <= self._preview_shown:
+            return
+        self._preview_shown = seq
+        error = future.exception()
+        if error is not None:
+            messagebox.showerror("Error en preview", str(error))
             import traceback
-            traceback.print_exc()
+            traceback.print_exception(type(error), error, error.__traceback__)
+            return
+        self.show_preview(future.result())
+
+    def get_preview_placeholder(self):
+        """Recuadro '?' de los slots vacíos de la vista previa (se crea una sola vez)."""
+        if self._preview_placeholder is None:
+            placeholder = Image.new("RGBA", (300, 300), (80, 80, 90, 255))
+            draw = ImageDraw.Draw(placeholder)
+            fnt = load_font('arial_bold', 120)
+            bbox = draw.textbbox((0, 0), "?", font=fnt)
+            tw = bbox[2] - bbox[0]
+            th = bbox[3] - bbox[1]
+            draw.text((150 - tw//2, 150 - th//2), "?", fill=(200, 200, 200), font=fnt)
+            self._preview_placeholder = placeholder
+        return self._preview_placeholder
+
+    def show_preview(self, preview):
+        """
+        Muestra la vista previa. La PhotoImage y el ítem del canvas se crean
+        una sola vez; en cada render solo se copian los píxeles.
+        """
+        if self.preview_tk is None:
+            self.preview_tk = ImageTk.PhotoImage("RGBA", CANVAS_SIZE)
+            self.preview_item = self.preview_canvas.create_image(
+                CANVAS_SIZE[0]//2, CANVAS_SIZE[1]//2, image=self.preview_tk)
+        self.preview_tk.paste(preview)
 
     def generate_and_save(self):
         """Generar y guardar plantilla final"""
@@ -470,22 +529,8 @@ class TemplateGeneratorApp:
             messagebox.showerror("Error", f"Faltan imágenes. Necesitas {slots_count}.")
             return
         
-        emojis = self.current_emojis[:slots_count]
-        
         try:
-            out = compose_template(
-                FINAL_SIZE, self.bg_img, imgs, emojis, self.title_text.get(), self.logo_img,
-                font_family=self.font_family.get(),
-                title_style=self.title_style.get(),
-                image_shape=self.image_shape.get(),
-                logo_size=self.logo_size.get(),
-                logo_x=self.logo_x.get(),
-                logo_y=self.logo_y.get(),
-                num_slots=slots_count,
-                emoji_size=self.emoji_size.get(),
-                emoji_x_offset=self.emoji_x_offset.get(),
-                emoji_y_offset=self.emoji_y_offset.get()
-            )
+            out = self.get_renderer().render(self.get_template_spec(FINAL_SIZE), imgs)
             
             path = filedialog.asksaveasfilename(
                 defaultextension=".png",
@@ -513,6 +558,36 @@ class TemplateGeneratorApp:
             import traceback
             traceback.print_exc()
 
+    def generate_animation(self):
+        """Generar y guardar la plantilla animada (GIF, WebP o APNG)"""
+        slots_count = self.n_slots
+        imgs = [s for s in self.slots[:slots_count] if s is not None]
+        
+        if len(imgs) < slots_count:
+            messagebox.showerror("Error", f"Faltan imágenes. Necesitas {slots_count}.")
+            return
+        
+        path = filedialog.asksaveasfilename(
+            defaultextension=".webp",
+            filetypes=[("WebP animado", "*.webp"), ("GIF", "*.gif"), ("APNG", "*.png")],
+            initialfile="plantilla_animada.webp"
+        )
+        if not path:
+            return
+        
+        try:
+            spec = self.get_template_spec(FINAL_SIZE)
+            frames, _ = render_animation(
+                FINAL_SIZE, self.bg_img, imgs, self.current_emojis[:slots_count],
+                spec.title_text, self.logo_img, num_slots=slots_count, **spec.compose_kwargs()
+            )
+            save_animation(frames, path)
+            messagebox.showinfo("✅ Éxito", f"Animación guardada en:\n{path}")
+        except Exception as e:
+            messagebox.showerror("Error al guardar", f"Error al guardar la animación:\n{str(e)}")
+            import traceback
+            traceback.print_exc()
+
 
 def main():
     """Función principal"""
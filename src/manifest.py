@@ -0,0 +1,169 @@
+"""
+manifest.py
+Manifiesto de un lote: registra el estado y la salida de cada grupo a medida
+que avanza, para poder reanudar un lote interrumpido sin repetir trabajo.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from src.bundles import emoji_pack_sources
+from src.disk_cache import file_stamp
+
+
+MANIFEST_NAME = "lote_manifest.jsonl"
+ARCHIVE_MANIFEST_NAME = "lote_manifest.json"   # Manifiesto consolidado dentro de un ZIP/TAR
+FSYNC_EVERY = 20            # Registros entre sincronizaciones a disco
+
+
+def group_fingerprint(group):
+    """Huella de la configuración de un grupo (cambia si se edita el grupo)."""
+    data = json.dumps(group, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+def _stamp(path):
+    try:
+        return file_stamp(path)
+    except OSError:
+        return f"{path}:missing"
+
+
+def shared_fingerprint(settings, final_size):
+    """
+    Huella de lo que comparten todos los grupos del lote: tamaño de salida,
+    fondo, logo y cada imagen del paquete de emojis (ruta, fecha y tamaño).
+    """
+    settings = settings or {}
+    parts = [f"{final_size[0]}x{final_size[1]}"]
+    for key in ("bg_img_path", "logo_img_path"):
+        parts.append(_stamp(settings[key]) if settings.get(key) else "")
+    pack = settings.get("emoji_pack", "default")
+    parts += [pack] + [_stamp(p) for p in emoji_pack_sources(pack)]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def output_fingerprint(group, shared=""):
+    """
+    Huella de la imagen que genera un grupo: su configuración, cada imagen
+    de origen (ruta, fecha y tamaño) y los recursos compartidos (ver
+    shared_fingerprint). Si algo cambia, el grupo se vuelve a generar.
+    """
+    parts = [group_fingerprint(group), shared]
+    parts += [_stamp(p) for p in group.get("paths", [])[:group.get("count", len(group.get("paths", [])))]]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class BatchManifest:
+    """
+    Diario de un lote en formato JSON Lines.
+
+    La primera línea describe el lote (run_id y total de grupos); cada línea
+    siguiente registra el resultado de un grupo. Al añadir solo una línea por
+    grupo, guardar el progreso cuesta lo mismo con 10 grupos que con 10.000.
+    Una línea incompleta por un cierre abrupto simplemente se ignora.
+
+    'shared' es la huella de los recursos del lote (ver shared_fingerprint):
+    entra en la huella de cada grupo registrado.
+    """
+
+    def __init__(self, path, run_id, total, entries=None):
+        self.path = path
+        self.run_id = run_id
+        self.total = total
+        self.entries = entries or {}
+        self.shared = ""
+        self._file = None
+        self._unsynced = 0
+
+    @classmethod
+    def load(cls, output_dir):
+        """Lee el manifiesto de una carpeta, o devuelve None si no existe."""
+        path = os.path.join(output_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        header, entries = None, {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if header is None:
+                    header = record
+                elif "index" in record:
+                    entries[record["index"]] = record
+        if not header or "run_id" not in header:
+            return None
+        return cls(path, header["run_id"], header.get("total", 0), entries)
+
+    @classmethod
+    def create(cls, total):
+        """Manifiesto solo en memoria (p. ej. para guardarlo dentro de un ZIP/TAR)."""
+        return cls(None, datetime.now().strftime("%Y%m%d%H%M%S"), total)
+
+    @classmethod
+    def open(cls, output_dir, total, resume=False):
+        """
+        Abre el manifiesto del lote en output_dir.
+
+        Con resume=True continúa el lote anterior (mismo run_id y mismos
+        nombres de archivo); si no, empieza uno nuevo y reemplaza el anterior.
+        """
+        manifest = cls.load(output_dir) if resume else None
+        if manifest is None:
+            run_id = datetime.now().strftime("%Y%m%d%H%M%S")
+            manifest = cls(os.path.join(output_dir, MANIFEST_NAME), run_id, total)
+            with open(manifest.path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"run_id": run_id, "total": total,
+                                    "created": datetime.now().isoformat(timespec="seconds")}) + "\n")
+        manifest.total = total
+        manifest._file = open(manifest.path, "a", encoding="utf-8")
+        return manifest
+
+    def output_name(self, index):
+        """Nombre estable del archivo del grupo index (igual al reanudar)."""
+        return f"plantilla_lote_{self.run_id}_{index + 1}.png"
+
+    def is_done(self, index, group, output_dir):
+        """True si el grupo ya se generó con esta misma configuración, imágenes y recursos."""
+        entry = self.entries.get(index)
+        return bool(
+            entry and entry.get("status") == "done"
+            and entry.get("fingerprint") == output_fingerprint(group, self.shared)
+            and os.path.exists(os.path.join(output_dir, entry["output"]))
+        )
+
+    def record(self, index, status, group=None, output=None, error=None):
+        """Registra el resultado de un grupo ('done', 'failed' o 'skipped')."""
+        entry = {"index": index, "status": status, "output": output, "error": error,
+                 "fingerprint": output_fingerprint(group, self.shared) if group is not None else None}
+        self.entries[index] = entry
+        if self._file:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= FSYNC_EVERY:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def summary(self):
+        """Cuenta de grupos por estado."""
+        counts = {"done": 0, "failed": 0, "skipped": 0}
+        for entry in self.entries.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        counts["pending"] = max(0, self.total - sum(counts.values()))
+        return counts
+
+    def to_dict(self):
+        """Manifiesto consolidado (última entrada de cada grupo)."""
+        return {"run_id": self.run_id, "total": self.total,
+                "groups": [self.entries[i] for i in sorted(self.entries)]}
+
+    def close(self):
+        if self._file:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
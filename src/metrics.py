@@ -0,0 +1,211 @@
+"""
+metrics.py
+Métricas de rendimiento: contadores e histogramas de renders, duración de
+cada etapa, codificación, aciertos de las cachés, bytes leídos y escritos y
+fallos. Se exportan como informe JSON de cada lote y en formato de texto de
+Prometheus (archivo al final del lote o endpoint /metrics del servicio),
+para comparar el rendimiento entre versiones.
+
+El registro METRICS es global del proceso y seguro entre hilos. Para medir
+un tramo concreto (un lote, una petición) se toma snapshot() al empezar y
+delta() al terminar.
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from src.config import METRICS_BUCKETS, METRICS_PREFIX
+
+# Descripción de cada métrica (líneas HELP de Prometheus)
+METRIC_HELP = {
+    "renders_total": "Renders completados",
+    "render_seconds": "Duración de cada render",
+    "stage_seconds": "Duración de cada etapa del render (load, prepare, compose, encode)",
+    "cache_requests_total": "Consultas a las cachés por resultado (hit, miss)",
+    "source_bytes_read_total": "Bytes de imágenes de origen leídos de disco",
+    "output_bytes_written_total": "Bytes de imágenes generadas escritos",
+    "batch_groups_total": "Grupos de lote por estado (done, failed, skipped)",
+    "requests_total": "Peticiones al servicio por código de estado",
+}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Metrics:
+    """Registro de contadores e histogramas con etiquetas."""
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}        # clave -> [cuentas por cubeta..., suma, total]
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """Suma 'value' al contador 'name' con esas etiquetas."""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Registra un valor (segundos) en el histograma 'name'."""
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += value
+            hist[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Mide la duración del bloque en el histograma 'name' (también si falla)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Copia del estado (se puede enviar entre procesos)."""
+        with self._lock:
+            return {"counters": dict(self._counters),
+                    "histograms": {key: list(hist) for key, hist in self._histograms.items()}}
+
+    def delta(self, before):
+        """Nuevo registro con lo acumulado desde el snapshot 'before'."""
+        now = self.snapshot()
+        result = Metrics(self.buckets)
+        for key, value in now["counters"].items():
+            diff = value - before["counters"].get(key, 0)
+            if diff:
+                result._counters[key] = diff
+        for key, hist in now["histograms"].items():
+            old = before["histograms"].get(key, [0] * len(hist))
+            diff = [a - b for a, b in zip(hist, old)]
+            if diff[-1]:
+                result._histograms[key] = diff
+        return result
+
+    def merge(self, snapshot):
+        """Suma al registro un snapshot (p. ej. lo medido en un proceso worker)."""
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, hist in snapshot["histograms"].items():
+                mine = self._histograms.setdefault(key, [0] * len(hist))
+                for i, value in enumerate(hist):
+                    mine[i] += value
+
+    def counter(self, name, **labels):
+        """Suma del contador 'name' en todas las etiquetas que coincidan con 'labels'."""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(value for (n, key_labels), value in self._counters.items()
+                       if n == name and wanted <= set(key_labels))
+
+    def to_dict(self):
+        """Métricas en un diccionario apto para JSON."""
+        snapshot = self.snapshot()
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(snapshot["counters"].items())]
+        histograms = []
+        for (name, labels), hist in sorted(snapshot["histograms"].items()):
+            histograms.append({
+                "name": name, "labels": dict(labels), "count": hist[-1], "sum": round(hist[-2], 6),
+                "mean": round(hist[-2] / hist[-1], 6) if hist[-1] else None,
+                "buckets": {str(bound): count for bound, count in zip(self.buckets, hist)},
+            })
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        """Métricas en el formato de texto de Prometheus."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def header(name, kind):
+            lines.append(f"# HELP {prefix}{name} {METRIC_HELP.get(name, name)}")
+            lines.append(f"# TYPE {prefix}{name} {kind}")
+
+        last = None
+        for (name, labels), value in sorted(snapshot["counters"].items()):
+            if name != last:
+                header(name, "counter")
+                last = name
+            lines.append(f"{prefix}{name}{_labels(labels)} {value}")
+        for (name, labels), hist in sorted(snapshot["histograms"].items()):
+            if name != last:
+                header(name, "histogram")
+                last = name
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist):
+                cumulative += count
+                lines.append(f"{prefix}{name}_bucket{_labels(labels + (('le', repr(float(bound))),))} {cumulative}")
+            lines.append(f"{prefix}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {hist[-1]}")
+            lines.append(f"{prefix}{name}_sum{_labels(labels)} {hist[-2]:.6f}")
+            lines.append(f"{prefix}{name}_count{_labels(labels)} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+METRICS = Metrics()
+
+
+def cache_hit_rates(metrics):
+    """Proporción de aciertos de cada caché: {caché: tasa} (solo las consultadas)."""
+    rates = {}
+    for entry in metrics.to_dict()["counters"]:
+        if entry["name"] != "cache_requests_total":
+            continue
+        hits, total = rates.get(entry["labels"]["cache"], (0, 0))
+        if entry["labels"]["result"] == "hit":
+            hits += entry["value"]
+        rates[entry["labels"]["cache"]] = (hits, total + entry["value"])
+    return {cache: round(hits / total, 4) for cache, (hits, total) in sorted(rates.items()) if total}
+
+
+def run_report(metrics, started, duration, summary, run_id=None):
+    """
+    Informe JSON de un lote.
+
+    Args:
+        metrics: Registro con lo medido en el lote (ver Metrics.delta)
+        started: Hora de inicio (time.time())
+        duration: Segundos que duró
+        summary: Cuenta de grupos por estado (ver BatchManifest.summary)
+        run_id: Identificador del lote
+    """
+    rendered = metrics.counter("batch_groups_total", status="done")
+    return {
+        "run_id": run_id,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+        "duration_s": round(duration, 3),
+        "groups": summary,
+        "rendered": rendered,
+        "groups_per_s": round(rendered / duration, 3) if duration > 0 else None,
+        "bytes_read": metrics.counter("source_bytes_read_total"),
+        "bytes_written": metrics.counter("output_bytes_written_total"),
+        "cache_hit_rates": cache_hit_rates(metrics),
+        "metrics": metrics.to_dict(),
+    }
+
+
+def write_text_atomic(path, text):
+    """Escribe un archivo de texto sin dejarlo nunca a medias."""
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,123 @@
+"""
+preflight.py
+Verificación previa de un lote: revisa en paralelo todos los archivos que
+usará (slots, fondo, logo y emojis) leyendo solo la cabecera de cada imagen.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, UnidentifiedImageError
+from src.config import EMOJIS_DIR, PREFLIGHT_MAX_PIXELS, PREFLIGHT_WORKERS
+
+
+def inspect_image(path, max_pixels=PREFLIGHT_MAX_PIXELS):
+    """
+    Lee la cabecera de una imagen sin decodificar sus píxeles.
+
+    Devuelve un diccionario con status ('ok', 'missing', 'corrupt' u
+    'oversized'), tamaño, modo y memoria estimada para decodificarla.
+    """
+    info = {"path": path, "status": "ok", "size": None, "mode": None, "decode_bytes": 0, "error": None}
+    try:
+        with Image.open(path) as im:
+            w, h = im.size
+            bands = len(im.getbands())
+            info.update(size=(w, h), mode=im.mode)
+    except FileNotFoundError:
+        info.update(status="missing", error="No existe")
+        return info
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError) as e:
+        info.update(status="corrupt", error=str(e) or "No se pudo leer la cabecera")
+        return info
+    except Image.DecompressionBombError as e:
+        info.update(status="oversized", error=str(e))
+        return info
+
+    # Decodificación en su modo original más la copia RGBA que hace el programa
+    info["decode_bytes"] = w * h * (bands + 4)
+    if w * h > max_pixels:
+        info.update(status="oversized", error=f"{w}x{h} supera {max_pixels:,} píxeles")
+    return info
+
+
+def _emoji_pack_paths(pack_name):
+    pack_dir = os.path.join(EMOJIS_DIR, pack_name)
+    if not os.path.isdir(pack_dir):
+        return []
+    return [os.path.join(pack_dir, f) for f in sorted(os.listdir(pack_dir)) if f.endswith(".png")]
+
+
+def preflight_batch(groups, settings, max_pixels=PREFLIGHT_MAX_PIXELS, workers=PREFLIGHT_WORKERS):
+    """
+    Verifica todos los archivos de un lote antes de iniciarlo.
+
+    Args:
+        groups: Lista de grupos del lote
+        settings: Configuración con bg_img_path, logo_img_path y emoji_pack
+        max_pixels: Límite de píxeles por imagen
+        workers: Hilos usados para leer las cabeceras
+
+    Returns:
+        Diccionario con el detalle por archivo, los índices de los grupos
+        con problemas y la memoria estimada de decodificación.
+    """
+    start = time.perf_counter()
+
+    shared = {}
+    for key in ("bg_img_path", "logo_img_path"):
+        if settings.get(key):
+            shared[settings[key]] = key
+    for path in _emoji_pack_paths(settings.get("emoji_pack", "default")):
+        shared[path] = "emoji_pack"
+
+    # Cada archivo se revisa una sola vez aunque aparezca en varios grupos
+    unique_paths = list(dict.fromkeys([p for g in groups for p in g["paths"]] + list(shared)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        files = dict(zip(unique_paths, pool.map(lambda p: inspect_image(p, max_pixels), unique_paths)))
+
+    bad_groups = {}
+    peak_group_bytes = 0
+    for i, group in enumerate(groups):
+        problems = [files[p] for p in group["paths"] if files[p]["status"] != "ok"]
+        if len(group["paths"]) != group["count"]:
+            problems.append({"path": None, "status": "corrupt", "error": "El grupo no tiene 'count' rutas"})
+        if problems:
+            bad_groups[i] = problems
+        peak_group_bytes = max(peak_group_bytes, sum(files[p]["decode_bytes"] for p in group["paths"]))
+
+    shared_problems = [files[p] for p in shared if files[p]["status"] != "ok"]
+    shared_bytes = sum(files[p]["decode_bytes"] for p in shared)
+
+    return {
+        "files": files,
+        "bad_groups": bad_groups,
+        "shared_problems": shared_problems,
+        "missing": [p for p, f in files.items() if f["status"] == "missing"],
+        "corrupt": [p for p, f in files.items() if f["status"] == "corrupt"],
+        "oversized": [p for p, f in files.items() if f["status"] == "oversized"],
+        "decode_bytes_total": sum(f["decode_bytes"] for f in files.values()),
+        "decode_bytes_peak": peak_group_bytes + shared_bytes,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def format_report(report, max_lines=10):
+    """Resumen legible del resultado de preflight_batch."""
+    mb = 1024 * 1024
+    lines = [
+        f"Archivos revisados: {len(report['files'])} en {report['elapsed_ms']:.0f} ms",
+        f"Faltantes: {len(report['missing'])} · Dañados: {len(report['corrupt'])} · "
+        f"Demasiado grandes: {len(report['oversized'])}",
+        f"Memoria estimada: {report['decode_bytes_peak'] / mb:.0f} MB por grupo "
+        f"({report['decode_bytes_total'] / mb:.0f} MB en total)",
+    ]
+    if report["bad_groups"]:
+        lines.append(f"Grupos con problemas: {len(report['bad_groups'])}")
+        for i, problems in list(report["bad_groups"].items())[:max_lines]:
+            for problem in problems:
+                name = os.path.basename(problem["path"]) if problem["path"] else "-"
+                lines.append(f"  Grupo {i + 1}: {name} ({problem['error']})")
+    for problem in report["shared_problems"]:
+        lines.append(f"  Recurso compartido: {os.path.basename(problem['path'])} ({problem['error']})")
+    return "\n".join(lines)
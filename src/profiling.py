@@ -0,0 +1,275 @@
+"""
+profiling.py
+Perfilado de renders: mientras el perfilador está activo, cada llamada a
+Renderer.render se mide por muestreo de pilas y, en modo "cprofile",
+también con cProfile. Los resultados de todos los renders (y de todos los
+procesos worker) se suman en un ProfileData que se guarda como:
+
+- perfil.txt: resumen con las funciones que más tiempo se llevan
+- perfil.collapsed: pilas colapsadas ("a;b;c muestras"), el formato que
+  leen flamegraph.pl, inferno o speedscope
+- perfil.pstats: volcado de pstats (solo modo cprofile), para abrirlo con
+  'python -m pstats' o snakeviz
+
+Con el perfil activo las capas de cada render se preparan en el hilo que
+renderiza: así todo el trabajo del render cae en su pila.
+"""
+
+import os
+import io
+import sys
+import time
+import glob
+import marshal
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from src.config import (
+    PROFILE_MODES, PROFILE_SAMPLE_INTERVAL, PROFILE_TOP_FUNCTIONS,
+    PROFILE_TEXT_NAME, PROFILE_COLLAPSED_NAME, PROFILE_PSTATS_NAME
+)
+from src.metrics import write_text_atomic
+
+PART_PATTERN = "perfil_*.part"      # Perfiles parciales de los procesos worker
+
+
+class ProfileData:
+    """Resultado de un perfil. Se pueden sumar los de varios procesos (ver snapshot y merge)."""
+
+    def __init__(self, mode=PROFILE_MODES[0], interval=PROFILE_SAMPLE_INTERVAL):
+        self.mode = mode
+        self.interval = interval
+        self.renders = 0
+        self.seconds = 0.0              # Tiempo total dentro de los renders
+        self.stacks = Counter()         # "raíz;...;hoja" -> muestras
+        self.stats = {}                 # Estadísticas de cProfile en el formato de pstats
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def add_stats(self, stats):
+        """Suma estadísticas de cProfile (Profile.stats) a las acumuladas."""
+        for func, stat in stats.items():
+            self.stats[func] = pstats.add_func_stats(self.stats.get(func, (0, 0, 0, 0, {})), stat)
+
+    def snapshot(self):
+        """Copia en tipos básicos (se puede enviar entre procesos o volcar con marshal)."""
+        return {"mode": self.mode, "interval": self.interval, "renders": self.renders,
+                "seconds": self.seconds, "stacks": dict(self.stacks), "stats": dict(self.stats)}
+
+    def merge(self, snapshot):
+        """Suma un snapshot (p. ej. el perfil de un proceso worker)."""
+        if snapshot["mode"] == "cprofile":
+            self.mode = "cprofile"
+        self.renders += snapshot["renders"]
+        self.seconds += snapshot["seconds"]
+        self.stacks.update(snapshot["stacks"])
+        self.add_stats(snapshot["stats"])
+
+    def top_functions(self, limit=PROFILE_TOP_FUNCTIONS):
+        """
+        Funciones con más muestras propias (la hoja de la pila).
+
+        Returns:
+            Lista de (función, muestras propias, muestras incluyendo lo que llama)
+        """
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        return [(frame, count, total[frame]) for frame, count in own.most_common(limit)]
+
+    def collapsed(self):
+        """Pilas en formato colapsado, una por línea."""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def summary(self, limit=PROFILE_TOP_FUNCTIONS):
+        """Resumen legible: funciones más costosas por muestreo y, si hay, las de cProfile."""
+        samples = self.samples
+        lines = [f"Perfil de {self.renders} renders ({self.seconds:.2f} s renderizando), modo {self.mode}",
+                 f"{samples} muestras cada {self.interval * 1000:.0f} ms"]
+        if samples:
+            lines += ["", "Funciones con más tiempo propio (muestreo):", f"{'propio':>8} {'total':>7}  función"]
+            lines += [f"{own / samples:>8.1%} {total / samples:>7.1%}  {frame}"
+                      for frame, own, total in self.top_functions(limit)]
+        if self.stats:
+            buffer = io.StringIO()
+            stats = pstats.Stats(_Loaded(self.stats), stream=buffer)
+            stats.strip_dirs().sort_stats("cumulative").print_stats(limit)
+            lines += ["", "cProfile (ordenado por tiempo acumulado):", buffer.getvalue().strip("\n")]
+        return "\n".join(lines)
+
+
+class _Loaded:
+    """Estadísticas ya sumadas con la interfaz de cProfile.Profile que espera pstats.Stats."""
+
+    def __init__(self, stats):
+        self.stats = dict(stats)
+
+    def create_stats(self):
+        pass
+
+
+class _Capture:
+    """Perfil de un render en el hilo actual (ver RenderProfiler.capture)."""
+
+    __slots__ = ("profiler", "data", "thread_id", "nested", "profile", "start")
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        profiler = self.profiler
+        self.data = profiler.data
+        self.thread_id = threading.get_ident()
+        self.profile = None
+        with profiler._lock:
+            # Un render dentro de otro ya queda en la pila del de fuera
+            self.nested = self.thread_id in profiler._roots
+            if not self.nested:
+                profiler._roots[self.thread_id] = sys._getframe(1)
+        if not self.nested and self.data.mode == "cprofile":
+            self.profile = cProfile.Profile()
+            try:
+                self.profile.enable()
+            except ValueError:
+                # Desde Python 3.12 solo puede haber un cProfile activo por proceso
+                self.profile = None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.start
+        if self.nested:
+            return False
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.create_stats()
+        with self.profiler._lock:
+            self.profiler._roots.pop(self.thread_id, None)
+            self.data.renders += 1
+            self.data.seconds += elapsed
+            if self.profile is not None:
+                self.data.add_stats(self.profile.stats)
+        return False
+
+
+class RenderProfiler:
+    """
+    Perfilador de los renders del proceso.
+
+    Uso: start(), los renders que se hagan mientras tanto (en cualquier
+    hilo) y stop(), que devuelve el ProfileData. Inactivo no cuesta nada:
+    Renderer.render solo comprueba 'enabled'.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.data = None
+        self._roots = {}                # Hilo -> frame del render que se está perfilando
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self, mode=PROFILE_MODES[0], interval=PROFILE_SAMPLE_INTERVAL):
+        """Empieza un perfil nuevo ("sample" o "cprofile", ver PROFILE_MODES)."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Modo de perfil desconocido: {mode} (usa {', '.join(PROFILE_MODES)})")
+        with self._lock:
+            if self.enabled:
+                raise RuntimeError("El perfilador ya está activo")
+            self.data = ProfileData(mode, interval)
+            self._stop.clear()
+            self.enabled = True
+        self._sampler = threading.Thread(target=self._sample, args=(self.data,), name="profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        """Detiene el perfil y devuelve su ProfileData (None si no se había empezado)."""
+        with self._lock:
+            if not self.enabled:
+                return self.data
+            self.enabled = False
+        self._stop.set()
+        self._sampler.join()
+        return self.data
+
+    def capture(self):
+        """Contexto que perfila el render que lo abre (lo usa Renderer.render)."""
+        return _Capture(self)
+
+    def _sample(self, data):
+        labels = {}
+        while not self._stop.wait(data.interval):
+            with self._lock:
+                roots = list(self._roots.items())
+            if not roots:
+                continue
+            frames = sys._current_frames()
+            for thread_id, root in roots:
+                stack, frame = [], frames.get(thread_id)
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    stack.append(label)
+                    if frame is root:
+                        break
+                    frame = frame.f_back
+                else:
+                    continue            # El render terminó entre medias
+                stack.reverse()
+                with self._lock:
+                    data.stacks[";".join(stack)] += 1
+
+
+PROFILER = RenderProfiler()
+
+
+def write_profile(data, output_dir):
+    """
+    Guarda el resumen, las pilas colapsadas y (en modo cprofile) el volcado
+    de pstats en output_dir.
+
+    Returns:
+        Rutas escritas
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, PROFILE_TEXT_NAME), os.path.join(output_dir, PROFILE_COLLAPSED_NAME)]
+    write_text_atomic(paths[0], data.summary() + "\n")
+    write_text_atomic(paths[1], data.collapsed())
+    if data.stats:
+        paths.append(os.path.join(output_dir, PROFILE_PSTATS_NAME))
+        _write_marshal(paths[-1], data.stats)       # Mismo formato que pstats.Stats.dump_stats
+    return paths
+
+
+def save_part(data, directory):
+    """Guarda el perfil de este proceso para sumarlo después (ver merge_parts)."""
+    os.makedirs(directory, exist_ok=True)
+    _write_marshal(os.path.join(directory, PART_PATTERN.replace("*", str(os.getpid()))), data.snapshot())
+
+
+def merge_parts(directory):
+    """Suma y borra los perfiles parciales de los procesos worker (None si no hay)."""
+    data = None
+    for path in sorted(glob.glob(os.path.join(directory, PART_PATTERN))):
+        with open(path, "rb") as f:
+            snapshot = marshal.load(f)
+        if data is None:
+            data = ProfileData(snapshot["mode"], snapshot["interval"])
+        data.merge(snapshot)
+        os.remove(path)
+    return data
+
+
+def _write_marshal(path, value):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        marshal.dump(value, f)
+    os.replace(tmp_path, path)
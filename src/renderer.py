@@ -0,0 +1,298 @@
+"""
+renderer.py
+Motor de render reutilizable, independiente de la interfaz gráfica.
+
+Un Renderer guarda los recursos compartidos (fondo, logo y emojis) y todo lo
+que se calcula a partir de ellos: fondos escalados, logos y emojis ya
+redimensionados, slots recortados, layouts y títulos. Renderizar varias
+veces con el mismo Renderer solo recalcula lo que cambió. Es seguro usarlo
+desde varios hilos a la vez.
+
+La configuración de cada render es un TemplateSpec inmutable; un GroupSpec
+añade las rutas de las imágenes de un grupo del lote.
+"""
+
+import os
+import time
+import dataclasses
+from dataclasses import dataclass
+from PIL import Image
+from src.config import (
+    FINAL_SIZE, DEFAULT_SETTINGS, GROUP_SETTING_KEYS, TITLE_STYLES,
+    RENDER_IMAGE_CACHE, RENDER_LAYOUT_CACHE, RENDER_SOURCE_CACHE, RENDER_TITLE_CACHE
+)
+from src.composer import (
+    slot_boxes, title_layout, prepare_emoji_image, prepare_logo,
+    run_prepare_jobs, compose_layers, _resolve
+)
+from src.disk_cache import SOURCE_KEY, file_stamp
+from src.metrics import METRICS
+from src.profiling import PROFILER
+from src.utils import (
+    LRUCache, cover_resize, apply_shape_to_image, open_image, make_title_shadow, has_blurred_shadow
+)
+
+
+@dataclass(frozen=True)
+class TemplateSpec:
+    """Todo lo que define una plantilla salvo las imágenes."""
+
+    size: tuple = FINAL_SIZE
+    title_text: str = DEFAULT_SETTINGS["title_text"]
+    font_family: str = DEFAULT_SETTINGS["font_family"]
+    title_style: str = DEFAULT_SETTINGS["title_style"]
+    image_shape: str = DEFAULT_SETTINGS["image_shape"]
+    logo_size: float = DEFAULT_SETTINGS["logo_size"]
+    logo_x: float = DEFAULT_SETTINGS["logo_x"]
+    logo_y: float = DEFAULT_SETTINGS["logo_y"]
+    emoji_size: float = DEFAULT_SETTINGS["emoji_size"]
+    emoji_x_offset: float = DEFAULT_SETTINGS["emoji_x_offset"]
+    emoji_y_offset: float = DEFAULT_SETTINGS["emoji_y_offset"]
+
+    @classmethod
+    def from_settings(cls, settings, size=FINAL_SIZE, defaults=None):
+        """Crea la especificación a partir de un diccionario de configuración o de un grupo."""
+        defaults = defaults or DEFAULT_SETTINGS
+        values = {key: settings.get(key, defaults.get(key, DEFAULT_SETTINGS[key]))
+                  for key in GROUP_SETTING_KEYS}
+        return cls(size=tuple(size), **values)
+
+    def replace(self, **changes):
+        """Copia con algunos valores cambiados."""
+        return dataclasses.replace(self, **changes)
+
+    def to_settings(self):
+        """Diccionario con las claves de configuración de grupo."""
+        return {key: getattr(self, key) for key in GROUP_SETTING_KEYS}
+
+    def compose_kwargs(self):
+        """Argumentos con nombre de compose_template (y de las funciones compatibles)."""
+        return {key: getattr(self, key) for key in GROUP_SETTING_KEYS if key != "title_text"}
+
+
+@dataclass(frozen=True)
+class GroupSpec:
+    """Un grupo del lote: rutas de las imágenes y su plantilla."""
+
+    paths: tuple
+    template: TemplateSpec = TemplateSpec()
+
+    @classmethod
+    def from_group(cls, group, defaults=None, size=FINAL_SIZE):
+        """Crea la especificación a partir de un grupo guardado (ver make_group)."""
+        return cls(tuple(group["paths"][:group["count"]]),
+                   TemplateSpec.from_settings(group, size, defaults))
+
+    @property
+    def count(self):
+        return len(self.paths)
+
+    def to_group(self):
+        """Diccionario del grupo tal como se guarda en la configuración."""
+        return {"count": self.count, "paths": list(self.paths), **self.template.to_settings()}
+
+
+class Renderer:
+    """
+    Motor de render con recursos y cachés propios.
+
+    Los recursos (fondo, logo y emojis) no cambian durante la vida del
+    Renderer: si cambian, se crea uno nuevo.
+    """
+
+    def __init__(self, bg_img=None, logo_img=None, emojis=(),
+                 image_cache=RENDER_IMAGE_CACHE, layout_cache=RENDER_LAYOUT_CACHE):
+        self.bg_img = bg_img
+        self.logo_img = logo_img
+        self.emojis = tuple(emojis)
+        self._images = LRUCache(image_cache, "layers")
+        self._layouts = LRUCache(layout_cache, "layouts")
+        self._titles = LRUCache(RENDER_TITLE_CACHE, "titles")
+        self._sources = LRUCache(RENDER_SOURCE_CACHE, "sources")
+        self._pinned = {}           # Capas y layouts fijos (ver pin_layers), fuera de las cachés LRU
+
+    @classmethod
+    def from_assets(cls, assets):
+        """Crea un Renderer con el diccionario de load_batch_assets."""
+        return cls(assets.get("bg_img"), assets.get("logo_img"), assets.get("emojis", ()))
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Carga fondo, logo y paquete de emojis de la configuración."""
+        from src.batch import load_batch_assets
+        return cls.from_assets(load_batch_assets(settings))
+
+    def clear_caches(self):
+        for cache in (self._images, self._layouts, self._titles, self._sources):
+            cache.clear()
+
+    def cached_images(self):
+        """Imágenes que guarda el Renderer por categoría (ver diagnostics.memory_report)."""
+        categories = {"recursos": [self.bg_img, self.logo_img, *self.emojis]}
+        for key, value in self._images.items():
+            categories.setdefault(key[0], []).append(value)
+        categories["sombras de título"] = self._titles.values()
+        categories["imágenes decodificadas"] = self._sources.values()
+        categories["capas fijadas"] = list(self._pinned.values())
+        return categories
+
+    def static_layers(self, spec, count):
+        """
+        Capas que no dependen de las imágenes del grupo (fondo escalado,
+        logo y emojis propios) y el layout de 'count' slots, por clave de
+        caché. Se preparan (o se toman de la caché) en este Renderer.
+        """
+        size = tuple(spec.size)
+        boxes_key = ("boxes", size, count)
+        boxes = self._layouts.get_or_compute(boxes_key, lambda: slot_boxes(size, count))
+        layers = {boxes_key: boxes}
+        for _, cache_key, job in self._static_jobs(spec, size, boxes, list(self.emojis[:count]), True):
+            layers[cache_key] = self._images.get_or_compute(cache_key, lambda job=job: job[0](*job[1:]))
+        return layers
+
+    def pin_layers(self, layers):
+        """
+        Fija capas ya preparadas {clave: capa} (ver static_layers), p. ej.
+        vistas de memoria compartida entre procesos: se usan en lugar de
+        prepararlas y no salen nunca de la caché.
+        """
+        self._pinned.update(layers)
+
+    def _static_jobs(self, spec, size, boxes, emojis, own_emojis):
+        """(capa, clave de caché, trabajo) del fondo, los emojis de imagen y el logo."""
+        if self.bg_img:
+            yield "fondo", ("fondo", size), (cover_resize, self.bg_img, size)
+        for i, (x_img, y_img, size_img) in enumerate(boxes):
+            if i < len(emojis) and isinstance(emojis[i], Image.Image):
+                cache_key = ("emoji", i, size_img, spec.emoji_size) if own_emojis else None
+                yield ("emoji", i), cache_key, (prepare_emoji_image, emojis[i], size_img, spec.emoji_size)
+        if self.logo_img:
+            yield ("logo", ("logo", size, spec.logo_size, spec.logo_x, spec.logo_y),
+                   (prepare_logo, self.logo_img, size, spec.logo_size, spec.logo_x, spec.logo_y))
+
+    def _slot_key(self, img, shape, size_img):
+        # Solo las imágenes abiertas desde un archivo tienen una identidad estable
+        source = img.info.get(SOURCE_KEY)
+        return ("slot", source, img.size, img.mode, shape, size_img) if source else None
+
+    def render(self, spec, slots, emojis=None, parallel=True, output_mode="RGB"):
+        """
+        Renderiza una plantilla.
+
+        Args:
+            spec: TemplateSpec con el tamaño y el estilo
+            slots: Imágenes de los slots (None = placeholder)
+            emojis: Emojis por slot (imágenes o texto). Por defecto, los del Renderer
+            parallel: Preparar lo que no esté en caché en el pool de hilos compartido
+            output_mode: "RGB", o "RGBA" para recibir el lienzo sin copiarlo (vista previa)
+
+        Returns:
+            Imagen en output_mode
+        """
+        if not PROFILER.enabled:
+            return self._render(spec, slots, emojis, parallel, output_mode)
+        # Perfilando, las capas se preparan en este hilo para que caigan en su pila
+        with PROFILER.capture():
+            return self._render(spec, slots, emojis, False, output_mode)
+
+    def _render(self, spec, slots, emojis, parallel, output_mode):
+        start = time.perf_counter()
+        size = tuple(spec.size)
+        n = len(slots)
+        own_emojis = emojis is None
+        emojis = list(self.emojis[:n]) if own_emojis else list(emojis)
+        boxes = []
+        if n:
+            boxes = self._pinned.get(("boxes", size, n)) or self._layouts.get_or_compute(
+                ("boxes", size, n), lambda: slot_boxes(size, n))
+
+        # Lo que ya está en caché se usa directamente; el resto se prepara
+        layers, jobs, to_store = {}, {}, {}
+
+        def want(layer_key, cache_key, job, cache=self._images):
+            cached = None
+            if cache_key:
+                cached = self._pinned.get(cache_key)
+                if cached is None:
+                    cached = cache.get(cache_key)
+            if cached is not None:
+                layers[layer_key] = cached
+            else:
+                jobs[layer_key] = job
+                if cache_key:
+                    to_store[layer_key] = (cache, cache_key)
+
+        for i, (x_img, y_img, size_img) in enumerate(boxes):
+            if slots[i] is not None:
+                want(("slot", i), self._slot_key(slots[i], spec.image_shape, size_img),
+                     (apply_shape_to_image, slots[i], spec.image_shape, size_img, 30))
+        for layer_key, cache_key, job in self._static_jobs(spec, size, boxes, emojis, own_emojis):
+            want(layer_key, cache_key, job)
+
+        title = None
+        if spec.title_text.strip():
+            font_title, title_pos, title_text = self._layouts.get_or_compute(
+                ("title", size, spec.title_text, spec.font_family),
+                lambda: title_layout(size, spec.title_text, spec.font_family))
+            style = TITLE_STYLES.get(spec.title_style, TITLE_STYLES['simple'])
+            title = (title_text, font_title, title_pos, style)
+            if has_blurred_shadow(style):
+                want("title_shadow", title_key(spec),
+                     (make_title_shadow, title_text, title_pos, font_title, style, *size), self._titles)
+        layers.update(run_prepare_jobs(jobs, parallel))
+        prepared = time.perf_counter()
+
+        image = compose_layers(size, layers, boxes, emojis, title,
+                               spec.emoji_size, spec.emoji_x_offset, spec.emoji_y_offset, output_mode)
+        for layer_key, (cache, cache_key) in to_store.items():
+            cache.put(cache_key, _resolve(layers[layer_key]))
+        # En paralelo, 'prepare' solo cuenta el encolado: lo que espera a las capas cae en 'compose'
+        end = time.perf_counter()
+        METRICS.observe("stage_seconds", prepared - start, stage="prepare")
+        METRICS.observe("stage_seconds", end - prepared, stage="compose")
+        METRICS.observe("render_seconds", end - start)
+        METRICS.inc("renders_total")
+        return image
+
+    def render_group(self, group, parallel=True, keep=()):
+        """
+        Renderiza un GroupSpec abriendo sus imágenes.
+        Lanza ValueError si alguna imagen no se puede abrir.
+
+        Las rutas de 'keep' (las que vuelven a usarse en grupos siguientes)
+        se decodifican y se guardan en memoria para esos grupos; el resto se
+        abre sin decodificar y se cierra al terminar.
+        """
+        start = time.perf_counter()
+        slots, opened, failed = [], [], []
+        for path in group.paths:
+            try:
+                stamp = file_stamp(path)
+                img = self._sources.get(stamp)
+                if img is None and path in keep:
+                    img = self._sources.put(stamp, open_image(path))
+                    METRICS.inc("source_bytes_read_total", os.path.getsize(path))
+                if img is None:
+                    # Sin decodificar: si su recorte ya está en caché no hace falta leerla
+                    img = open_image(path, lazy=True)
+                    opened.append((path, img))
+                slots.append(img)
+            except Exception as e:
+                print(f"Error al cargar imagen del lote {path}: {e}")
+                failed.append(path)
+        METRICS.observe("stage_seconds", time.perf_counter() - start, stage="load")
+        try:
+            if failed:
+                raise ValueError(f"No se pudieron cargar: {', '.join(os.path.basename(p) for p in failed)}")
+            return self.render(group.template, slots, parallel=parallel)
+        finally:
+            for path, img in opened:
+                # Pillow suelta el archivo al decodificar: si sigue abierto, no se leyó
+                if getattr(img, "fp", None) is None:
+                    METRICS.inc("source_bytes_read_total", os.path.getsize(path))
+                img.close()
+
+
+def title_key(spec):
+    """Clave de la sombra difuminada del título: lo que cambia su raster."""
+    return (tuple(spec.size), spec.title_text, spec.font_family, spec.title_style)
@@ -0,0 +1,213 @@
+"""
+scheduler.py
+Planificador de renders de la aplicación: la vista previa, las miniaturas
+y el lote comparten los mismos hilos, pero cada clase de trabajo tiene su
+propia cola acotada y su prioridad.
+
+- preview: lo que el usuario está mirando. Solo importa el último pedido:
+  uno nuevo reemplaza al que aún espera.
+- thumbnail: miniaturas de las filas visibles. Se atienden las más
+  recientes primero y, si la cola se llena, se descartan las más viejas.
+- batch: grupos del lote. Nunca se descartan: si la cola está llena, quien
+  los envía espera.
+
+Los hilos de primer plano toman siempre primero la vista previa y después
+las miniaturas. El lote corre en hilos propios con menor prioridad del
+sistema operativo (en Linux), así un grupo a medio renderizar le deja casi
+todo el núcleo a la vista previa. Además el lote cede los núcleos mientras
+el usuario interactúa: no empieza grupos nuevos hasta SCHEDULER_BATCH_PAUSE
+segundos después del último pedido de vista previa.
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from src.config import (
+    SCHEDULER_WORKERS, SCHEDULER_BATCH_WORKERS, SCHEDULER_BATCH_NICE, SCHEDULER_QUEUE_LIMITS,
+    SCHEDULER_BATCH_PAUSE, SCHEDULER_LATENCY_SAMPLES
+)
+
+PRIORITIES = ("preview", "thumbnail", "batch")
+FOREGROUND = ("preview", "thumbnail")
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "key", "future", "submitted")
+
+    def __init__(self, fn, args, kwargs, key):
+        self.fn, self.args, self.kwargs, self.key = fn, args, kwargs, key
+        self.future = Future()
+        self.submitted = time.perf_counter()
+
+
+class RenderScheduler:
+    """
+    Hilos de primer plano (vista previa y miniaturas) y de lote, con una
+    cola acotada por clase de trabajo (ver PRIORITIES).
+
+    submit() devuelve un Future de concurrent.futures; los trabajos
+    descartados o reemplazados quedan cancelados.
+    """
+
+    def __init__(self, workers=SCHEDULER_WORKERS, batch_workers=SCHEDULER_BATCH_WORKERS, limits=None,
+                 batch_pause=SCHEDULER_BATCH_PAUSE):
+        self.limits = {**SCHEDULER_QUEUE_LIMITS, **(limits or {})}
+        self.batch_pause = batch_pause
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._latencies = {priority: deque(maxlen=SCHEDULER_LATENCY_SAMPLES) for priority in PRIORITIES}
+        self._last_interactive = float("-inf")
+        self._cond = threading.Condition()
+        self._stopped = False
+        lanes = [FOREGROUND] * max(1, workers) + [("batch",)] * max(1, batch_workers)
+        self._threads = [threading.Thread(target=self._run, args=(lane,), name=f"render-{i}", daemon=True)
+                         for i, lane in enumerate(lanes)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, priority, fn, *args, key=None, **kwargs):
+        """
+        Encola fn(*args, **kwargs) en la clase 'priority'.
+
+        Un trabajo con la misma 'key' que otro pendiente de su clase lo
+        reemplaza. Con la cola de lote llena, espera a que haya sitio.
+        """
+        job = _Job(fn, args, kwargs, key)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("El planificador está detenido")
+            queue = self._queues[priority]
+            if key is not None:
+                for old in [j for j in queue if j.key == key]:
+                    queue.remove(old)
+                    old.future.cancel()
+            if priority == "batch":
+                while len(queue) >= self.limits["batch"] and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    job.future.cancel()
+                    return job.future
+            else:
+                while len(queue) >= self.limits[priority]:
+                    queue.popleft().future.cancel()
+            if priority == "preview":
+                self._last_interactive = time.monotonic()
+            queue.append(job)
+            self._cond.notify_all()
+        return job.future
+
+    def map(self, priority, fn, items):
+        """
+        Genera (item, Future) en el orden de 'items', enviando trabajos por
+        adelantado mientras quepan en la cola de la clase: los siguientes
+        se renderizan mientras se procesa el resultado actual.
+        """
+        ahead = deque()
+        for item in items:
+            ahead.append((item, self.submit(priority, fn, item)))
+            while len(ahead) > self.limits[priority] or (ahead and ahead[0][1].done()):
+                yield ahead.popleft()
+        while ahead:
+            yield ahead.popleft()
+
+    def interacting(self):
+        """True mientras el lote debe ceder los núcleos a la vista previa."""
+        return (self._queues["preview"] or self._running["preview"]
+                or time.monotonic() - self._last_interactive < self.batch_pause)
+
+    def stats(self):
+        """Trabajos pendientes, en curso y latencia reciente (ms) de cada clase."""
+        with self._cond:
+            report = {}
+            for priority in PRIORITIES:
+                latencies = sorted(self._latencies[priority])
+                report[priority] = {
+                    "pending": len(self._queues[priority]),
+                    "running": self._running[priority],
+                    "p50_ms": percentile(latencies, 0.50),
+                    "p95_ms": percentile(latencies, 0.95),
+                }
+            return report
+
+    def stop(self):
+        """Detiene los hilos y cancela todo lo pendiente."""
+        with self._cond:
+            self._stopped = True
+            for queue in self._queues.values():
+                while queue:
+                    queue.popleft().future.cancel()
+            self._cond.notify_all()
+
+    def _next_job(self, lane):
+        """Siguiente trabajo de las clases de 'lane' (con el cerrojo tomado); None al detenerse."""
+        while not self._stopped:
+            for priority in lane:
+                queue = self._queues[priority]
+                if not queue:
+                    continue
+                if priority == "batch" and self.interacting():
+                    # Esperar a que termine la pausa, salvo que llegue otro trabajo
+                    self._cond.wait(timeout=self.batch_pause)
+                    break
+                job = queue.pop() if priority == "thumbnail" else queue.popleft()
+                self._cond.notify_all()         # Hay sitio en la cola
+                return priority, job
+            else:
+                self._cond.wait()
+        return None
+
+    def _run(self, lane):
+        if lane == ("batch",):
+            lower_thread_priority(SCHEDULER_BATCH_NICE)
+        while True:
+            with self._cond:
+                picked = self._next_job(lane)
+                if picked is None:
+                    return
+                priority, job = picked
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                self._running[priority] += 1
+            try:
+                job.future.set_result(job.fn(*job.args, **job.kwargs))
+            except BaseException as e:
+                job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running[priority] -= 1
+                    self._latencies[priority].append((time.perf_counter() - job.submitted) * 1000)
+                    self._cond.notify_all()
+
+
+def lower_thread_priority(nice):
+    """
+    Baja la prioridad del hilo actual (solo Linux, donde cada hilo tiene su
+    propia prioridad). En otros sistemas no hace nada.
+    """
+    if not sys.platform.startswith("linux") or nice <= 0:
+        return
+    try:
+        tid = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, tid, min(19, os.getpriority(os.PRIO_PROCESS, tid) + nice))
+    except (AttributeError, OSError) as e:
+        print(f"No se pudo bajar la prioridad del hilo del lote: {e}")
+
+
+def percentile(values, fraction):
+    """Percentil de una lista ya ordenada (None si está vacía)."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def completed(fn, *args, **kwargs):
+    """Ejecuta fn ahora y devuelve un Future ya resuelto (para el camino sin planificador)."""
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
@@ -0,0 +1,288 @@
+"""
+server.py
+Servicio HTTP local de renderizado: expone el Renderer para otras
+herramientas del flujo de trabajo sin abrir la GUI.
+
+Endpoints:
+    GET  /health        -> estado del servicio
+    GET  /metrics       -> métricas en formato de texto de Prometheus
+    GET  /metrics.json  -> las mismas métricas en JSON
+    POST /render        -> JSON con "paths" (rutas) o "images" (base64) y la
+                           configuración del grupo; devuelve los bytes PNG/JPEG
+
+Cada worker mide sus renders y devuelve lo medido con la imagen; el proceso
+principal lo acumula en su registro (ver metrics.py).
+"""
+
+import io
+import os
+import json
+import base64
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from src.config import FINAL_SIZE, BATCH_GROUP_SIZES
+from src.batch import load_settings, make_group, DEFAULT_SETTINGS
+from src.renderer import Renderer, TemplateSpec
+from src.bundles import compile_assets
+from src.metrics import METRICS
+from src.utils import load_emoji_pack, open_image, open_asset
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_RENDER_SIDE = 8192          # Lado máximo de la imagen pedida (evita agotar la memoria de un worker)
+SOURCE_CACHE_SIZE = 64          # Imágenes decodificadas que guarda cada worker
+
+# Estado de cada proceso worker (se llena en _init_worker y se reutiliza)
+_worker = {}
+
+
+def _file_key(path):
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def _cached(cache, key, loader, max_items=SOURCE_CACHE_SIZE):
+    """Caché LRU sencilla basada en OrderedDict."""
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    value = loader()
+    cache[key] = value
+    if len(cache) > max_items:
+        cache.popitem(last=False)
+    return value
+
+
+def _init_worker(config_path):
+    """Carga la configuración del servicio una vez por proceso worker."""
+    _worker["settings"] = load_settings(config_path)
+    _worker["sources"] = OrderedDict()      # Imágenes de los slots decodificadas
+    _worker["assets"] = OrderedDict()       # Fondos, logos y paquetes de emojis
+    _worker["renderers"] = OrderedDict()    # Un Renderer por combinación de fondo, logo y emojis
+
+
+def _load_source(path):
+    def load():
+        METRICS.inc("source_bytes_read_total", os.path.getsize(path))
+        return open_image(path)
+    return _cached(_worker["sources"], _file_key(path), load)
+
+
+def _load_asset(path):
+    if not path or not os.path.exists(path):
+        return None
+    return _cached(_worker["assets"], _file_key(path),
+                   lambda: open_asset(path), max_items=16)
+
+
+def _load_emojis(pack_name):
+    return _cached(_worker["assets"], ("emoji_pack", pack_name),
+                   lambda: load_emoji_pack(pack_name), max_items=16)
+
+
+def _get_renderer(settings):
+    """
+    Renderer de los recursos de la petición: guarda los fondos escalados,
+    logos, emojis y layouts entre peticiones.
+    """
+    bg_path, logo_path = settings.get("bg_img_path"), settings.get("logo_img_path")
+    pack = settings.get("emoji_pack", "default")
+
+    def asset_key(path):
+        return _file_key(path) if path and os.path.exists(path) else None
+
+    return _cached(_worker["renderers"], (asset_key(bg_path), asset_key(logo_path), pack),
+                   lambda: Renderer(_load_asset(bg_path), _load_asset(logo_path), _load_emojis(pack)),
+                   max_items=8)
+
+
+def render_request(payload):
+    """
+    Renderiza una petición del servicio dentro de un proceso worker.
+
+    Devuelve (content_type, bytes) de la imagen codificada y el snapshot de
+    las métricas medidas en la petición.
+    """
+    before = METRICS.snapshot()
+    content_type, body = _render_payload(payload)
+    METRICS.inc("output_bytes_written_total", len(body))
+    return content_type, body, METRICS.delta(before).snapshot()
+
+
+def _parse_settings(payload):
+    """
+    Ajustes del grupo que trae la petición. Cada valor debe ser del tipo del
+    de DEFAULT_SETTINGS (números para los numéricos; texto o null para las
+    rutas). Lanza ValueError si no.
+    """
+    overrides = {}
+    for key, value in payload.items():
+        if key not in DEFAULT_SETTINGS or key == "batch_groups":
+            continue
+        default = DEFAULT_SETTINGS[key]
+        if default is None:
+            valid, expected = value is None or isinstance(value, str), "texto o null"
+        elif isinstance(default, (int, float)):
+            valid, expected = isinstance(value, (int, float)) and not isinstance(value, bool), "un número"
+        else:
+            valid, expected = isinstance(value, type(default)), "texto"
+        if not valid:
+            raise ValueError(f"'{key}' debe ser {expected}")
+        overrides[key] = value
+    return overrides
+
+
+def _string_list(payload, key):
+    value = payload.get(key) or []
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"'{key}' debe ser una lista de textos")
+    return value
+
+
+def _render_payload(payload):
+    settings = {**_worker["settings"], **_parse_settings(payload)}
+
+    if payload.get("images"):
+        slots = [Image.open(io.BytesIO(base64.b64decode(data))).convert("RGBA")
+                 for data in _string_list(payload, "images")]
+        paths = [f"upload_{i}" for i in range(len(slots))]
+    else:
+        paths = _string_list(payload, "paths")
+        slots = [_load_source(p) for p in paths]
+
+    if len(slots) not in BATCH_GROUP_SIZES:
+        raise ValueError("Se necesitan 2, 3 o 4 imágenes.")
+
+    size = _parse_size(payload.get("size", FINAL_SIZE))
+    spec = TemplateSpec.from_settings(make_group(paths, settings), size)
+    image = _get_renderer(settings).render(spec, slots)
+
+    buffer = io.BytesIO()
+    with METRICS.timer("stage_seconds", stage="encode"):
+        if str(payload.get("format", "png")).lower() in ("jpg", "jpeg"):
+            image.save(buffer, "JPEG", quality=int(payload.get("quality", 95)))
+            return "image/jpeg", buffer.getvalue()
+        image.save(buffer, "PNG")
+        return "image/png", buffer.getvalue()
+
+
+def _parse_size(value):
+    """Tamaño (ancho, alto) de la petición. Lanza ValueError si no es válido."""
+    if (not isinstance(value, (list, tuple)) or len(value) != 2
+            or not all(isinstance(v, int) and not isinstance(v, bool) for v in value)):
+        raise ValueError("'size' debe ser [ancho, alto] en píxeles enteros")
+    if not all(0 < v <= MAX_RENDER_SIDE for v in value):
+        raise ValueError(f"'size' debe estar entre 1 y {MAX_RENDER_SIDE} píxeles por lado")
+    return tuple(value)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """Atiende las peticiones HTTP y delega el renderizado al pool de procesos."""
+
+    server_version = "PlantillaRender/1.0"
+
+    def _send(self, status, content_type, body):
+        if self.command == "POST":
+            METRICS.inc("requests_total", status=str(status))
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, "application/json", json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "workers": self.server.workers})
+        elif self.path == "/metrics":
+            self._send(200, "text/plain; version=0.0.4; charset=utf-8", METRICS.to_prometheus().encode("utf-8"))
+        elif self.path == "/metrics.json":
+            self._send_json(200, METRICS.to_dict())
+        else:
+            self._send_json(404, {"error": "Ruta no encontrada"})
+
+    def do_POST(self):
+        if self.path != "/render":
+            self._send_json(404, {"error": "Ruta no encontrada"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = 0
+        if length <= 0 or length > MAX_BODY_BYTES:
+            self._send_json(413 if length > 0 else 400, {"error": "Cuerpo de la petición inválido"})
+            return
+
+        try:
+            payload = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self._send_json(400, {"error": f"JSON inválido: {e}"})
+            return
+        if not isinstance(payload, dict):
+            self._send_json(400, {"error": "El cuerpo debe ser un objeto JSON"})
+            return
+
+        pool = self.server.pool
+        try:
+            content_type, body, measured = pool.submit(render_request, payload).result()
+        except (ValueError, OSError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except BrokenProcessPool:
+            # Un worker murió (p. ej. sin memoria): se lanza un pool nuevo para las siguientes
+            self.server.restart_pool(pool)
+            self._send_json(500, {"error": "El worker de render terminó inesperadamente"})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        METRICS.merge(measured)
+        self._send(200, content_type, body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    """Servidor HTTP con un pool de procesos que conservan fuentes y recursos en memoria."""
+
+    daemon_threads = True
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, config_path=None, quiet=False):
+        super().__init__((host, port), RenderRequestHandler)
+        self.workers = workers or os.cpu_count() or 1
+        self.quiet = quiet
+        # Emojis, fondo y logo precompilados: los workers los mapean en memoria
+        # y comparten las mismas páginas en lugar de decodificarlos cada uno
+        compile_assets(load_settings(config_path), only_stale=True)
+        self.config_path = config_path
+        self._pool_lock = threading.Lock()
+        self.pool = self._new_pool()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(self.config_path,)
+        )
+
+    def restart_pool(self, broken):
+        """Sustituye el pool roto 'broken' (si otra petición no lo hizo ya)."""
+        with self._pool_lock:
+            if self.pool is not broken:
+                return
+            self.pool = self._new_pool()
+        print("Un worker terminó inesperadamente: pool de render reiniciado")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True, cancel_futures=True)
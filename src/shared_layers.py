@@ -0,0 +1,121 @@
+"""
+shared_layers.py
+Capas fijas de un lote en memoria compartida entre procesos worker.
+
+El fondo escalado, el logo escalado y los emojis de cada layout son iguales
+en todos los grupos del lote. El proceso principal los prepara una sola vez
+(ver Renderer.static_layers) y los copia en un bloque de
+multiprocessing.shared_memory; cada worker crea sus imágenes directamente
+sobre ese bloque (Image.frombuffer, sin copiar) y las fija en su Renderer.
+Así la memoria y el arranque de los workers no crecen con su número: nadie
+vuelve a decodificar ni a escalar nada.
+
+A los workers solo se les pasa el manifiesto (nombre del bloque, posición
+y tamaño de cada capa, layouts), que ocupa unos pocos bytes.
+
+Formato del bloque: los píxeles de cada capa, alineados a SHARED_ALIGN bytes
+(como los paquetes precompilados, ver bundles.py).
+"""
+
+from multiprocessing import shared_memory
+from PIL import Image
+
+SHARED_ALIGN = 64
+SHARED_MODES = {"RGBA": 4, "L": 1}     # Modos que Image.frombuffer crea sin copiar
+
+# Bloques abiertos en este proceso worker: las imágenes los usan mientras viva el proceso
+_attached = []
+
+
+def _align(offset):
+    return (offset + SHARED_ALIGN - 1) // SHARED_ALIGN * SHARED_ALIGN
+
+
+def _layer_image(layer):
+    """Imagen de una capa y el resto de su valor (el logo es (imagen, posición))."""
+    if isinstance(layer, tuple) and layer and isinstance(layer[0], Image.Image):
+        return layer[0], layer[1:]
+    if isinstance(layer, Image.Image):
+        return layer, None
+    return None, None
+
+
+class SharedLayers:
+    """
+    Bloque de memoria compartida con las capas fijas de un lote (proceso
+    principal). Se libera con close() o al salir del bloque with.
+    """
+
+    def __init__(self, layers):
+        """
+        Args:
+            layers: {clave de caché: capa} (ver Renderer.static_layers). Lo
+                que no es una imagen en un modo compartible (layouts, capas
+                en otros modos) va tal cual en el manifiesto.
+        """
+        entries, values, offset = [], {}, 0
+        for key, layer in layers.items():
+            image, rest = _layer_image(layer)
+            if image is None or image.mode not in SHARED_MODES:
+                values[key] = layer
+                continue
+            entries.append((key, image, rest, offset))
+            offset = _align(offset + image.width * image.height * SHARED_MODES[image.mode])
+
+        self.size = offset
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, offset))
+        manifest_layers = []
+        for key, image, rest, start in entries:
+            data = image.tobytes()
+            self.shm.buf[start:start + len(data)] = data
+            manifest_layers.append((key, image.mode, image.size, start, rest))
+        self.manifest = {"name": self.shm.name, "layers": manifest_layers, "values": values}
+
+    def close(self):
+        """Libera el bloque (los workers que lo usan deben haber terminado)."""
+        if self.shm is None:
+            return
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def publish_layers(renderer, specs):
+    """
+    Prepara las capas fijas de cada plantilla del lote y las copia a memoria
+    compartida.
+
+    Args:
+        renderer: Renderer con los recursos del lote
+        specs: (TemplateSpec, cantidad de imágenes) de los grupos del lote
+
+    Returns:
+        SharedLayers (su manifest es lo que se pasa a attach_layers)
+    """
+    layers = {}
+    for spec, count in set(specs):
+        layers.update(renderer.static_layers(spec, count))
+    return SharedLayers(layers)
+
+
+def attach_layers(renderer, manifest):
+    """
+    Fija en el Renderer de un worker las capas del manifiesto, como imágenes
+    de solo lectura sobre la memoria compartida. Devuelve cuántas capas fijó.
+    """
+    shm = shared_memory.SharedMemory(name=manifest["name"])
+    _attached.append(shm)
+    layers = dict(manifest["values"])
+    for key, mode, size, start, rest in manifest["layers"]:
+        length = size[0] * size[1] * SHARED_MODES[mode]
+        image = Image.frombuffer(mode, size, shm.buf[start:start + length], "raw", mode, 0, 1)
+        layers[key] = image if rest is None else (image, *rest)
+    renderer.pin_layers(layers)
+    return len(layers)
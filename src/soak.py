@@ -0,0 +1,226 @@
+"""
+soak.py
+Pruebas de resistencia de memoria: repiten miles de renders de vista previa
+o un lote enorme y miden la memoria del proceso y los objetos de Python
+(tracemalloc) a lo largo de la prueba. Pasada la fase de calentamiento
+(cachés llenándose) la memoria debe estabilizarse; si sigue creciendo hay
+una fuga y se muestran las líneas de código que más memoria acumularon.
+
+Los píxeles de Pillow no pasan por el asignador de Python: una fuga de
+imágenes se ve en la memoria del proceso y una de objetos (listas,
+diccionarios, claves de caché) en tracemalloc.
+"""
+
+import gc
+import os
+import shutil
+import tempfile
+import tracemalloc
+from src.config import (
+    CANVAS_SIZE, TITLE_STYLES, IMAGE_SHAPES, FONT_FILENAMES, SOAK_SAMPLES, SOAK_WARMUP_FRACTION,
+    SOAK_MAX_RSS_GROWTH_MB, SOAK_MAX_TRACED_GROWTH_MB, SOAK_PREVIEW_RENDERS, SOAK_BATCH_GROUPS
+)
+from src.diagnostics import current_rss_mb
+from src.renderer import TemplateSpec
+
+TOP_ALLOCATIONS = 10
+
+
+class MemorySampler:
+    """
+    Mide la memoria cada cierto número de pasos de una prueba.
+
+    Uso: start(), step() después de cada paso y stop() al final, que
+    devuelve el resultado de la prueba (ver evaluate).
+    """
+
+    def __init__(self, steps, samples=SOAK_SAMPLES, on_sample=None):
+        self.steps = steps
+        self.every = max(1, steps // max(1, samples))
+        self.warmup_steps = int(steps * SOAK_WARMUP_FRACTION)
+        self.on_sample = on_sample
+        self.history = []
+        self._done = 0
+        self._warm_snapshot = None
+
+    def start(self):
+        tracemalloc.start()
+        self.history = []
+        self._done = 0
+        self._warm_snapshot = None
+
+    def step(self):
+        self._done += 1
+        if self._done % self.every and self._done != self.steps:
+            return
+        gc.collect()
+        traced, _ = tracemalloc.get_traced_memory()
+        sample = {"step": self._done, "rss_mb": current_rss_mb(), "traced_mb": traced / (1024 * 1024)}
+        self.history.append(sample)
+        if self._warm_snapshot is None and self._done >= self.warmup_steps:
+            self._warm_snapshot = tracemalloc.take_snapshot()
+        if self.on_sample:
+            self.on_sample(sample)
+
+    def stop(self):
+        gc.collect()
+        final_snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        result = evaluate(self.history, self.warmup_steps)
+        if self._warm_snapshot is not None:
+            grown = [stat for stat in final_snapshot.compare_to(self._warm_snapshot, "lineno")
+                     if stat.size_diff > 0]
+            result["top"] = grown[:TOP_ALLOCATIONS]
+        else:
+            result["top"] = []
+        return result
+
+
+def evaluate(history, warmup_steps):
+    """
+    Decide si la memoria se estabilizó.
+
+    Las mediciones posteriores al calentamiento se parten en dos mitades: el
+    máximo de la segunda no debe superar al de la primera en más de lo
+    permitido. Una caché llena oscila, pero una fuga sigue subiendo.
+
+    Returns:
+        Diccionario con samples, rss_growth_mb, traced_growth_mb, problems y ok
+    """
+    warm = [s for s in history if s["step"] >= warmup_steps]
+    problems = []
+    rss_growth = traced_growth = None
+    if len(warm) < 4:
+        problems.append("muy pocas mediciones tras el calentamiento (aumenta los pasos)")
+    else:
+        first, second = warm[:len(warm) // 2], warm[len(warm) // 2:]
+        traced_growth = max(s["traced_mb"] for s in second) - max(s["traced_mb"] for s in first)
+        if traced_growth > SOAK_MAX_TRACED_GROWTH_MB:
+            problems.append(f"los objetos de Python crecieron {traced_growth:.1f} MB "
+                            f"(máximo {SOAK_MAX_TRACED_GROWTH_MB} MB)")
+        if all(s["rss_mb"] is not None for s in warm):
+            rss_growth = max(s["rss_mb"] for s in second) - max(s["rss_mb"] for s in first)
+            if rss_growth > SOAK_MAX_RSS_GROWTH_MB:
+                problems.append(f"la memoria del proceso creció {rss_growth:.1f} MB "
+                                f"(máximo {SOAK_MAX_RSS_GROWTH_MB} MB)")
+    return {"samples": history, "rss_growth_mb": rss_growth, "traced_growth_mb": traced_growth,
+            "problems": problems, "ok": not problems}
+
+
+def preview_spec(base_spec, index):
+    """
+    Configuración del render número 'index' de la prueba de vista previa:
+    simula una sesión larga moviendo deslizadores y cambiando estilo,
+    forma, fuente y texto del título.
+    """
+    styles, shapes, fonts = list(TITLE_STYLES), list(IMAGE_SHAPES), list(FONT_FILENAMES)
+    return base_spec.replace(
+        title_text=f"{base_spec.title_text} {index % 97}",
+        title_style=styles[index % len(styles)],
+        image_shape=shapes[(index // 7) % len(shapes)],
+        font_family=fonts[(index // 11) % len(fonts)],
+        logo_size=0.10 + (index % 41) * 0.005,
+        logo_x=(index % 23) / 22,
+        emoji_size=0.2 + (index % 13) * 0.02,
+        emoji_x_offset=(index % 17) / 16 - 0.5,
+    )
+
+
+def soak_preview(renderer, slots, base_spec=None, renders=SOAK_PREVIEW_RENDERS, samples=SOAK_SAMPLES,
+                 on_sample=None):
+    """
+    Repite renders de vista previa (tamaño del lienzo, salida RGBA) con un
+    Renderer compartido, como hace la GUI en una sesión larga.
+    """
+    base_spec = (base_spec or TemplateSpec()).replace(size=CANVAS_SIZE)
+    sampler = MemorySampler(renders, samples, on_sample)
+    sampler.start()
+    try:
+        for i in range(renders):
+            renderer.render(preview_spec(base_spec, i), slots, output_mode="RGBA")
+            sampler.step()
+    finally:
+        result = sampler.stop()
+    return result
+
+
+def synthetic_groups(paths, settings, groups=SOAK_BATCH_GROUPS):
+    """
+    Lote sintético de 'groups' grupos con las imágenes dadas: cada grupo
+    toma 2, 3 o 4 de ellas (rotando) y su propio título y estilo.
+    """
+    from src.batch import make_group
+
+    styles = list(TITLE_STYLES)
+    batch = []
+    for i in range(groups):
+        count = 2 + i % 3
+        group = make_group([paths[(i + k) % len(paths)] for k in range(count)], settings)
+        group["title_text"] = f"{group['title_text']} {i % 211}"
+        group["title_style"] = styles[i % len(styles)]
+        batch.append(group)
+    return batch
+
+
+def soak_batch(renderer, groups, defaults=None, final_size=(270, 337), samples=SOAK_SAMPLES,
+               on_sample=None, output_dir=None):
+    """
+    Renderiza un lote enorme con run_batch y mide la memoria por grupo.
+
+    Las imágenes se escriben en output_dir (por defecto, una carpeta
+    temporal que se borra al terminar). Para no llenar el disco, los PNG ya
+    escritos se borran en cada medición.
+    """
+    from src.batch import run_batch
+
+    own_dir = output_dir is None
+    output_dir = output_dir or tempfile.mkdtemp(prefix="soak_")
+    sampler = MemorySampler(len(groups), samples, on_sample)
+
+    def on_progress(done, total):
+        before = len(sampler.history)
+        sampler.step()
+        if len(sampler.history) != before:
+            for entry in os.scandir(output_dir):
+                if entry.name.endswith(".png"):
+                    os.remove(entry.path)
+
+    sampler.start()
+    try:
+        _, failed = run_batch(groups, renderer, output_dir, defaults, on_progress=on_progress,
+                              final_size=final_size)
+    finally:
+        result = sampler.stop()
+        if own_dir:
+            shutil.rmtree(output_dir, ignore_errors=True)
+    result["failed"] = failed
+    if failed:
+        result["problems"].append(f"{len(failed)} grupos fallaron")
+        result["ok"] = False
+    return result
+
+
+def format_soak(result):
+    """Informe legible de una prueba de resistencia."""
+    def mb(value):
+        return "n/d" if value is None else f"{value:+.1f} MB"
+
+    def rss(sample):
+        return "n/d" if sample["rss_mb"] is None else f"{sample['rss_mb']:.1f} MB"
+
+    samples = result["samples"]
+    lines = []
+    if samples:
+        lines.append(f"Memoria del proceso: {rss(samples[0])} al empezar, {rss(samples[-1])} al terminar "
+                     f"({len(samples)} mediciones)")
+    lines.append(f"Crecimiento tras calentar: proceso {mb(result['rss_growth_mb'])}, "
+                 f"Python {mb(result['traced_growth_mb'])}")
+    if result["ok"]:
+        lines.append("✓ La memoria se estabiliza")
+    else:
+        lines.append("✗ La memoria no se estabiliza:")
+        lines.extend(f"    {problem}" for problem in result["problems"])
+        if result["top"]:
+            lines.append("  Líneas que más memoria acumularon tras calentar:")
+            lines.extend(f"    {stat}" for stat in result["top"])
+    return "\n".join(lines)
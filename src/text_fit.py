@@ -0,0 +1,171 @@
+"""
+text_fit.py
+Ajuste del título a su caja (TITLE_BOX): si no cabe en una línea al tamaño
+máximo, se busca el mayor tamaño de letra con el que cabe partido en hasta
+TITLE_MAX_LINES líneas; si ni al mínimo cabe, se recorta con "...".
+
+La búsqueda no carga la fuente a cada tamaño ni mide el texto con textbbox:
+el avance de cada glifo se mide una vez por fuente y se escala, y los
+tamaños se prueban con búsqueda binaria. Solo el tamaño elegido se carga y
+se comprueba con la medida real, que puede diferir un poco de la suma de
+avances (interletraje, redondeos del hinting).
+"""
+
+from functools import lru_cache
+from src.config import (
+    FONT_SCALING_FACTORS, TITLE_FONT_SIZE, TITLE_MIN_FONT_SIZE, TITLE_BOX, TITLE_MAX_LINES,
+    TITLE_LINE_SPACING
+)
+from src.utils import load_font
+
+METRICS_SIZE = 200      # Tamaño de letra al que se miden los glifos
+ELLIPSIS = "..."
+CHECK_STEPS = 3         # Correcciones con la medida real, como mucho
+
+
+class GlyphMetrics:
+    """Medidas de una fuente por píxel de tamaño de letra."""
+
+    def __init__(self, font):
+        self.font = font
+        self._advances = {}
+        ascent, descent = font.getmetrics()
+        self.height = (ascent + descent) / METRICS_SIZE             # Alto de una línea
+        self.line_step = font.getbbox("A")[3] / METRICS_SIZE        # Paso entre líneas de Pillow, sin interlineado
+
+    def width(self, text):
+        """Ancho de 'text' (suma de avances) por píxel de tamaño de letra."""
+        advances = self._advances
+        total = 0.0
+        for char in text:
+            advance = advances.get(char)
+            if advance is None:
+                advance = advances[char] = self.font.getlength(char) / METRICS_SIZE
+            total += advance
+        return total
+
+    def block_height(self, lines, px):
+        """Alto de 'lines' líneas a 'px' píxeles de tamaño de letra."""
+        return (lines - 1) * (self.line_step * px + int(px * TITLE_LINE_SPACING)) + self.height * px
+
+
+@lru_cache(maxsize=16)
+def glyph_metrics(font_family):
+    """Medidas de los glifos de una familia (se calculan una vez por familia)."""
+    return GlyphMetrics(load_font(font_family, METRICS_SIZE))
+
+
+def fit_title(final_size, title_text, font_family):
+    """
+    Fuente y texto (con saltos de línea si hace falta) del título ajustado a
+    su caja. Un título que cabe en una línea al tamaño máximo no cambia.
+
+    Returns:
+        (fuente, texto)
+    """
+    W, H = final_size
+    scale = FONT_SCALING_FACTORS.get(font_family, 1.0)
+    box_w, box_h = W * TITLE_BOX['width'], H * TITLE_BOX['height']
+    metrics = glyph_metrics(font_family)
+    max_size = int(H * TITLE_FONT_SIZE)
+    min_size = min(max_size, max(1, int(H * TITLE_MIN_FONT_SIZE)))
+
+    def layout(size):
+        """Líneas del título a 'size', o None si no caben en la caja."""
+        px = max(1, int(size * scale))
+        if "\n" not in title_text and metrics.width(title_text) * px <= box_w:
+            return [title_text]
+        lines = wrap_lines(title_text, metrics, box_w / px)
+        if lines is None or len(lines) > TITLE_MAX_LINES or metrics.block_height(len(lines), px) > box_h:
+            return None
+        return lines
+
+    size, lines = max_size, layout(max_size)
+    if lines is None:
+        # El mayor tamaño que cabe: la búsqueda solo suma avances ya medidos
+        low, high = min_size, max_size - 1
+        size = min_size
+        while low <= high:
+            mid = (low + high) // 2
+            candidate = layout(mid)
+            if candidate is None:
+                high = mid - 1
+            else:
+                size, lines, low = mid, candidate, mid + 1
+        if lines is None:
+            lines = truncate_lines(title_text, metrics, box_w / max(1, int(min_size * scale)))
+
+    font = load_font(font_family, size=size, scale_factor=scale)
+    for _ in range(CHECK_STEPS):
+        widest = max(font.getlength(line) for line in lines)
+        if widest <= box_w:
+            break
+        if size > min_size:
+            size = max(min_size, int(size * box_w / widest))
+            lines = layout(size) or lines
+            font = load_font(font_family, size=size, scale_factor=scale)
+        else:
+            # Ya al mínimo: se recorta otra vez, corrigiendo la estimación con la medida real
+            px = max(1, int(size * scale))
+            estimated = max(metrics.width(line) for line in lines) * px
+            lines = truncate_lines(title_text, metrics, box_w / px * estimated / widest)
+    return font, "\n".join(lines)
+
+
+def wrap_lines(text, metrics, max_width):
+    """
+    Parte el texto por palabras en líneas de como mucho max_width (por píxel
+    de tamaño de letra). Respeta los saltos de línea del texto. Devuelve
+    None si alguna palabra no cabe sola en una línea.
+    """
+    space = metrics.width(" ")
+    lines = []
+    for paragraph in text.split("\n"):
+        line, line_width = [], 0.0
+        for word in paragraph.split():
+            width = metrics.width(word)
+            if width > max_width:
+                return None
+            if line and line_width + space + width > max_width:
+                lines.append(" ".join(line))
+                line, line_width = [], 0.0
+            line_width += (space if line else 0.0) + width
+            line.append(word)
+        lines.append(" ".join(line))
+    return lines
+
+
+def truncate_lines(text, metrics, max_width, max_lines=TITLE_MAX_LINES):
+    """
+    Como wrap_lines, pero cortando las palabras que no caben solas y
+    recortando con "..." lo que pase de max_lines líneas.
+    """
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}" if line else word
+        if metrics.width(candidate) <= max_width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        line = word
+        while len(line) > 1 and metrics.width(line) > max_width:
+            cut = _chars_that_fit(line, metrics, max_width)
+            lines.append(line[:cut])
+            line = line[cut:]
+    lines.append(line)
+    if len(lines) <= max_lines:
+        return lines
+    last = lines[max_lines - 1]
+    while last and metrics.width(last + ELLIPSIS) > max_width:
+        last = last[:-1]
+    return lines[:max_lines - 1] + [last.rstrip() + ELLIPSIS]
+
+
+def _chars_that_fit(text, metrics, max_width):
+    width = 0.0
+    for i, char in enumerate(text):
+        width += metrics.width(char)
+        if width > max_width:
+            return max(1, i)
+    return len(text)
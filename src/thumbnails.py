@@ -0,0 +1,161 @@
+"""
+thumbnails.py
+Miniaturas de los grupos del lote: se renderizan en segundo plano a baja
+resolución y se guardan en disco según la huella del contenido del grupo.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+from src.config import CACHE_DIR, FINAL_SIZE, THUMB_SIZE
+from src.renderer import Renderer, TemplateSpec
+from src.manifest import group_fingerprint
+from src.utils import cover_resize
+from src.disk_cache import cached_file
+
+THUMBS_DIR = os.path.join(CACHE_DIR, "thumbs")
+PROXY_CACHE_SIZE = 256          # Fuentes reducidas que se guardan en memoria
+PROXY_SIDE = 192                # Lado máximo de una fuente reducida
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+        return f"{path}:{st.st_mtime_ns}:{st.st_size}"
+    except OSError:
+        return f"{path}:missing"
+
+
+def thumbnail_key(group, settings, size=THUMB_SIZE):
+    """
+    Huella del contenido de un grupo: configuración, fecha y tamaño de cada
+    imagen y recursos compartidos. Si algo cambia, la miniatura se regenera.
+    """
+    parts = [group_fingerprint(group), f"{size[0]}x{size[1]}", settings.get("emoji_pack", "")]
+    parts += [_file_stamp(p) for p in group["paths"]]
+    for key in ("bg_img_path", "logo_img_path"):
+        if settings.get(key):
+            parts.append(_file_stamp(settings[key]))
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def _make_proxy(path):
+    with Image.open(path) as im:
+        im.draft("RGB", (PROXY_SIDE, PROXY_SIDE))    # Decodificación reducida en JPEG
+        im.thumbnail((PROXY_SIDE, PROXY_SIDE), Image.BILINEAR)
+        return im.convert("RGBA")
+
+
+class ThumbnailRenderer:
+    """
+    Renderiza miniaturas de grupos con fuentes reducidas.
+
+    Cada imagen fuente se decodifica una sola vez por sesión: se guarda una
+    versión reducida en memoria que sirve para todos los grupos que la usan.
+    """
+
+    def __init__(self, assets, settings, size=THUMB_SIZE, cache_dir=THUMBS_DIR):
+        self.size = size
+        self.settings = settings
+        self.cache_dir = cache_dir
+        self._proxies = OrderedDict()
+        self._lock = threading.Lock()
+        # El fondo se escala una sola vez al tamaño de la miniatura
+        bg_img = assets.get("bg_img")
+        self.renderer = Renderer(cover_resize(bg_img, size) if bg_img is not None else None,
+                                 assets.get("logo_img"), assets.get("emojis", ()))
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _proxy(self, path):
+        key = _file_stamp(path)
+        with self._lock:
+            if key in self._proxies:
+                self._proxies.move_to_end(key)
+                return self._proxies[key]
+        proxy = cached_file(path, "proxy", PROXY_SIDE, lambda: _make_proxy(path))
+        with self._lock:
+            self._proxies[key] = proxy
+            if len(self._proxies) > PROXY_CACHE_SIZE:
+                self._proxies.popitem(last=False)
+        return proxy
+
+    def proxy_images(self):
+        with self._lock:
+            return list(self._proxies.values())
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def get(self, group):
+        """Devuelve (clave, miniatura), leyendo de disco si ya existe."""
+        key = thumbnail_key(group, self.settings, self.size)
+        path = self._cache_path(key)
+        if os.path.exists(path):
+            try:
+                with Image.open(path) as im:
+                    return key, im.convert("RGB")
+            except OSError:
+                pass
+        thumb = self.render(group)
+        try:
+            thumb.save(path + ".part", format="PNG")
+            os.replace(path + ".part", path)
+        except OSError as e:
+            print(f"No se pudo guardar la miniatura: {e}")
+        return key, thumb
+
+    def render(self, group):
+        count = group["count"]
+        slots = []
+        for path in group["paths"]:
+            try:
+                slots.append(self._proxy(path))
+            except Exception:
+                slots.append(None)      # Se dibuja el placeholder '?'
+
+        spec = TemplateSpec.from_settings(group, self.size, self.settings)
+        # Los desplazamientos están en píxeles del tamaño final
+        spec = spec.replace(emoji_x_offset=spec.emoji_x_offset * self.size[0] / FINAL_SIZE[0],
+                            emoji_y_offset=spec.emoji_y_offset * self.size[1] / FINAL_SIZE[1])
+        # Miniaturas pequeñas: no vale la pena repartirlas entre hilos
+        return self.renderer.render(spec, slots[:count], parallel=False)
+
+
+class ThumbnailWorker:
+    """
+    Atiende pedidos de miniaturas en la clase 'thumbnail' del planificador.
+
+    Los pedidos más recientes (las filas visibles ahora) se atienden primero
+    y un pedido repetido reemplaza al anterior de la misma fila.
+    """
+
+    def __init__(self, renderer, on_ready, scheduler):
+        self.renderer = renderer
+        self.on_ready = on_ready
+        self.scheduler = scheduler
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def request(self, index, group):
+        future = self.scheduler.submit("thumbnail", self._render, index, group, key=(id(self), index))
+        with self._lock:
+            self._futures[index] = future
+
+    def clear(self):
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.cancel()
+
+    def stop(self):
+        self.clear()
+
+    def _render(self, index, group):
+        try:
+            key, thumb = self.renderer.get(group)
+        except Exception as e:
+            print(f"Error al generar la miniatura del grupo {index + 1}: {e}")
+            return
+        self.on_ready(index, key, thumb)
@@ -0,0 +1,250 @@
+"""
+tiled.py
+Render por franjas para salidas muy grandes (pósters): la plantilla se
+compone en franjas horizontales y cada franja terminada se escribe en el PNG
+de salida, sin crear nunca el lienzo completo. El resultado coincide píxel a
+píxel con compose_template.
+"""
+
+import os
+import zlib
+import struct
+from PIL import Image, ImageChops, ImageDraw
+from src.config import TITLE_COLOR, TITLE_STYLES, TILE_ROWS, COVER_BAND_ROWS
+from src.composer import (
+    slot_boxes, prepare_slot_image, emoji_font, emoji_glyph, scratch_canvas,
+    prepare_emoji_image, title_layout, logo_box, prepare_logo
+)
+from src.utils import cover_source, cover_band, draw_text_with_style, make_shadow, paste_with_shadow, title_bbox
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_FILTER_UP = b"\x02"
+
+
+class PngStreamWriter:
+    """
+    Escribe un PNG RGB franja a franja.
+
+    Cada fila se codifica con el filtro 'Up' (diferencia con la fila anterior),
+    que se calcula para toda la franja de una vez con ImageChops.
+    """
+
+    def __init__(self, path, size, compress_level=6):
+        self.path = path
+        self.width, self.height = size
+        self.rows_written = 0
+        self._tmp_path = path + ".part"
+        self._file = open(self._tmp_path, "wb")
+        self._zlib = zlib.compressobj(compress_level)
+        self._prev_row = Image.new("RGB", (self.width, 1))
+        self._file.write(PNG_SIGNATURE)
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+    def write_band(self, band):
+        """Añade las filas de una franja RGB del ancho de la imagen."""
+        w, h = band.size
+        # Filas de referencia para el filtro: la última de la franja anterior
+        # seguida de todas menos la última de esta
+        above = Image.new("RGB", (w, h))
+        above.paste(self._prev_row, (0, 0))
+        if h > 1:
+            above.paste(band.crop((0, 0, w, h - 1)), (0, 1))
+        raw = ImageChops.subtract_modulo(band, above).tobytes()
+        stride = w * 3
+        data = b"".join(PNG_FILTER_UP + raw[i:i + stride] for i in range(0, len(raw), stride))
+
+        compressed = self._zlib.compress(data)
+        if compressed:
+            self._chunk(b"IDAT", compressed)
+        self._prev_row = band.crop((0, h - 1, w, h))
+        self.rows_written += h
+
+    def close(self):
+        """Termina el archivo y lo mueve a su nombre final."""
+        self._chunk(b"IDAT", self._zlib.flush())
+        self._chunk(b"IEND", b"")
+        self._file.close()
+        if self.rows_written != self.height:
+            os.remove(self._tmp_path)
+            raise ValueError(f"Se escribieron {self.rows_written} de {self.height} filas")
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+def iter_bands(
+    final_size,
+    fondo_img,
+    slots_imgs,
+    emojis_imgs_or_texts,
+    title_text,
+    logo_img,
+    font_family='arial_bold',
+    title_style='simple',
+    image_shape='rounded',
+    logo_size=0.2,
+    logo_x=0.5,
+    logo_y=0.5,
+    emoji_size=0.45,
+    emoji_x_offset=0,
+    emoji_y_offset=0,
+    num_slots=3,
+    band_rows=TILE_ROWS
+):
+    """
+    Genera la plantilla franja a franja: produce (y0, franja RGB).
+
+    Recibe los mismos argumentos que compose_template. Cada capa (fondo,
+    título, slots, emojis y logo) se pinta en cada franja en el mismo orden
+    que en el render completo. Los slots, sus sombras y los emojis se
+    preparan al llegar la primera franja que los toca y se liberan después
+    de la última, así que en memoria solo hay una franja y los elementos que
+    la cruzan.
+    """
+    W, H = final_size
+    # El fondo se escala en franjas de COVER_BAND_ROWS: las franjas deben coincidir
+    band_rows = max(COVER_BAND_ROWS, band_rows - band_rows % COVER_BAND_ROWS)
+
+    source = cover_source(fondo_img) if fondo_img else None
+    title = title_layout(final_size, title_text, font_family) if title_text.strip() else None
+    style = TITLE_STYLES.get(title_style, TITLE_STYLES['simple'])
+    if title:
+        # Filas que puede tocar el título con su contorno, sombra y desenfoque
+        font_title, (_, y_title), title_text = title
+        bbox = title_bbox(title_text, font_title)
+        pad = (style.get('outline_width', 0) + style.get('shadow_offset', 0)
+               + 3 * (int(style.get('shadow_blur', 0)) + 2) + 2)
+        title_rows = (y_title + bbox[1] - pad, y_title + bbox[3] + pad)
+
+    boxes = slot_boxes(final_size, num_slots) if num_slots else []
+    font_emoji = emoji_font(final_size, emoji_size) if boxes else None
+    emojis = [emojis_imgs_or_texts[i] if i < len(emojis_imgs_or_texts) else None
+              for i in range(len(boxes))]
+
+    # Filas que ocupa cada elemento: se prepara al llegar a su primera franja
+    # y se libera al pasar la última
+    extents = {}
+    for i, (x_img, y_img, size_img) in enumerate(boxes):
+        extents[("slot", i)] = (y_img, y_img + size_img + 55)      # Incluye la sombra
+        if isinstance(emojis[i], Image.Image):
+            em_w = int(size_img * emoji_size)
+            em_top = y_img + size_img - em_w + int(emoji_y_offset)
+            extents[("emoji", i)] = (em_top, em_top + em_w)
+    if logo_img:
+        lw, lh, lx, ly = logo_box(logo_img.size, final_size, logo_size, logo_x, logo_y)
+        extents["logo"] = (ly, ly + lh)
+
+    def prepare(key):
+        if key == "logo":
+            return prepare_logo(logo_img, final_size, logo_size, logo_x, logo_y)
+        kind, i = key
+        size_img = boxes[i][2]
+        if kind == "emoji":
+            return prepare_emoji_image(emojis[i], size_img, emoji_size)
+        img_data = slots_imgs[i] if i < len(slots_imgs) and slots_imgs[i] is not None else None
+        img = prepare_slot_image(img_data, image_shape, size_img)
+        return img, make_shadow(img)
+
+    prepared = {}
+
+    def visible(key, y0, y1):
+        """Devuelve el elemento preparado si cruza la franja, o None."""
+        top, bottom = extents[key]
+        if bottom <= y0:
+            prepared.pop(key, None)
+            return None
+        if top >= y1:
+            return None
+        if key not in prepared:
+            prepared[key] = prepare(key)
+        return prepared[key]
+
+    for y0 in range(0, H, band_rows):
+        y1 = min(H, y0 + band_rows)
+        band = scratch_canvas((W, y1 - y0))       # Se reutiliza: cada franja sale convertida
+        draw = ImageDraw.Draw(band)
+
+        # 1. FONDO
+        if source is not None:
+            for cy in range(y0, y1, COVER_BAND_ROWS):
+                sub = cover_band(source, final_size, cy, min(H, cy + COVER_BAND_ROWS))
+                band.paste(sub, (0, cy - y0), sub)
+
+        # 2. TÍTULO
+        if title and title_rows[0] < y1 and title_rows[1] > y0:
+            font_title, title_pos, _ = title
+            draw_text_with_style(draw, title_text, title_pos, font_title, TITLE_COLOR,
+                                 style, W, H, band=(y0, y1))
+
+        # 3. IMÁGENES (con sombra) Y EMOJIS, en el mismo orden que compose_template
+        for i, (x_img, y_img, size_img) in enumerate(boxes):
+            slot = visible(("slot", i), y0, y1)
+            if slot:
+                img, shadow = slot
+                paste_with_shadow(band, img, (x_img, y_img - y0), shadow=shadow)
+
+        for i, (x_img, y_img, size_img) in enumerate(boxes):
+            emoji_data = emojis[i]
+            if not emoji_data:
+                continue
+            if isinstance(emoji_data, Image.Image):
+                em = visible(("emoji", i), y0, y1)
+                if em:
+                    emoji_x_final = x_img + int(emoji_x_offset)
+                    emoji_y_final = y_img + size_img - em.height + int(emoji_y_offset)
+                    band.paste(em, (emoji_x_final, emoji_y_final - y0), em)
+            elif str(emoji_data).strip():
+                txt = str(emoji_data)
+                glyph = emoji_glyph(txt, font_emoji.size)
+                if glyph is not None:
+                    band.paste(glyph, (x_img + int(emoji_x_offset),
+                                       y_img + size_img - font_emoji.size + int(emoji_y_offset) - y0), glyph)
+                    continue
+                bbox = draw.textbbox((0, 0), txt, font=font_emoji)
+                th = bbox[3] - bbox[1]
+                emoji_x_final = x_img + int(emoji_x_offset)
+                emoji_y_final = y_img + size_img - th + int(emoji_y_offset) - y0
+                draw.text((emoji_x_final + 2, emoji_y_final + 2), txt,
+                          fill=(0, 0, 0, 180), font=font_emoji)
+                draw.text((emoji_x_final, emoji_y_final), txt,
+                          fill=(255, 255, 255), font=font_emoji)
+
+        # 4. LOGO
+        if logo_img:
+            logo = visible("logo", y0, y1)
+            if logo:
+                logo, (lx, ly) = logo
+                band.paste(logo, (lx, ly - y0), logo)
+
+        yield y0, band.convert("RGB")
+
+
+def render_tiled(path, final_size, *args, band_rows=TILE_ROWS, compress_level=6, **kwargs):
+    """
+    Renderiza la plantilla por franjas directamente a un PNG.
+
+    Recibe los mismos argumentos que compose_template después de la ruta de
+    salida. Devuelve el número de franjas escritas.
+    """
+    writer = PngStreamWriter(path, final_size, compress_level=compress_level)
+    bands = 0
+    try:
+        for _, band in iter_bands(final_size, *args, band_rows=band_rows, **kwargs):
+            writer.write_band(band)
+            bands += 1
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return bands
@@ -3,12 +3,17 @@ ui/batch_panel.py
 Módulo para la construcción y lógica del panel de procesamiento por lotes.
 """
 import os
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image
-from datetime import datetime
-from src.composer import compose_template
-from src.config import FINAL_SIZE, SLOT_MAX
+from PIL import ImageTk
+from src.batch import make_group, run_batch
+from src.manifest import BatchManifest
+from src.preflight import preflight_batch, format_report
+from src.config import SLOT_MAX, THUMB_SIZE, WATCH_RULES, WATCH_DEFAULT_PATTERN
+from src.thumbnails import ThumbnailRenderer, ThumbnailWorker, thumbnail_key
+from src.utils import open_image
+from src.watcher import HotFolderWatcher, make_watch_handler
 
 def on_batch_group_select(event, app):
     """
@@ -42,7 +47,7 @@ def on_batch_group_select(event, app):
         for slot_idx, path in enumerate(group["paths"]):
             if slot_idx < SLOT_MAX:
                 try:
-                    app.slots[slot_idx] = Image.open(path).convert("RGBA")
+                    app.slots[slot_idx] = open_image(path)
                 except Exception as e:
                     print(f"Error cargando imagen para visualización del grupo: {e}")
                     app.slots[slot_idx] = None
@@ -93,8 +98,13 @@ def create_batch_panel(parent, app):
     
     ttk.Separator(parent).pack(fill=tk.X, pady=10)
 
+    # Las filas tienen la altura de una miniatura
+    ttk.Style().configure('Batch.Treeview', rowheight=THUMB_SIZE[1] + 6)
+
     # Guardar el treeview en la instancia de la app para acceso global
-    app.batch_tree = ttk.Treeview(parent, columns=("Num. Imágenes", "Título", "Rutas"), show="headings")
+    app.batch_tree = ttk.Treeview(parent, columns=("Num. Imágenes", "Título", "Rutas"), show="tree headings", style='Batch.Treeview')
+    app.batch_tree.heading("#0", text="Vista")
+    app.batch_tree.column("#0", width=THUMB_SIZE[0] + 24, stretch=False, anchor=tk.CENTER)
     app.batch_tree.heading("Num. Imágenes", text="Imágenes")
     app.batch_tree.heading("Título", text="Título")
     app.batch_tree.heading("Rutas", text="Rutas de Archivo")
@@ -108,7 +118,12 @@ def create_batch_panel(parent, app):
 
     tree_scroll = ttk.Scrollbar(parent, orient="vertical", command=app.batch_tree.yview)
     tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
-    app.batch_tree.configure(yscrollcommand=tree_scroll.set)
+    app.batch_tree.configure(yscrollcommand=lambda first, last: _on_batch_scroll(app, tree_scroll, first, last))
+
+    app.batch_thumbs = {}       # índice -> (clave de contenido, PhotoImage)
+    app.thumb_worker = None
+    app.thumb_assets_key = None
+    app._thumbs_pending = False
 
     # Frame para botones de edición y acción
     action_buttons_frame = ttk.Frame(parent)
@@ -127,6 +142,19 @@ def create_batch_panel(parent, app):
     ttk.Button(action_buttons_frame, text="💥 Limpiar Lotes", command=lambda: clear_all_batch_groups(app)).grid(row=0, column=1, sticky="ew", padx=(5, 0))
 
     ttk.Button(parent, text="▶️ Iniciar Lote", command=lambda: start_batch_processing(app)).pack(fill=tk.X, pady=(5,0))
+    ttk.Button(parent, text="⏯️ Reanudar Lote", command=lambda: start_batch_processing(app, resume=True)).pack(fill=tk.X, pady=(5,0))
+    ttk.Button(parent, text="🗜️ Lote a ZIP/TAR", command=lambda: start_batch_processing(app, archive=True)).pack(fill=tk.X, pady=(5,0))
+    app.batch_running = False
+    app.batch_status = ttk.Label(parent, text="", style='Info.TLabel')
+    app.batch_status.pack(fill=tk.X)
+
+    ttk.Separator(parent).pack(fill=tk.X, pady=10)
+
+    app.watcher = None
+    app.watch_button = ttk.Button(parent, text="📂 Vigilar Carpeta", command=lambda: toggle_watch_folder(app))
+    app.watch_button.pack(fill=tk.X)
+    app.watch_status = ttk.Label(parent, text="", style='Info.TLabel')
+    app.watch_status.pack(fill=tk.X)
 
 
 def add_batch_group(app, paths=None):
@@ -145,20 +173,7 @@ def add_batch_group(app, paths=None):
         return
 
     # Captura la configuración actual de la app
-    group_settings = {
-        "count": num_images,
-        "paths": list(paths),
-        "title_text": app.title_text.get(),
-        "font_family": app.font_family.get(),
-        "title_style": app.title_style.get(),
-        "image_shape": app.image_shape.get(),
-        "logo_size": app.logo_size.get(),
-        "logo_x": app.logo_x.get(),
-        "logo_y": app.logo_y.get(),
-        "emoji_size": app.emoji_size.get(),
-        "emoji_x_offset": app.emoji_x_offset.get(),
-        "emoji_y_offset": app.emoji_y_offset.get(),
-    }
+    group_settings = make_group(paths, app.get_current_settings())
 
     app.batch_groups.append(group_settings)
     update_batch_treeview(app)
@@ -218,66 +233,245 @@ def update_batch_treeview(app):
 
     # Forzar la actualización de la UI para asegurar que los cambios se muestren
     app.batch_tree.update_idletasks()
+    schedule_visible_thumbnails(app)
 
 
-def start_batch_processing(app):
-    """Inicia el procesamiento de todos los grupos."""
+def _on_batch_scroll(app, scrollbar, first, last):
+    scrollbar.set(first, last)
+    schedule_visible_thumbnails(app)
+
+
+def schedule_visible_thumbnails(app):
+    """Pide las miniaturas de las filas visibles (agrupa varios eventos de scroll en uno)."""
+    if not hasattr(app, 'batch_thumbs') or app._thumbs_pending:
+        return
+    app._thumbs_pending = True
+    app.root.after(50, lambda: _request_visible_thumbnails(app))
+
+
+def _visible_rows(tree):
+    """Índices de las filas que se ven ahora en el Treeview."""
+    # La primera fila visible queda justo debajo de los encabezados
+    iid = ""
+    for y in range(0, THUMB_SIZE[1], 8):
+        iid = tree.identify_row(y)
+        if iid:
+            break
+    rows = []
+    while iid and tree.bbox(iid):
+        rows.append(int(iid))
+        iid = tree.next(iid)
+    return rows
+
+
+def _thumbnail_worker(app):
+    """Crea (o recrea si cambió el fondo, logo o paquete de emojis) el worker de miniaturas."""
+    assets_key = (app.bg_img_path, app.logo_img_path, app.emoji_pack.get())
+    if app.thumb_worker is None or app.thumb_assets_key != assets_key:
+        if app.thumb_worker is not None:
+            app.thumb_worker.stop()
+        assets = {"bg_img": app.bg_img, "logo_img": app.logo_img, "emojis": list(app.current_emojis)}
+        renderer = ThumbnailRenderer(assets, app.get_current_settings())
+        app.thumb_worker = ThumbnailWorker(
+            renderer,
+            lambda index, key, thumb: app.root.after(0, lambda: _apply_thumbnail(app, index, key, thumb)),
+            app.scheduler
+        )
+        app.thumb_assets_key = assets_key
+    return app.thumb_worker
+
+
+def _request_visible_thumbnails(app):
+    app._thumbs_pending = False
+    if not app.batch_groups:
+        return
+    worker = _thumbnail_worker(app)
+    settings = app.get_current_settings()
+    for index in _visible_rows(app.batch_tree):
+        if index >= len(app.batch_groups):
+            continue
+        key = thumbnail_key(app.batch_groups[index], settings)
+        cached = app.batch_thumbs.get(index)
+        if cached and cached[0] == key:
+            app.batch_tree.item(str(index), image=cached[1])
+        else:
+            worker.request(index, app.batch_groups[index])
+
+
+def _apply_thumbnail(app, index, key, thumb):
+    """Muestra una miniatura terminada (se ejecuta en el hilo de la UI)."""
+    photo = ImageTk.PhotoImage(thumb)
+    app.batch_thumbs[index] = (key, photo)
+    if app.batch_tree.exists(str(index)):
+        app.batch_tree.item(str(index), image=photo)
+
+
+def start_batch_processing(app, resume=False, archive=False):
+    """Inicia (o reanuda) el procesamiento de todos los grupos."""
     if not app.batch_groups:
         messagebox.showwarning("Sin Grupos", "No hay grupos de imágenes para procesar.")
         return
+    if app.batch_running:
+        messagebox.showwarning("Lote en Curso", "Ya hay un lote en marcha; espera a que termine.")
+        return
+
+    archive_path = None
+    output_dir = None
+    if archive:
+        archive_path = filedialog.asksaveasfilename(
+            title="Guardar el lote como archivo",
+            defaultextension=".zip",
+            filetypes=[("ZIP", "*.zip"), ("TAR", "*.tar"), ("TAR comprimido", "*.tar.gz")],
+            initialfile="plantillas_lote.zip"
+        )
+        if not archive_path:
+            return
+    elif resume:
+        output_dir = filedialog.askdirectory(title="Selecciona la carpeta del lote a reanudar")
+        if not output_dir:
+            return
+        manifest = BatchManifest.load(output_dir)
+        if manifest is None:
+            messagebox.showwarning("Sin Lote Previo", "La carpeta no contiene un lote para reanudar.")
+            return
+        if manifest.total != len(app.batch_groups):
+            if not messagebox.askyesno(
+                "Lote Diferente",
+                f"El lote guardado tenía {manifest.total} grupos y ahora hay {len(app.batch_groups)}.\n"
+                "Los grupos modificados se volverán a generar. ¿Continuar?"
+            ):
+                return
+    else:
+        output_dir = filedialog.askdirectory(title="Selecciona la carpeta de destino para las imágenes generadas")
+        if not output_dir:
+            return
+
+    app.save_settings() 
+
+    # Verificación previa: detectar archivos faltantes o dañados antes de empezar
+    report = preflight_batch(app.batch_groups, app.get_current_settings())
+    skip = set(report["bad_groups"])
+    if skip or report["shared_problems"]:
+        proceed = messagebox.askyesno(
+            "Verificación del Lote",
+            f"{format_report(report)}\n\nLos grupos con problemas se omitirán. ¿Continuar?"
+        )
+        if not proceed:
+            return
+
+    # El lote corre en segundo plano con la prioridad más baja del planificador:
+    # la vista previa sigue respondiendo mientras tanto
+    assets = {"bg_img": app.bg_img, "logo_img": app.logo_img, "emojis": list(app.current_emojis)}
+    groups = [dict(group) for group in app.batch_groups]
+    defaults = app.get_current_settings()
+    app.batch_running = True
+    app.batch_status.config(text=f"⏳ Lote: 0/{len(groups)}", style='Info.TLabel')
+
+    def on_progress(done, total):
+        app.root.after(0, lambda: app.batch_status.config(text=f"⏳ Lote: {done}/{total}"))
+
+    def work():
+        try:
+            generated, failed = run_batch(groups, assets, output_dir, defaults=defaults, skip=skip,
+                                          resume=resume, archive_path=archive_path,
+                                          on_progress=on_progress, scheduler=app.scheduler)
+            app.root.after(0, lambda: _batch_finished(app, generated, failed))
+        except Exception as e:
+            app.root.after(0, lambda e=e: _batch_finished(app, error=e))
+
+    threading.Thread(target=work, name="batch", daemon=True).start()
+
+
+def _batch_finished(app, generated=(), failed=(), error=None):
+    """Informa del resultado del lote (se ejecuta en el hilo de la UI)."""
+    app.batch_running = False
+    if error is not None:
+        app.batch_status.config(text="✗ Lote interrumpido", style='Info.TLabel')
+        messagebox.showerror("Error en Lote", f"Ocurrió un error durante el procesamiento por lotes:\n{str(error)}")
+    elif failed:
+        app.batch_status.config(text=f"✓ {len(generated)} generadas, {len(failed)} fallaron", style='Info.TLabel')
+        details = "\n".join(f"Grupo {i + 1}: {message}" for i, message in failed[:10])
+        messagebox.showwarning("Procesamiento de Lotes Completado",
+                               f"Se generaron {len(generated)} imágenes; {len(failed)} grupos fallaron:\n{details}")
+    else:
+        app.batch_status.config(text=f"✓ {len(generated)} generadas", style='Success.TLabel')
+        messagebox.showinfo("Procesamiento de Lotes Completado",
+                            "Todas las imágenes del lote han sido generadas y guardadas.")
+
+
+def _ask_watch_options(app):
+    """Diálogo para elegir la regla de agrupación de la carpeta vigilada."""
+    dialog = tk.Toplevel(app.root)
+    dialog.title("Carpeta vigilada")
+    dialog.transient(app.root)
+    dialog.grab_set()
+
+    labels = {name: key for key, name in WATCH_RULES.items()}
+    rule_var = tk.StringVar(value=WATCH_RULES['llegada'])
+    size_var = tk.IntVar(value=app.n_slots)
+    pattern_var = tk.StringVar(value=WATCH_DEFAULT_PATTERN)
+    result = {}
+
+    frame = ttk.Frame(dialog, padding=10)
+    frame.pack(fill=tk.BOTH, expand=True)
+    ttk.Label(frame, text="Regla de agrupación:").grid(row=0, column=0, sticky=tk.W)
+    ttk.Combobox(frame, textvariable=rule_var, values=list(labels), state="readonly").grid(row=0, column=1, sticky="ew", pady=2)
+    ttk.Label(frame, text="Imágenes por grupo:").grid(row=1, column=0, sticky=tk.W)
+    ttk.Spinbox(frame, from_=2, to=4, textvariable=size_var, width=5, state="readonly").grid(row=1, column=1, sticky=tk.W, pady=2)
+    ttk.Label(frame, text="Patrón (regex):").grid(row=2, column=0, sticky=tk.W)
+    ttk.Entry(frame, textvariable=pattern_var).grid(row=2, column=1, sticky="ew", pady=2)
+    frame.columnconfigure(1, weight=1)
+
+    def accept():
+        result.update(rule=labels[rule_var.get()], group_size=size_var.get(), pattern=pattern_var.get())
+        dialog.destroy()
+
+    ttk.Button(frame, text="Aceptar", command=accept).grid(row=3, column=0, columnspan=2, sticky="ew", pady=(10, 0))
+    dialog.wait_window()
+    return result
+
+
+def toggle_watch_folder(app):
+    """Inicia o detiene la vigilancia de una carpeta de imágenes."""
+    if app.watcher is not None:
+        app.watcher.stop()
+        app.watcher = None
+        app.watch_button.config(text="📂 Vigilar Carpeta")
+        app.watch_status.config(text="Vigilancia detenida", style='Info.TLabel')
+        return
 
+    folder = filedialog.askdirectory(title="Selecciona la carpeta a vigilar")
+    if not folder:
+        return
     output_dir = filedialog.askdirectory(title="Selecciona la carpeta de destino para las imágenes generadas")
     if not output_dir:
         return
+    if os.path.abspath(folder) == os.path.abspath(output_dir):
+        messagebox.showwarning("Carpetas Iguales", "La carpeta de destino debe ser distinta de la carpeta vigilada.")
+        return
 
-    app.save_settings() 
+    options = _ask_watch_options(app)
+    if not options:
+        return
 
-    try:
-        # Generar un timestamp único para este lote
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-
-        for i, group in enumerate(app.batch_groups):
-            num_images_in_group = group["count"]
-            image_paths = group["paths"]
-            
-            # Cargar imágenes para el grupo actual en una lista local
-            current_slots = [None] * num_images_in_group
-            for slot_idx in range(num_images_in_group):
-                try:
-                    current_slots[slot_idx] = Image.open(image_paths[slot_idx]).convert("RGBA")
-                except Exception as e:
-                    print(f"Error al cargar imagen del lote {image_paths[slot_idx]}: {e}")
-            
-            # Usar la configuración específica del grupo
-            generated_image = compose_template(
-                FINAL_SIZE, app.bg_img, 
-                [s for s in current_slots if s is not None],
-                app.current_emojis[:num_images_in_group],
-                group.get("title_text", app.title_text.get()), 
-                app.logo_img,
-                font_family=group.get("font_family", app.font_family.get()),
-                title_style=group.get("title_style", app.title_style.get()),
-                image_shape=group.get("image_shape", app.image_shape.get()),
-                logo_size=group.get("logo_size", app.logo_size.get()),
-                logo_x=group.get("logo_x", app.logo_x.get()),
-                logo_y=group.get("logo_y", app.logo_y.get()),
-                num_slots=num_images_in_group,
-                emoji_size=group.get("emoji_size", app.emoji_size.get()),
-                emoji_x_offset=group.get("emoji_x_offset", app.emoji_x_offset.get()),
-                emoji_y_offset=group.get("emoji_y_offset", app.emoji_y_offset.get())
-            )
-            
-            output_filename = os.path.join(output_dir, f"plantilla_lote_{timestamp}_{i+1}.png")
-            generated_image.save(output_filename, quality=95)
-        
-        messagebox.showinfo("Procesamiento de Lotes Completado", 
-                            "Todas las imágenes del lote han sido generadas y guardadas.")
+    assets = {"bg_img": app.bg_img, "logo_img": app.logo_img, "emojis": list(app.current_emojis)}
+    rendered = [0]
+
+    def on_done(output_path, group):
+        rendered[0] += 1
+        # La vigilancia corre en otro hilo: actualizar la UI desde el hilo principal
+        app.root.after(0, lambda n=rendered[0], name=os.path.basename(output_path):
+                       app.watch_status.config(text=f"✓ {n} generadas (última: {name})", style='Success.TLabel'))
 
+    try:
+        app.watcher = HotFolderWatcher(
+            folder, make_watch_handler(app.get_current_settings(), assets, output_dir, on_done),
+            **options
+        )
     except Exception as e:
-        messagebox.showerror("Error en Lote", f"Ocurrió un error durante el procesamiento por lotes:\n{str(e)}")
-    finally:
-        # Restaura la UI principal a su estado visual
-        if hasattr(app, '_update_slot_visibility'):
-            app._update_slot_visibility()
-        if hasattr(app, 'render_preview'):
-            app.render_preview()
\ No newline at end of file
+        messagebox.showerror("Error", f"No se pudo iniciar la vigilancia:\n{str(e)}")
+        return
+
+    app.watcher.start()
+    app.watch_button.config(text="⏹️ Detener Vigilancia")
+    app.watch_status.config(text=f"Vigilando: {os.path.basename(folder)}", style='Success.TLabel')
@@ -31,4 +31,5 @@ def create_center_panel(parent, app):
     btn_frame.pack(pady=10)
     
     ttk.Button(btn_frame, text="💾 Guardar Plantilla", command=app.generate_and_save).pack(side=tk.LEFT, padx=5)
+    ttk.Button(btn_frame, text="🎞️ Guardar Animación", command=app.generate_animation).pack(side=tk.LEFT, padx=5)
     ttk.Button(btn_frame, text="🔄 Actualizar Vista", command=app.render_preview).pack(side=tk.LEFT, padx=5)
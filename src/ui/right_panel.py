@@ -88,6 +88,9 @@ def create_right_panel(parent, app):
     ttk.Separator(parent).pack(fill=tk.X, pady=15)
     
     ttk.Button(parent, text="🗑️ Limpiar Todo", command=app.clear_all).pack(fill=tk.X, pady=5)
+    ttk.Button(parent, text="📊 Memoria", command=app.show_memory_report).pack(fill=tk.X, pady=5)
+    app.profile_button = ttk.Button(parent, text="⏱️ Perfilar", command=app.toggle_profiler)
+    app.profile_button.pack(fill=tk.X, pady=5)
     
     if HAS_TKDND:
         ttk.Label(parent, text="✅ Drag & Drop activado", foreground="green").pack(pady=10)
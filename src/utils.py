@@ -5,9 +5,71 @@ Funciones auxiliares para procesamiento de imágenes
 
 import os
 import sys
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps
-from PIL import Image, ImageDraw, ImageFont, ImageFilter, ImageOps
-from src.config import FONT_FILENAMES, FONT_SCALING_FACTORS
+from src.config import (
+    FONT_FILENAMES, FONT_SCALING_FACTORS, EMOJIS_DIR, COVER_BAND_ROWS, TITLE_LINE_SPACING,
+    EMOJI_FONT_FILENAMES, EMOJI_STRIKE_SIZES
+)
+from src.disk_cache import cached_image, tag_source
+from src.metrics import METRICS
+from src.bundles import load_emoji_bundle, load_asset_bundle
+
+
+class LRUCache:
+    """
+    Caché LRU con cerrojo: los valores se calculan fuera del cerrojo.
+    Con 'name', sus aciertos y fallos se cuentan en las métricas.
+    """
+
+    def __init__(self, max_items, name=None):
+        self.max_items = max_items
+        self.name = name
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+        if self.name:
+            METRICS.inc("cache_requests_total", cache=self.name, result="miss" if value is None else "hit")
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        return value if value is not None else self.put(key, compute())
+
+    def values(self):
+        """Copia de los valores guardados (para medir memoria)."""
+        with self._lock:
+            return list(self._items.values())
+
+    def items(self):
+        with self._lock:
+            return list(self._items.items())
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+SHADOW_TILES = LRUCache(32, "shadows")         # Sombras de slots por tamaño (ver make_shadow)
 
 
 def resource_path(relative):
@@ -19,24 +81,20 @@ def resource_path(relative):
     return os.path.join(base, relative)
 
 
+@lru_cache(maxsize=64)
 def load_font(font_family='arial_bold', size=72, scale_factor=1.0):
-    """Carga una fuente buscando en los directorios del sistema."""
+    """
+    Carga una fuente buscando en los directorios del sistema.
+    El resultado se guarda en caché: la búsqueda en disco solo ocurre una vez
+    por combinación de familia y tamaño.
+    """
     
     # Obtener nombres de archivo candidatos para la familia de fuentes
     font_filenames = FONT_FILENAMES.get(font_family, FONT_FILENAMES['arial_bold'])
     scaled_size = int(size * scale_factor)
-    
-    # Obtener directorios de fuentes del sistema
-    font_dirs = []
-    if sys.platform == "win32":
-        font_dirs.append(os.path.join(os.environ.get("SystemRoot", "C:\\Windows"), "Fonts"))
-    elif sys.platform == "linux":
-        font_dirs.extend(['/usr/share/fonts', '/usr/local/share/fonts', os.path.expanduser('~/.fonts')])
-    elif sys.platform == "darwin":
-        font_dirs.extend(['/System/Library/Fonts', '/Library/Fonts', os.path.expanduser('~/Library/Fonts')])
 
     # Buscar la fuente en los directorios del sistema
-    for font_dir in font_dirs:
+    for font_dir in font_dirs():
         for filename in font_filenames:
             font_path = os.path.join(font_dir, filename)
             try:
@@ -49,63 +107,321 @@ def load_font(font_family='arial_bold', size=72, scale_factor=1.0):
     return ImageFont.load_default(size)
 
 
+# Con False se ignoran las fuentes del sistema y solo se usa la incluida en
+# Pillow (pruebas doradas, ver golden.bundled_fonts)
+_system_fonts = True
+
+
+def set_system_fonts(enabled):
+    """Activa o desactiva las fuentes del sistema y vacía las cachés de fuentes."""
+    global _system_fonts
+    _system_fonts = enabled
+    load_font.cache_clear()
+    load_emoji_font.cache_clear()
+    title_mask.cache_clear()
+
+
+def font_dirs():
+    """Directorios de fuentes del sistema."""
+    if not _system_fonts:
+        return []
+    if sys.platform == "win32":
+        return [os.path.join(os.environ.get("SystemRoot", "C:\\Windows"), "Fonts")]
+    if sys.platform == "linux":
+        return ['/usr/share/fonts', '/usr/local/share/fonts', os.path.expanduser('~/.fonts')]
+    if sys.platform == "darwin":
+        return ['/System/Library/Fonts', '/Library/Fonts', os.path.expanduser('~/Library/Fonts')]
+    return []
+
+
+@lru_cache(maxsize=1)
+def load_emoji_font():
+    """
+    Fuente de emojis en color del sistema (también en subcarpetas), o None.
+
+    Las fuentes de mapas de bits solo se pueden abrir en sus tamaños fijos:
+    se prueba cada uno de EMOJI_STRIKE_SIZES y los emojis se escalan después.
+    """
+    wanted = set(EMOJI_FONT_FILENAMES)
+    for font_dir in font_dirs():
+        for folder, _, filenames in os.walk(font_dir):
+            for filename in wanted.intersection(filenames):
+                for size in EMOJI_STRIKE_SIZES:
+                    try:
+                        return ImageFont.truetype(os.path.join(folder, filename), size)
+                    except OSError:
+                        continue
+    return None
+
+
+# Tablas tomadas de Unicode Emoji 15.1 (emoji-data.txt, propiedades Emoji y
+# Emoji_Presentation). Bloques que solo tienen emojis, más el ZWJ, el selector
+# de variación, la tecla de los emojis de número (1️⃣) y las etiquetas de banderas
+EMOJI_RANGES = ((0x1F000, 0x1FAFF), (0x200D, 0x200D), (0xFE0F, 0xFE0F), (0x20E3, 0x20E3),
+                (0xE0020, 0xE007F))
+# Emoji sin Emoji_Presentation fuera de esos bloques (©, ‼, flechas, técnicos,
+# formas, varios, dingbats, CJK): solo se dibujan como emoji con el selector
+# U+FE0F (©️, ↔️, ❤️). El resto de esos bloques (→, ⌘, ✓) no está en la fuente de emojis
+TEXT_EMOJI_SYMBOLS = ((0x00A9, 0x00A9), (0x00AE, 0x00AE), (0x203C, 0x203C), (0x2049, 0x2049),
+                      (0x2122, 0x2122), (0x2139, 0x2139), (0x2194, 0x2199), (0x21A9, 0x21AA),
+                      (0x2328, 0x2328), (0x23CF, 0x23CF), (0x23ED, 0x23EF), (0x23F1, 0x23F2),
+                      (0x23F8, 0x23FA), (0x24C2, 0x24C2), (0x25AA, 0x25AB), (0x25B6, 0x25B6),
+                      (0x25C0, 0x25C0), (0x25FB, 0x25FC), (0x2600, 0x2604), (0x260E, 0x260E),
+                      (0x2611, 0x2611), (0x2618, 0x2618), (0x261D, 0x261D), (0x2620, 0x2620),
+                      (0x2622, 0x2623), (0x2626, 0x2626), (0x262A, 0x262A), (0x262E, 0x262F),
+                      (0x2638, 0x263A), (0x2640, 0x2640), (0x2642, 0x2642), (0x265F, 0x2660),
+                      (0x2663, 0x2663), (0x2665, 0x2666), (0x2668, 0x2668), (0x267B, 0x267B),
+                      (0x267E, 0x267E), (0x2692, 0x2692), (0x2694, 0x2697), (0x2699, 0x2699),
+                      (0x269B, 0x269C), (0x26A0, 0x26A0), (0x26A7, 0x26A7), (0x26B0, 0x26B1),
+                      (0x26C8, 0x26C8), (0x26CF, 0x26CF), (0x26D1, 0x26D1), (0x26D3, 0x26D3),
+                      (0x26E9, 0x26E9), (0x26F0, 0x26F1), (0x26F4, 0x26F4), (0x26F7, 0x26F9),
+                      (0x2702, 0x2702), (0x2708, 0x2709), (0x270C, 0x270D), (0x270F, 0x270F),
+                      (0x2712, 0x2712), (0x2714, 0x2714), (0x2716, 0x2716), (0x271D, 0x271D),
+                      (0x2721, 0x2721), (0x2733, 0x2734), (0x2744, 0x2744), (0x2747, 0x2747),
+                      (0x2763, 0x2764), (0x27A1, 0x27A1), (0x2934, 0x2935), (0x2B05, 0x2B07),
+                      (0x3030, 0x3030), (0x303D, 0x303D), (0x3297, 0x3297), (0x3299, 0x3299))
+# Los que se ven como emoji por defecto, sin selector (Emoji_Presentation)
+EMOJI_PRESENTATION = ((0x231A, 0x231B), (0x23E9, 0x23EC), (0x23F0, 0x23F0), (0x23F3, 0x23F3),
+                      (0x25FD, 0x25FE), (0x2614, 0x2615), (0x2648, 0x2653), (0x267F, 0x267F),
+                      (0x2693, 0x2693), (0x26A1, 0x26A1), (0x26AA, 0x26AB), (0x26BD, 0x26BE),
+                      (0x26C4, 0x26C5), (0x26CE, 0x26CE), (0x26D4, 0x26D4), (0x26EA, 0x26EA),
+                      (0x26F2, 0x26F3), (0x26F5, 0x26F5), (0x26FA, 0x26FA), (0x26FD, 0x26FD),
+                      (0x2705, 0x2705), (0x270A, 0x270B), (0x2728, 0x2728), (0x274C, 0x274C),
+                      (0x274E, 0x274E), (0x2753, 0x2755), (0x2757, 0x2757), (0x2795, 0x2797),
+                      (0x27B0, 0x27B0), (0x27BF, 0x27BF), (0x2B1B, 0x2B1C), (0x2B50, 0x2B50),
+                      (0x2B55, 0x2B55))
+
+
+def _in_ranges(char, ranges):
+    return any(low <= ord(char) <= high for low, high in ranges)
+
+
+def _emoji_flags(text):
+    """Para cada carácter, True si forma parte de un emoji."""
+    flags = []
+    for i, char in enumerate(text):
+        if _in_ranges(char, EMOJI_RANGES) or _in_ranges(char, EMOJI_PRESENTATION):
+            flags.append(True)
+        elif _in_ranges(char, TEXT_EMOJI_SYMBOLS):
+            flags.append(text[i + 1:i + 2] == "\ufe0f")
+        else:
+            flags.append(False)
+    return flags
+
+
+def is_emoji_text(text):
+    """
+    True si el texto es solo emojis (y espacios): la fuente de emojis no
+    tiene letras ni los símbolos de texto, así que un texto mixto se dibuja
+    con la fuente normal.
+    """
+    text = text.strip()
+    flags = _emoji_flags(text)
+    if not any(flags):
+        return False
+    keycap = "\u20e3" in text
+    return all(flag or char.isspace() or (keycap and char in "0123456789#*")
+               for char, flag in zip(text, flags))
+
+
+def open_image(path, lazy=False):
+    """
+    Abre una imagen en RGBA marcada con la huella de su archivo (para la caché en disco).
+    Con lazy=True solo se lee la cabecera: la imagen se decodifica al usarse y,
+    si el resultado ya está en la caché en disco, no se decodifica nunca.
+    """
+    if lazy:
+        return tag_source(Image.open(path), path)
+    return tag_source(Image.open(path).convert("RGBA"), path)
+
+
+def open_asset(path):
+    """Abre un fondo o logo, desde su versión precompilada si está al día."""
+    return load_asset_bundle(path) or open_image(path)
+
+
+def load_emoji_pack(pack_name):
+    """
+    Carga las imágenes PNG de un paquete de emojis, ordenadas por nombre.
+    Si el paquete está precompilado (ver bundles.py) no se decodifica nada.
+    """
+    bundled = load_emoji_bundle(pack_name)
+    if bundled is not None:
+        return bundled
+
+    emojis_path = os.path.join(EMOJIS_DIR, pack_name)
+    emojis = []
+
+    if not os.path.exists(emojis_path):
+        print(f"Advertencia: No se encontró el paquete de emojis '{pack_name}'")
+        return emojis
+
+    emoji_files = sorted([f for f in os.listdir(emojis_path) if f.endswith(".png")])
+
+    for filename in emoji_files:
+        try:
+            path = os.path.join(emojis_path, filename)
+            emojis.append(open_image(path))
+        except Exception as e:
+            print(f"Error al cargar emoji {filename} del paquete {pack_name}: {e}")
+    return emojis
+
+
+def cover_resize(fondo_img, size):
+    """Escala y recorta una imagen para cubrir exactamente 'size' (modo 'cover')."""
+    W, H = size
+    if fondo_img.size == (W, H) and fondo_img.mode == "RGBA":
+        # Ya está escalada (p. ej. precalculada por el servicio de render)
+        return fondo_img
+    return cached_image(fondo_img, "fondo", (W, H), lambda: _cover_resize(fondo_img, (W, H)))
+
+
+def _cover_resize(fondo_img, size):
+    W, H = size
+    source = cover_source(fondo_img)
+    out = Image.new("RGBA", (W, H))
+    for y0 in range(0, H, COVER_BAND_ROWS):
+        out.paste(cover_band(source, size, y0, min(H, y0 + COVER_BAND_ROWS)), (0, y0))
+    return out
+
+
+def cover_source(fondo_img):
+    """Fondo en RGBA premultiplicado, listo para cover_band (la conversión se hace una sola vez)."""
+    f = fondo_img if fondo_img.mode == "RGBA" else fondo_img.convert("RGBA")
+    return f.convert("RGBa")
+
+
+def cover_band(source, size, y0, y1):
+    """
+    Filas y0..y1 del fondo escalado en modo 'cover' a 'size'.
+
+    El fondo siempre se calcula por franjas de COVER_BAND_ROWS filas: así el
+    render por franjas (tiled.py) coincide píxel a píxel con el completo, y
+    nunca se crea la imagen intermedia más grande que el lienzo.
+    """
+    W, H = size
+    fw, fh = source.size
+
+    # Escalar para cubrir completamente, centrado
+    scale = max(W/fw, H/fh)
+    sw, sh = int(fw*scale), int(fh*scale)
+    fx, fy = (sw - W) // 2, (sh - H) // 2
+    sx, sy = fw / sw, fh / sh
+    box = (fx * sx, (fy + y0) * sy, (fx + W) * sx, (fy + y1) * sy)
+    return source.resize((W, y1 - y0), Image.LANCZOS, box=box).convert("RGBA")
+
+
 def apply_cover_background(base, fondo_img):
     """Aplica una imagen de fondo tipo 'cover'"""
     if not fondo_img:
         return base
     
-    W, H = base.size
-    f = fondo_img.convert("RGBA")
-    fw, fh = f.size
-    
-    # Escalar para cubrir completamente
-    scale = max(W/fw, H/fh)
-    f = f.resize((int(fw*scale), int(fh*scale)), Image.LANCZOS)
-    
-    # Centrar y recortar
-    fx = (f.width - W) // 2
-    fy = (f.height - H) // 2
-    sub = f.crop((fx, fy, fx + W, fy + H))
-    
+    sub = cover_resize(fondo_img, base.size)
     base.paste(sub, (0, 0), sub)
     return base
 
 
-def draw_text_with_style(draw, text, position, font, color, style, width, height):
-    """Dibuja texto con diferentes estilos"""
-    x, y = position
+def make_title_shadow(text, position, font, style, width, height, band=None):
+    """
+    Capa de la sombra difuminada del texto, del ancho del lienzo.
+
+    No depende del fondo, así que se puede calcular en paralelo y reutilizar
+    entre renders con el mismo texto. Con band=(y0, y1) devuelve solo esa
+    franja.
+    """
+    top, bottom = band or (0, height)
+    x, y = position[0], position[1] - top
+    offset = style.get('shadow_offset', 4)
+    blur = style.get('shadow_blur', 0)
+    # En una franja basta con la franja más el alcance del desenfoque
+    margin = 3 * (int(blur) + 2)
+    layer_top = max(0, top - margin)
+    layer_bottom = min(height, bottom + margin)
+    shadow_layer = Image.new('RGBA', (width, layer_bottom - layer_top), (0, 0, 0, 0))
+    shadow_draw = ImageDraw.Draw(shadow_layer)
+    shadow_draw.text((x + offset, y + top - layer_top + offset), text, 
+                   fill=(0, 0, 0, 180), font=font, **title_text_options(font))
+    shadow_layer = shadow_layer.filter(ImageFilter.GaussianBlur(blur))
+    if band:
+        shadow_layer = shadow_layer.crop((0, top - layer_top, width, bottom - layer_top))
+    return shadow_layer
+
+
+def title_text_options(font):
+    """Interlineado y alineación de un título partido en varias líneas (una sola línea no cambia)."""
+    return {"spacing": int(getattr(font, "size", 0) * TITLE_LINE_SPACING), "align": "center"}
+
+
+def title_bbox(text, font):
+    """Caja del título (una o varias líneas) respecto de su posición."""
+    if "\n" not in text:
+        return font.getbbox(text)
+    return ImageDraw.Draw(Image.new("L", (1, 1))).multiline_textbbox((0, 0), text, font=font,
+                                                                     **title_text_options(font))
+
+
+@lru_cache(maxsize=8)
+def title_mask(text, font):
+    """
+    Máscara 'L' del título recortada a su caja y la posición de la caja (ver title_bbox).
+    Se guarda en caché (las fuentes de load_font son siempre el mismo objeto):
+    el contorno la usa en cada render y en cada franja. No se debe modificar.
+    """
+    left, top, right, bottom = title_bbox(text, font)
+    # Con varias líneas centradas la caja puede no ser entera
+    left, top, right, bottom = math.floor(left), math.floor(top), math.ceil(right), math.ceil(bottom)
+    mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font, **title_text_options(font))
+    return mask, (left, top)
+
+
+def has_blurred_shadow(style):
+    return bool(style.get('shadow', False) and style.get('shadow_blur', 0) > 0)
+
+
+def draw_text_with_style(draw, text, position, font, color, style, width, height, band=None,
+                         shadow_layer=None):
+    """
+    Dibuja texto con diferentes estilos
+
+    Con band=(y0, y1) la imagen de draw es solo esa franja del lienzo (render
+    por franjas); position sigue en coordenadas del lienzo completo.
+    shadow_layer es la sombra difuminada ya calculada (ver make_title_shadow).
+    """
+    top, bottom = band or (0, height)
+    x, y = position[0], position[1] - top
+    options = title_text_options(font)
     
     # Sombra
     if style.get('shadow', False):
         offset = style.get('shadow_offset', 4)
-        blur = style.get('shadow_blur', 0)
         
-        if blur > 0:
-            # Crear capa temporal para sombra difuminada
-            shadow_layer = Image.new('RGBA', (width, height), (0, 0, 0, 0))
-            shadow_draw = ImageDraw.Draw(shadow_layer)
-            shadow_draw.text((x + offset, y + offset), text, 
-                           fill=(0, 0, 0, 180), font=font)
-            shadow_layer = shadow_layer.filter(ImageFilter.GaussianBlur(blur))
+        if has_blurred_shadow(style):
+            if shadow_layer is None:
+                shadow_layer = make_title_shadow(text, position, font, style, width, height, band)
             draw._image.paste(shadow_layer, (0, 0), shadow_layer)
         else:
             draw.text((x + offset, y + offset), text, 
-                     fill=(0, 0, 0, 180), font=font)
+                     fill=(0, 0, 0, 180), font=font, **options)
     
     # Contorno
     if style.get('outline', False):
         outline_width = style.get('outline_width', 3)
         outline_color = style.get('outline_color', (0, 0, 0))
         
-        # Dibujar texto en todas las direcciones para simular contorno
+        # Estampar el texto en todas las direcciones para simular contorno:
+        # se rasteriza una sola vez y se pega con el color como máscara
+        # (mismos píxeles que dibujarlo en cada desplazamiento)
+        mask, (left, top) = title_mask(text, font)
+        if len(outline_color) == 3 and draw._image.mode == 'RGBA':
+            outline_color = tuple(outline_color) + (255,)
         for adj_x in range(-outline_width, outline_width + 1):
             for adj_y in range(-outline_width, outline_width + 1):
                 if adj_x != 0 or adj_y != 0:
-                    draw.text((x + adj_x, y + adj_y), text, 
-                            fill=outline_color, font=font)
+                    draw._image.paste(outline_color, (x + adj_x + left, y + adj_y + top), mask)
     
     # Texto principal
-    draw.text((x, y), text, fill=color, font=font)
+    draw.text((x, y), text, fill=color, font=font, **options)
 
 
 def create_rounded_rectangle_mask(size, radius=20):
@@ -118,6 +434,11 @@ def create_rounded_rectangle_mask(size, radius=20):
 
 def apply_shape_to_image(img, shape='square', size=300, radius=20):
     """Aplica diferentes formas a una imagen"""
+    return cached_image(img, "shape", (shape, size, radius),
+                        lambda: _apply_shape_to_image(img, shape, size, radius))
+
+
+def _apply_shape_to_image(img, shape, size, radius):
     # Usar ImageOps.pad para escalar y rellenar manteniendo el aspect ratio
     img = ImageOps.pad(img.convert("RGBA"), (size, size), color=(0, 0, 0, 0))
     
@@ -136,27 +457,40 @@ def apply_shape_to_image(img, shape='square', size=300, radius=20):
     return img
 
 
-def add_shadow_to_image(base, img, position, shadow_offset=15, shadow_blur=10):
-    """Añade sombra a una imagen"""
-    x, y = position
-    size = img.size[0]
-    
+def make_shadow(img, shadow_blur=10):
+    """
+    Sombra difuminada de una imagen (ver add_shadow_to_image).
+    Solo depende del tamaño: se calcula una vez por tamaño y se comparte, así
+    que no debe modificarse.
+    """
+    key = (img.size[0], img.mode == 'RGBA', shadow_blur)
+    return SHADOW_TILES.get_or_compute(key, lambda: _shadow_tile(*key))
+
+
+def _shadow_tile(size, rgba, shadow_blur):
     # Crear sombra
     shadow = Image.new("RGBA", (size + 40, size + 40), (0, 0, 0, 0))
     sdraw = ImageDraw.Draw(shadow)
     
     # Forma según la imagen
-    if img.mode == 'RGBA':
+    if rgba:
         # Detectar si es circular o cuadrada
         sdraw.rectangle((15, 15, size + 15, size + 15), fill=(0, 0, 0, 140))
     
-    shadow = shadow.filter(ImageFilter.GaussianBlur(shadow_blur))
+    return shadow.filter(ImageFilter.GaussianBlur(shadow_blur))
+
+
+def add_shadow_to_image(base, img, position, shadow_offset=15, shadow_blur=10, shadow=None):
+    """Añade sombra a una imagen (shadow: sombra ya calculada con make_shadow)"""
+    x, y = position
+    if shadow is None:
+        shadow = make_shadow(img, shadow_blur)
     
     # Pegar sombra
     base.paste(shadow, (x - 20 + shadow_offset, y + shadow_offset), shadow)
 
 
-def paste_with_shadow(base, img, position):
+def paste_with_shadow(base, img, position, shadow=None):
     """Pega una imagen con sombra automática"""
-    add_shadow_to_image(base, img, position)
-    base.paste(img, position, img)
\ No newline at end of file
+    add_shadow_to_image(base, img, position, shadow=shadow)
+    base.paste(img, position, img)
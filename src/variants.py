@@ -0,0 +1,148 @@
+"""
+variants.py
+Matriz de variantes: renderiza un mismo grupo con todas las combinaciones
+de estilos de título, formas y fuentes (u otros ajustes) para compararlas, y
+arma una hoja de contactos con todas ellas.
+
+Todas las variantes comparten un Renderer: las imágenes se decodifican una
+vez, el fondo, el logo y los emojis se escalan una vez y cada forma recorta
+los slots una sola vez.
+"""
+
+import os
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw
+from src.config import (
+    TITLE_STYLES, FONT_FILENAMES, IMAGE_SHAPES, DEFAULT_BG_COLOR, TITLE_COLOR,
+    VARIANT_WORKERS, VARIANT_SHEET_CELL
+)
+from src.batch import save_atomic
+from src.utils import load_font
+
+# Ejes por defecto: todas las combinaciones de estilo, forma y fuente
+VARIANT_AXES = {
+    "title_style": list(TITLE_STYLES),
+    "image_shape": list(IMAGE_SHAPES),
+    "font_family": list(FONT_FILENAMES),
+}
+SHEET_LABEL_HEIGHT = 28
+
+
+def variant_matrix(base_spec, axes=None):
+    """
+    Devuelve [(valores, TemplateSpec)] con todas las combinaciones de los ejes.
+
+    axes es un diccionario {campo de TemplateSpec: lista de valores}. Las
+    combinaciones se ordenan por forma para que las que comparten recortes
+    queden juntas.
+    """
+    axes = axes or VARIANT_AXES
+    names = list(axes)
+    if "image_shape" in names:
+        names.remove("image_shape")
+        names.insert(0, "image_shape")
+    variants = []
+    for combo in itertools.product(*(axes[name] for name in names)):
+        values = dict(zip(names, combo))
+        variants.append((values, base_spec.replace(**values)))
+    return variants
+
+
+def variant_name(index, values):
+    """Nombre de archivo de una variante: número y valores de cada eje."""
+    return f"variante_{index + 1:03d}_" + "_".join(str(v) for v in values.values()) + ".png"
+
+
+def render_variants(renderer, variants, slots, workers=VARIANT_WORKERS, on_variant=None):
+    """
+    Renderiza las variantes en paralelo con un Renderer compartido.
+
+    Primero se renderiza una variante de cada forma de a una, para que el
+    fondo, el logo, los emojis y los recortes se calculen una sola vez;
+    el resto solo pinta capas ya preparadas. on_variant(índice, valores,
+    imagen) se llama desde los hilos al terminar cada una.
+    """
+    def render(index):
+        values, spec = variants[index]
+        image = renderer.render(spec, slots, parallel=False)
+        if on_variant:
+            on_variant(index, values, image)
+
+    first_per_shape = {}
+    for index, (values, spec) in enumerate(variants):
+        first_per_shape.setdefault(spec.image_shape, index)
+    for index in first_per_shape.values():
+        render(index)
+
+    rest = [i for i in range(len(variants)) if i not in first_per_shape.values()]
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="variant") as pool:
+        # list() propaga la primera excepción de los hilos
+        list(pool.map(render, rest))
+
+
+def contact_sheet(cells, columns=None, cell_size=VARIANT_SHEET_CELL):
+    """
+    Hoja de contactos con una miniatura y su etiqueta por variante.
+
+    Args:
+        cells: Lista de (etiqueta, imagen)
+        columns: Columnas de la hoja (por defecto, las que la dejan más cuadrada)
+        cell_size: Lado de cada miniatura
+    """
+    if not cells:
+        raise ValueError("No hay variantes para la hoja de contactos")
+    columns = columns or max(1, round(len(cells) ** 0.5))
+    rows = (len(cells) + columns - 1) // columns
+    cell_h = cell_size + SHEET_LABEL_HEIGHT
+    sheet = Image.new("RGB", (columns * cell_size, rows * cell_h), DEFAULT_BG_COLOR)
+    draw = ImageDraw.Draw(sheet)
+    font = load_font('arial_bold', SHEET_LABEL_HEIGHT - 12)
+
+    for i, (label, image) in enumerate(cells):
+        x, y = (i % columns) * cell_size, (i // columns) * cell_h
+        thumb = image.copy()
+        thumb.thumbnail((cell_size, cell_size), Image.LANCZOS)
+        sheet.paste(thumb, (x + (cell_size - thumb.width) // 2, y + (cell_size - thumb.height) // 2))
+        bbox = draw.textbbox((0, 0), label, font=font)
+        draw.text((x + (cell_size - (bbox[2] - bbox[0])) // 2, y + cell_size + 4), label,
+                  fill=TITLE_COLOR, font=font)
+    return sheet
+
+
+def run_variants(renderer, base_spec, slots, output_dir, axes=None, workers=VARIANT_WORKERS,
+                 sheet=True, columns=None, on_progress=None):
+    """
+    Renderiza la matriz de variantes de un grupo en output_dir.
+
+    Cada variante se guarda en cuanto termina y de ella solo se conserva la
+    miniatura para la hoja de contactos (contactos.png).
+
+    Returns:
+        (rutas de las variantes en el orden de la matriz, ruta de la hoja o None)
+    """
+    variants = variant_matrix(base_spec, axes)
+    paths = [os.path.join(output_dir, variant_name(i, values)) for i, (values, _) in enumerate(variants)]
+    thumbs = [None] * len(variants)
+    done = [0]
+    lock = threading.Lock()
+
+    def on_variant(index, values, image):
+        save_atomic(image, paths[index])
+        if sheet:
+            thumb = image.copy()
+            thumb.thumbnail((VARIANT_SHEET_CELL, VARIANT_SHEET_CELL), Image.LANCZOS)
+            thumbs[index] = (" · ".join(str(v) for v in values.values()), thumb)
+        with lock:
+            done[0] += 1
+            if on_progress:
+                on_progress(done[0], len(variants))
+
+    render_variants(renderer, variants, slots, workers, on_variant)
+
+    sheet_path = None
+    if sheet:
+        sheet_path = os.path.join(output_dir, "contactos.png")
+        save_atomic(contact_sheet(thumbs, columns), sheet_path)
+    return paths, sheet_path
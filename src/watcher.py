@@ -0,0 +1,236 @@
+"""
+watcher.py
+Carpeta vigilada: agrupa las imágenes nuevas y las renderiza en cuanto
+cada grupo está completo.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from src.config import (
+    IMAGE_EXTENSIONS, BATCH_GROUP_SIZES, WATCH_DEFAULT_PATTERN, WATCH_INTERVAL,
+    WATCH_MTIME_GRANULARITY, WATCH_FULL_SCAN_EVERY
+)
+from src.batch import make_group, render_group
+from src.renderer import Renderer
+
+
+class HotFolderWatcher:
+    """
+    Vigila una carpeta y arma grupos de 2, 3 o 4 imágenes según una regla:
+
+    - 'llegada': agrupa los archivos en el orden en que aparecen.
+    - 'patron': agrupa por la clave capturada por una expresión regular
+      (grupo con nombre 'grupo' o el primer grupo capturado).
+    - 'manifiesto': cada archivo .json de la carpeta lista las imágenes de
+      un grupo ({"paths": [...]} más ajustes opcionales del grupo).
+
+    Solo se revisa el contenido del directorio cuando su fecha de
+    modificación cambia; los archivos ya vistos no se vuelven a consultar.
+    Como esa fecha puede tener poca resolución (FAT, SMB, NFS), también se
+    relee mientras la última lectura cae dentro de WATCH_MTIME_GRANULARITY
+    de ella, y cada WATCH_FULL_SCAN_EVERY revisiones en cualquier caso.
+    Un archivo nuevo se considera listo cuando su tamaño deja de cambiar
+    entre dos revisiones (evita leer PNG a medio copiar).
+    """
+
+    def __init__(self, folder, on_group, rule='llegada', group_size=3,
+                 pattern=WATCH_DEFAULT_PATTERN, interval=WATCH_INTERVAL):
+        if rule in ('llegada', 'patron') and group_size not in BATCH_GROUP_SIZES:
+            raise ValueError("El tamaño de grupo debe ser 2, 3 o 4.")
+        self.folder = folder
+        self.on_group = on_group
+        self.rule = rule
+        self.group_size = group_size
+        self.pattern = re.compile(pattern) if rule == 'patron' else None
+        self.interval = interval
+
+        self._dir_mtime = None
+        self._scanned_at = 0            # Hora (ns) de la última lectura del directorio
+        self._polls_since_scan = 0
+        self._seen = set()              # Nombres ya procesados (listos o ignorados)
+        self._pending = {}              # Nombre -> (tamaño, mtime) en espera de estabilizarse
+        self._ready = set()             # Imágenes listas (para la regla de manifiesto)
+        self._arrival = []              # Cola de la regla 'llegada'
+        self._buckets = OrderedDict()   # Clave -> rutas de la regla 'patron'
+        self._manifests = OrderedDict() # Nombre -> manifiesto a la espera de sus imágenes
+        self._stop = threading.Event()
+
+    # --- Detección de archivos ---
+
+    def _scan_directory(self):
+        """Registra como pendientes los archivos que aún no se han visto."""
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            return
+        self._polls_since_scan += 1
+        # Si la última lectura cayó en el mismo "tic" de la fecha, un archivo
+        # llegado después pudo no cambiarla: hay que volver a leer
+        settled = self._scanned_at - mtime > WATCH_MTIME_GRANULARITY * 1e9
+        if mtime == self._dir_mtime and settled and self._polls_since_scan < WATCH_FULL_SCAN_EVERY:
+            return
+        self._dir_mtime = mtime
+        self._scanned_at = time.time_ns()
+        self._polls_since_scan = 0
+
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                name = entry.name
+                if name in self._seen or name in self._pending or not entry.is_file():
+                    continue
+                if not self._is_candidate(name):
+                    self._seen.add(name)
+                    continue
+                self._pending[name] = None
+
+    def _is_candidate(self, name):
+        lower = name.lower()
+        if self.rule == 'manifiesto' and lower.endswith(".json"):
+            return True
+        return lower.endswith(IMAGE_EXTENSIONS)
+
+    def _settle_pending(self):
+        """Devuelve los archivos pendientes cuyo tamaño ya es estable."""
+        settled = []
+        for name, previous in list(self._pending.items()):
+            try:
+                st = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                del self._pending[name]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current == previous and st.st_size > 0:
+                del self._pending[name]
+                self._seen.add(name)
+                settled.append((st.st_mtime_ns, name))
+            else:
+                self._pending[name] = current
+        # Orden de llegada: primero por fecha de modificación, luego por nombre
+        return [name for _, name in sorted(settled)]
+
+    # --- Reglas de agrupación ---
+
+    def _feed(self, name):
+        path = os.path.join(self.folder, name)
+        if self.rule == 'llegada':
+            self._arrival.append(path)
+            while len(self._arrival) >= self.group_size:
+                group_paths = self._arrival[:self.group_size]
+                del self._arrival[:self.group_size]
+                yield group_paths, {}
+
+        elif self.rule == 'patron':
+            match = self.pattern.match(name)
+            if not match:
+                print(f"Carpeta vigilada: '{name}' no coincide con el patrón, se ignora.")
+                return
+            key = match.groupdict().get('grupo') or (match.group(1) if match.groups() else match.group(0))
+            bucket = self._buckets.setdefault(key, [])
+            bucket.append(path)
+            if len(bucket) == self.group_size:
+                del self._buckets[key]
+                yield bucket, {}
+
+        elif self.rule == 'manifiesto':
+            if name.lower().endswith(".json"):
+                manifest = self._read_manifest(path)
+                if manifest is not None:
+                    self._manifests[name] = manifest
+            else:
+                self._ready.add(path)
+            yield from self._complete_manifests()
+
+    def _read_manifest(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Carpeta vigilada: manifiesto inválido {path}: {e}")
+            return None
+        paths = [os.path.join(self.folder, p) for p in manifest.get("paths", [])]
+        if len(paths) not in BATCH_GROUP_SIZES:
+            print(f"Carpeta vigilada: el manifiesto {path} debe listar 2, 3 o 4 imágenes.")
+            return None
+        manifest["paths"] = paths
+        return manifest
+
+    def _complete_manifests(self):
+        for name, manifest in list(self._manifests.items()):
+            if all(p in self._ready for p in manifest["paths"]):
+                del self._manifests[name]
+                overrides = {k: v for k, v in manifest.items() if k != "paths"}
+                yield manifest["paths"], overrides
+
+    # --- Bucle principal ---
+
+    def poll(self):
+        """Revisa la carpeta una vez y entrega los grupos completos a on_group."""
+        self._scan_directory()
+        if not self._pending:
+            return 0
+        completed = 0
+        for name in self._settle_pending():
+            for paths, overrides in self._feed(name):
+                completed += 1
+                self.on_group(paths, overrides)
+        return completed
+
+    def run(self):
+        """Vigila la carpeta hasta que se llame a stop()."""
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error en la carpeta vigilada: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Lanza la vigilancia en un hilo en segundo plano."""
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def pending_count(self):
+        """Imágenes recibidas que todavía esperan completar su grupo."""
+        if self.rule == 'llegada':
+            return len(self._arrival)
+        if self.rule == 'patron':
+            return sum(len(b) for b in self._buckets.values())
+        return len(self._manifests)
+
+
+def make_watch_handler(settings, assets, output_dir, on_done=None):
+    """
+    Crea el callback on_group que renderiza cada grupo completo y lo guarda.
+
+    on_done(output_path, group) se llama tras guardar cada plantilla.
+    """
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    counter = [0]
+    renderer = assets if isinstance(assets, Renderer) else Renderer.from_assets(assets)
+
+    def on_group(paths, overrides):
+        group = make_group(paths, {**settings, **overrides})
+        counter[0] += 1
+        output_path = os.path.join(output_dir, f"plantilla_carpeta_{timestamp}_{counter[0]}.png")
+        while os.path.exists(output_path):
+            counter[0] += 1
+            output_path = os.path.join(output_dir, f"plantilla_carpeta_{timestamp}_{counter[0]}.png")
+        try:
+            image = render_group(group, renderer, settings)
+            image.save(output_path, quality=95)
+        except Exception as e:
+            print(f"Error al renderizar el grupo {paths}: {e}")
+            return
+        if on_done:
+            on_done(output_path, group)
+
+    return on_group
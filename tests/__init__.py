@@ -0,0 +1 @@
+# Marca 'tests' como paquete para que pytest importe 'src' desde la raíz
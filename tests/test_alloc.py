@@ -0,0 +1,48 @@
+"""
+test_alloc.py
+Un render repetido no debe crear imágenes ni memoria de más.
+
+Es la misma comprobación que 'python -m src.cli check alloc', con las
+imágenes sintéticas de las pruebas doradas (ver golden.fixture_images).
+"""
+
+import pytest
+
+from src import disk_cache
+from src.config import BATCH_GROUP_SIZES, CHECK_MAX_IMAGES_PER_RENDER, CHECK_MAX_RSS_GROWTH_MB
+from src.diagnostics import check_allocations
+from src.golden import fixture_images
+from src.renderer import Renderer, TemplateSpec
+from src.utils import open_image
+
+RENDERS = 8
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    # Los slots se guardan y se vuelven a abrir para que vengan de un archivo,
+    # como en un lote real (el Renderer solo cachea recortes de imágenes con origen)
+    images = fixture_images()
+    slots = []
+    for i, slot in enumerate(images["slots"]):
+        path = tmp_path / f"slot_{i}.png"
+        slot.save(path)
+        slots.append(open_image(str(path)))
+    disk_cache.set_disk_cache_enabled(False)
+    yield {**images, "slots": slots}
+    disk_cache.set_disk_cache_enabled(True)
+
+
+@pytest.mark.parametrize("count", BATCH_GROUP_SIZES)
+def test_repeated_render_allocations(fixtures, count):
+    renderer = Renderer(fixtures["bg_img"], fixtures["logo_img"], fixtures["emojis"])
+    spec = TemplateSpec(size=(540, 960))
+
+    results = check_allocations(renderer, spec, fixtures["slots"][:count], renders=RENDERS)
+
+    assert set(results) == {"render", "placeholders"}
+    for name, result in results.items():
+        assert result["images_per_render"] <= CHECK_MAX_IMAGES_PER_RENDER, name
+        if result["rss_growth_mb"] is not None:
+            assert result["rss_growth_mb"] <= CHECK_MAX_RSS_GROWTH_MB, name
+        assert result["problems"] == [], name